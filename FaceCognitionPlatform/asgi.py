@@ -2,6 +2,8 @@
 ASGI config for FaceCognitionPlatform project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; websockets on /recognition/ws/ go to the streaming
+recognition handler (recognition/streaming.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FaceCognitionPlatform.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup so the app registry is ready
+from recognition.streaming import STREAM_PATH, recognition_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        if scope['path'] == STREAM_PATH:
+            return await recognition_stream(scope, receive, send)
+        # Unknown socket path: refuse the handshake
+        await receive()
+        return await send({'type': 'websocket.close'})
+    return await django_application(scope, receive, send)
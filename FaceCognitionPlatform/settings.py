@@ -128,6 +128,85 @@ MEDIA_ROOT = BASE_DIR / 'media'
 FACE_ENCODINGS_DIR = MEDIA_ROOT / 'face_encodings'
 FACE_IMAGES_DIR = MEDIA_ROOT / 'faces'
 
+# Face detection resolution (detection cost scales with pixel count)
+# Frames are resized by the scale before detection; boxes are mapped back and
+# faces are encoded from the full-resolution frame. Cameras can override both.
+FACE_DETECTION_SCALE = float(os.environ.get('FACE_DETECTION_SCALE', 1.0))
+FACE_DETECTION_UPSAMPLE = int(os.environ.get('FACE_DETECTION_UPSAMPLE', 1))  # number_of_times_to_upsample
+# Same knobs for enrolment photos
+FACE_REGISTRATION_DETECTION_SCALE = 1.0
+FACE_REGISTRATION_UPSAMPLE = 1
+
+# Gallery search index
+# 'auto' = exact scan for small companies, IVF (partitioned) index from FACE_INDEX_IVF_MIN_SIZE up
+# 'exact' = always brute force, 'ivf' = always partitioned
+FACE_INDEX_BACKEND = os.environ.get('FACE_INDEX_BACKEND', 'auto')
+FACE_INDEX_IVF_MIN_SIZE = 20000
+# Partitions scanned per query: higher = better recall, slower search
+FACE_INDEX_IVF_NPROBE = int(os.environ.get('FACE_INDEX_IVF_NPROBE', 8))
+FACE_INDEX_IVF_NLISTS = None  # None = sqrt(gallery size)
+
+# Seconds between a worker's checks of a company's GalleryVersion stamp
+FACE_GALLERY_CHECK_INTERVAL = 1.0
+# Journaled changes a worker patches in place before falling back to a full company reload
+FACE_GALLERY_MAX_INCREMENTAL = 256
+
+# Face tracking across a stream's frames (recognition/tracking.py)
+FACE_TRACK_IOU_THRESHOLD = 0.3  # Box overlap needed to continue a track
+FACE_TRACK_REVERIFY_SECONDS = 3.0  # Identified tracks are re-encoded this often
+FACE_TRACK_MAX_MISSED = 2  # Frames a track survives without a detection
+
+# Static-scene gate before detection (recognition/motion.py)
+FACE_GATE_PIXEL_THRESHOLD = 20  # Grey-level change for a pixel to count as changed
+FACE_GATE_MIN_CHANGED = 0.01  # Share of changed pixels needed to run detection
+FACE_GATE_MAX_SKIP_SECONDS = 10.0  # A static scene is still re-checked this often
+
+# Most images + crops accepted by one batch recognition request
+FACE_BATCH_MAX_ITEMS = 32
+
+# Frames per second each camera is sampled at by `manage.py run_cameras`
+FACE_CAMERA_SAMPLE_FPS = float(os.environ.get('FACE_CAMERA_SAMPLE_FPS', 2.0))
+
+# Recognition executor: warm worker processes (dlib + galleries loaded) per web process.
+# Web concurrency (gunicorn workers) and ML concurrency are sized separately:
+# web workers x FACE_EXECUTOR_WORKERS should not exceed the cores.
+# 0 = run recognition inline in the request thread (dev, tests)
+FACE_EXECUTOR_WORKERS = int(os.environ.get('FACE_EXECUTOR_WORKERS', 0))
+# Jobs queued or running per web process before new ones are shed (503); None = 2 x workers
+FACE_EXECUTOR_MAX_PENDING = None
+# Seconds a request waits for its recognition job (504 after that)
+FACE_EXECUTOR_TIMEOUT = 10.0
+
+# Bulk enrolment (recognition/bulk_enrolment.py: manage.py bulk_enrol, admin upload)
+# Processes encoding faces, default one per core
+FACE_ENROLMENT_WORKERS = int(os.environ.get('FACE_ENROLMENT_WORKERS', os.cpu_count() or 1))
+# Employees inserted / faces saved per batch (an interrupted import loses at most one batch)
+FACE_ENROLMENT_BATCH_SIZE = 500
+# Admin uploads and their reports (keep it out of MEDIA_ROOT: the CSVs hold personal data)
+FACE_ENROLMENT_UPLOAD_DIR = Path(os.environ.get('FACE_ENROLMENT_UPLOAD_DIR', BASE_DIR / 'imports'))
+
+# Attendance write queue (attendance/writer.py): recognition doesn't wait on the database
+# False = write each punch in the recognizing thread (tests)
+ATTENDANCE_ASYNC_WRITES = os.environ.get('ATTENDANCE_ASYNC_WRITES', 'True') == 'True'
+ATTENDANCE_WRITE_BATCH_SIZE = 100  # Most punches per bulk insert
+ATTENDANCE_WRITE_INTERVAL = 0.5  # Seconds a punch waits for others to batch with
+# Punches are kept here while the database is unreachable (keep it on persistent storage)
+ATTENDANCE_SPOOL_PATH = Path(os.environ.get('ATTENDANCE_SPOOL_PATH', BASE_DIR / 'spool' / 'attendance_punches.jsonl'))
+# Rows fetched per database round trip when streaming CSV exports (attendance/exports.py)
+ATTENDANCE_EXPORT_CHUNK_SIZE = 2000
+
+# Cache (dashboard snapshots, see employees/dashboard.py)
+# File-based so every web/executor process on the host shares entries and invalidations;
+# point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached when running several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    }
+}
+# Seconds a dashboard snapshot may be served (writes invalidate it sooner)
+DASHBOARD_CACHE_TIMEOUT = 300
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
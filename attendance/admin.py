@@ -2,8 +2,11 @@
 Attendance Admin Configuration
 """
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
-from .models import AttendanceRecord, DailyAttendanceSummary
+from employees.dashboard import invalidate_dashboard
+from .models import AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary
+from .rollups import delete_daily_summaries
 
 @admin.register(AttendanceRecord)
 class AttendanceRecordAdmin(admin.ModelAdmin):
@@ -40,6 +43,18 @@ class AttendanceRecordAdmin(admin.ModelAdmin):
             obj.confidence_score
         )
     confidence_display.short_description = 'Confidence'
+    
+    # No delete signal on punches (it would turn off fast cascade deletes): invalidate here
+    def delete_model(self, request, obj):
+        company_id = obj.employee.company_id
+        super().delete_model(request, obj)
+        transaction.on_commit(lambda: invalidate_dashboard(company_id))
+    
+    def delete_queryset(self, request, queryset):
+        company_ids = set(queryset.order_by().values_list('employee__company_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        for company_id in company_ids:
+            transaction.on_commit(lambda company_id=company_id: invalidate_dashboard(company_id))
 
 @admin.register(DailyAttendanceSummary)
 class DailyAttendanceSummaryAdmin(admin.ModelAdmin):
@@ -71,4 +86,33 @@ class DailyAttendanceSummaryAdmin(admin.ModelAdmin):
             color = 'orange'
         
         return format_html('<span style="color: {};">{}</span>', color, status)
-    status_display.short_description = 'Status'
\ No newline at end of file
+    status_display.short_description = 'Status'
+    
+    # Deleted summaries take their months' rollups along (no delete signal, see attendance/signals.py)
+    def delete_model(self, request, obj):
+        delete_daily_summaries(DailyAttendanceSummary.objects.filter(pk=obj.pk))
+    
+    def delete_queryset(self, request, queryset):
+        delete_daily_summaries(queryset)
+
+@admin.register(MonthlyAttendanceSummary)
+class MonthlyAttendanceSummaryAdmin(admin.ModelAdmin):
+    """Read-only: rows follow the daily summaries (rebuild_monthly_summaries repairs them)"""
+    list_display = (
+        'employee',
+        'month',
+        'total_days',
+        'present_days',
+        'late_days',
+        'early_departures',
+        'total_hours'
+    )
+    list_filter = ('month',)
+    search_fields = ('employee__employee_id', 'employee__first_name', 'employee__last_name')
+    date_hierarchy = 'month'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
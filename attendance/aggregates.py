@@ -0,0 +1,63 @@
+"""
+Attendance Aggregates
+Every counter of a set of daily summaries in one aggregate() round trip
+(conditional counts), instead of one count() per counter.
+
+- summary_totals(): over a DailyAttendanceSummary queryset (one employee's
+  month, a department's week, ...). Absent = rows not marked present.
+- company_day_totals(): one company and day, driven by the active employees
+  (LEFT JOIN on that day's summary), so an employee with no summary row at
+  all counts as absent.
+- monthly_totals(): the same counters per employee and month, in one
+  GROUP BY (backfilling MonthlyAttendanceSummary).
+"""
+from decimal import Decimal
+from django.db.models import Count, DecimalField, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from employees.models import Employee
+
+
+def _counters(prefix=''):
+    """Conditional aggregates over summary rows (reached through `prefix`)"""
+    return {
+        'present': Count('pk', filter=Q(**{f'{prefix}is_present': True})),
+        'late': Count('pk', filter=Q(**{f'{prefix}is_late': True})),
+        'early_departures': Count('pk', filter=Q(**{f'{prefix}is_early_departure': True})),
+        'total_hours': Coalesce(
+            Sum(f'{prefix}total_hours'), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=9, decimal_places=2)
+        ),
+    }
+
+
+def summary_totals(summaries):
+    """
+    Counters of a DailyAttendanceSummary queryset:
+    {total, present, absent, late, early_departures, total_hours}
+    """
+    totals = summaries.aggregate(total=Count('pk'), **_counters())
+    totals['absent'] = totals['total'] - totals['present']
+    return totals
+
+
+def company_day_totals(company, day):
+    """
+    Counters of a company's active employees on one day:
+    {total, present, absent, late, early_departures, total_hours}
+    """
+    totals = Employee.objects.filter(company=company, status='active').annotate(
+        day_summary=FilteredRelation('daily_summaries', condition=Q(daily_summaries__date=day))
+    ).aggregate(total=Count('pk'), **_counters('day_summary__'))
+    totals['absent'] = totals['total'] - totals['present']
+    return totals
+
+
+def monthly_totals(summaries):
+    """
+    Counters of a DailyAttendanceSummary queryset per employee and month:
+    dicts of {employee_id, month, total, present, late, early_departures, total_hours}
+    """
+    return summaries.annotate(month=TruncMonth('date')).order_by().values(
+        'employee_id', 'month'
+    ).annotate(total=Count('pk'), **_counters())
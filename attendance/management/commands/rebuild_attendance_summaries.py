@@ -0,0 +1,64 @@
+"""
+Repair DailyAttendanceSummary rows by recomputing them from the punches.
+Summaries are normally maintained incrementally as punches are written
+(AttendanceService.apply_punches_to_summaries); run this after punches were
+edited or deleted by hand, or to backfill.
+"""
+from datetime import date
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from attendance.models import AttendanceRecord, DailyAttendanceSummary
+from attendance.rollups import delete_daily_summaries
+from attendance.services import AttendanceService
+from employees.models import Employee
+
+class Command(BaseCommand):
+    help = 'Recompute daily attendance summaries from the attendance records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Only this company (UUID)')
+        parser.add_argument('--employee', help='Only this employee (employee ID)')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last day (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        service = AttendanceService()
+        
+        employees = Employee.objects.all()
+        if options['company']:
+            employees = employees.filter(company_id=options['company'])
+        if options['employee']:
+            employees = employees.filter(employee_id=options['employee'])
+        
+        # Local days, matching how punches are assigned to summaries
+        punches = AttendanceRecord.objects.filter(employee__in=employees).annotate(
+            day=TruncDate('timestamp', tzinfo=timezone.get_current_timezone())
+        )
+        summaries = DailyAttendanceSummary.objects.filter(employee__in=employees)
+        if options['date_from']:
+            punches = punches.filter(day__gte=options['date_from'])
+            summaries = summaries.filter(date__gte=options['date_from'])
+        if options['date_to']:
+            punches = punches.filter(day__lte=options['date_to'])
+            summaries = summaries.filter(date__lte=options['date_to'])
+        
+        days = set(punches.order_by().values_list('employee_id', 'day').distinct())
+        employee_objects = Employee.objects.in_bulk({employee_id for employee_id, day in days})
+        
+        rebuilt = 0
+        for employee_id, day in sorted(days):
+            with transaction.atomic():
+                service.update_daily_summary(employee_objects[employee_id], day)
+            rebuilt += 1
+        
+        # Summaries whose punches are all gone
+        stale = [
+            summary.pk for summary in summaries.only('pk', 'employee_id', 'date')
+            if (summary.employee_id, summary.date) not in days
+        ]
+        # Their months' rollups are recomputed too
+        delete_daily_summaries(DailyAttendanceSummary.objects.filter(pk__in=stale))
+        
+        self.stdout.write(self.style.SUCCESS(f"Done. {rebuilt} summaries rebuilt, {len(stale)} without punches removed."))
@@ -0,0 +1,73 @@
+"""
+Backfill or repair MonthlyAttendanceSummary rows from the daily summaries.
+Rollups are normally maintained as daily summaries change (see
+attendance/rollups.py); run this once after deploying the table, or to repair
+it. One grouped query over the daily summaries, upserted in batches.
+"""
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from attendance.aggregates import monthly_totals
+from attendance.models import DailyAttendanceSummary, MonthlyAttendanceSummary
+from attendance.rollups import MONTHLY_FIELDS, next_month, rollup_values
+from employees.models import Employee
+
+def month(value):
+    return datetime.strptime(value, '%Y-%m').date()
+
+class Command(BaseCommand):
+    help = 'Recompute monthly attendance rollups from the daily summaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Only this company (UUID)')
+        parser.add_argument('--employee', help='Only this employee (employee ID)')
+        parser.add_argument('--from', dest='month_from', type=month, help='First month (YYYY-MM)')
+        parser.add_argument('--to', dest='month_to', type=month, help='Last month (YYYY-MM)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per upsert')
+
+    def handle(self, *args, **options):
+        employees = Employee.objects.all()
+        if options['company']:
+            employees = employees.filter(company_id=options['company'])
+        if options['employee']:
+            employees = employees.filter(employee_id=options['employee'])
+        
+        summaries = DailyAttendanceSummary.objects.filter(employee__in=employees)
+        rollups = MonthlyAttendanceSummary.objects.filter(employee__in=employees)
+        if options['month_from']:
+            summaries = summaries.filter(date__gte=options['month_from'])
+            rollups = rollups.filter(month__gte=options['month_from'])
+        if options['month_to']:
+            summaries = summaries.filter(date__lt=next_month(options['month_to']))
+            rollups = rollups.filter(month__lte=options['month_to'])
+        
+        seen = set()
+        batch = []
+        with transaction.atomic():
+            for totals in monthly_totals(summaries).iterator(chunk_size=options['batch_size']):
+                seen.add((totals['employee_id'], totals['month']))
+                batch.append(MonthlyAttendanceSummary(
+                    employee_id=totals['employee_id'], month=totals['month'], **rollup_values(totals)
+                ))
+                if len(batch) >= options['batch_size']:
+                    self._upsert(batch)
+                    batch = []
+            self._upsert(batch)
+            
+            # Rollups of months without daily summaries
+            stale = [
+                rollup.pk for rollup in rollups.only('pk', 'employee_id', 'month')
+                if (rollup.employee_id, rollup.month) not in seen
+            ]
+            MonthlyAttendanceSummary.objects.filter(pk__in=stale).delete()
+        
+        self.stdout.write(self.style.SUCCESS(f"Done. {len(seen)} monthly rollups rebuilt, {len(stale)} empty removed."))
+
+    def _upsert(self, batch):
+        if batch:
+            MonthlyAttendanceSummary.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['employee', 'month'],
+                update_fields=MONTHLY_FIELDS + ['updated_at'],
+            )
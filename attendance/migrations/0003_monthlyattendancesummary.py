@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-17 07:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0001_initial'),
+        ('attendance', '0002_punch_event_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('total_days', models.PositiveIntegerField(default=0, help_text='Days with a daily summary')),
+                ('present_days', models.PositiveIntegerField(default=0)),
+                ('late_days', models.PositiveIntegerField(default=0)),
+                ('early_departures', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to='employees.employee')),
+            ],
+            options={
+                'db_table': 'monthly_attendance_summary',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='monthlyattendancesummary',
+            index=models.Index(fields=['month'], name='monthly_att_month_7047ee_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlyattendancesummary',
+            unique_together={('employee', 'month')},
+        ),
+    ]
@@ -2,6 +2,7 @@
 Attendance Models
 """
 from django.db import models
+from django.utils import timezone
 from employees.models import Employee
 from cameras.models import Camera
 
@@ -15,7 +16,10 @@ class AttendanceRecord(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_records')
     camera = models.ForeignKey(Camera, on_delete=models.SET_NULL, null=True, related_name='attendance_records')
     
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Time of the recognition, not of the (possibly queued) insert - see attendance/writer.py
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Id of the queued recognition this punch was written from; spool replays skip ids already written
+    event_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
     punch_type = models.CharField(max_length=3, choices=TYPE_CHOICES)
     
     # Face recognition metadata
@@ -79,4 +83,35 @@ class DailyAttendanceSummary(models.Model):
         ]
     
     def __str__(self):
-        return f"{self.employee.employee_id} - {self.date}"
\ No newline at end of file
+        return f"{self.employee.employee_id} - {self.date}"
+
+class MonthlyAttendanceSummary(models.Model):
+    """
+    Monthly rollup of an employee's daily summaries, kept up to date as they
+    change (see attendance/rollups.py) so monthly stats are a single-row lookup
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='monthly_summaries')
+    month = models.DateField(help_text='First day of the month')
+    
+    total_days = models.PositiveIntegerField(default=0, help_text='Days with a daily summary')
+    present_days = models.PositiveIntegerField(default=0)
+    late_days = models.PositiveIntegerField(default=0)
+    early_departures = models.PositiveIntegerField(default=0)
+    total_hours = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'monthly_attendance_summary'
+        ordering = ['-month']
+        unique_together = ['employee', 'month']
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+    
+    @property
+    def absent_days(self):
+        return self.total_days - self.present_days
+    
+    def __str__(self):
+        return f"{self.employee.employee_id} - {self.month.strftime('%Y-%m')}"
@@ -0,0 +1,152 @@
+"""
+Monthly Attendance Rollups
+MonthlyAttendanceSummary holds each employee's monthly counters, so monthly
+stats and payroll reports read one row instead of recounting the month's
+daily summaries.
+
+- Batched punch writes (AttendanceService.apply_punches_to_summaries) apply
+  the change of each daily summary they touch as a delta: one read and one
+  write per batch.
+- Any other save of a daily summary (full recompute, admin) recomputes its
+  month (attendance/signals.py). Daily summaries have no delete signal, so
+  employee and company deletes stay fast cascade deletes (the rollups go
+  with them); summaries deleted on their own go through
+  delete_daily_summaries, which recomputes each month once.
+- rebuild_monthly_summaries backfills or repairs the table.
+"""
+from datetime import date
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from .aggregates import summary_totals
+from .models import DailyAttendanceSummary, MonthlyAttendanceSummary
+
+# MonthlyAttendanceSummary counters, in contribution() order
+MONTHLY_FIELDS = ['total_days', 'present_days', 'late_days', 'early_departures', 'total_hours']
+
+
+def month_of(day):
+    """First day of the month of `day`"""
+    return day.replace(day=1)
+
+
+def next_month(month):
+    """First day of the following month"""
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def contribution(summary):
+    """What a daily summary adds to its month's counters (nothing for None)"""
+    if summary is None:
+        return (0, 0, 0, 0, Decimal('0'))
+    return (
+        1,
+        int(summary.is_present),
+        int(summary.is_late),
+        int(summary.is_early_departure),
+        summary.total_hours or Decimal('0'),
+    )
+
+
+def apply_monthly_changes(changes):
+    """
+    Add the change of daily summaries to their months' rollups.
+    
+    Args:
+        changes: (employee_id, date, before, after) with contribution() tuples
+    
+    Call inside the transaction that wrote the daily summaries.
+    """
+    deltas = {}
+    for employee_id, day, before, after in changes:
+        key = (employee_id, month_of(day))
+        current = deltas.get(key, contribution(None))
+        deltas[key] = tuple(total + new - old for total, old, new in zip(current, before, after))
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    
+    existing = {
+        (rollup.employee_id, rollup.month): rollup
+        for rollup in MonthlyAttendanceSummary.objects.select_for_update().filter(
+            employee_id__in={employee_id for employee_id, month in deltas},
+            month__in={month for employee_id, month in deltas}
+        )
+    }
+    
+    created, updated = [], []
+    for key, delta in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            rollup = MonthlyAttendanceSummary(employee_id=key[0], month=key[1])
+            created.append(rollup)
+        else:
+            # bulk_update skips auto_now
+            rollup.updated_at = timezone.now()
+            updated.append(rollup)
+        for field, value in zip(MONTHLY_FIELDS, delta):
+            setattr(rollup, field, getattr(rollup, field) + value)
+    
+    if updated:
+        MonthlyAttendanceSummary.objects.bulk_update(updated, MONTHLY_FIELDS + ['updated_at'])
+    if created:
+        # A concurrent writer may have created the same month's row: recompute those in full
+        MonthlyAttendanceSummary.objects.bulk_create(created, ignore_conflicts=True)
+        stored = set(MonthlyAttendanceSummary.objects.filter(
+            employee_id__in={rollup.employee_id for rollup in created},
+            month__in={rollup.month for rollup in created}
+        ).values_list('employee_id', 'month', *MONTHLY_FIELDS))
+        for rollup in created:
+            values = tuple(getattr(rollup, field) for field in MONTHLY_FIELDS)
+            if (rollup.employee_id, rollup.month) + values not in stored:
+                update_monthly_summary(rollup.employee_id, rollup.month)
+
+
+def update_monthly_summary(employee_id, month):
+    """
+    Recompute one employee's month from its daily summaries
+    (the row is removed once the month has none)
+    """
+    rollups = MonthlyAttendanceSummary.objects.filter(employee_id=employee_id, month=month)
+    with transaction.atomic():
+        # Lock first: a concurrent delta is committed before the month is counted
+        list(rollups.select_for_update())
+        totals = summary_totals(DailyAttendanceSummary.objects.filter(
+            employee_id=employee_id,
+            date__gte=month,
+            date__lt=next_month(month)
+        ))
+        if not totals['total']:
+            rollups.delete()
+            return None
+        
+        rollup, created = MonthlyAttendanceSummary.objects.update_or_create(
+            employee_id=employee_id,
+            month=month,
+            defaults=rollup_values(totals)
+        )
+    return rollup
+
+
+def delete_daily_summaries(summaries):
+    """Delete a queryset of daily summaries and recompute each month they were in, once"""
+    with transaction.atomic():
+        months = {
+            (employee_id, month_of(day))
+            for employee_id, day in summaries.order_by().values_list('employee_id', 'date')
+        }
+        deleted, _ = summaries.delete()
+        for employee_id, month in sorted(months):
+            update_monthly_summary(employee_id, month)
+    return deleted
+
+
+def rollup_values(totals):
+    """MonthlyAttendanceSummary field values from summary_totals()/monthly_totals() counters"""
+    return {
+        'total_days': totals['total'],
+        'present_days': totals['present'],
+        'late_days': totals['late'],
+        'early_departures': totals['early_departures'],
+        'total_hours': totals['total_hours'],
+    }
@@ -5,10 +5,18 @@ from datetime import datetime, date, time, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from django.db import transaction
 from django.utils import timezone
-from .models import AttendanceRecord, DailyAttendanceSummary
+from .models import AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary
+from .rollups import apply_monthly_changes, contribution
+from employees.dashboard import invalidate_dashboard
 from employees.models import Employee
 from cameras.models import Camera
 
+# DailyAttendanceSummary fields derived from the day's punches
+SUMMARY_FIELDS = [
+    'check_in_time', 'check_out_time', 'total_hours', 'is_present',
+    'is_late', 'is_early_departure', 'first_punch', 'last_punch',
+]
+
 class AttendanceService:
     """
     Handles all attendance-related business logic
@@ -20,6 +28,10 @@ class AttendanceService:
         self.confidence_threshold = 70.0  # Minimum confidence for auto-attendance
         self.work_start_time = time(9, 0)  # 9:00 AM
         self.work_end_time = time(18, 0)  # 6:00 PM
+        # Last punch this process knows of per employee: pk -> (date, timestamp, punch_type).
+        # A face in front of a kiosk is recognized every frame; while that punch is
+        # under min_punch_interval_minutes old the DB isn't queried at all.
+        self.recent_punches = {}
     
     def mark_attendance(self, employee, confidence_score, face_distance, camera=None, is_manual=False):
         """
@@ -46,6 +58,12 @@ class AttendanceService:
         now = timezone.now()
         # Use local date boundaries to avoid UTC date drift
         today = timezone.localdate()
+        
+        # A newer punch recorded by another process would only be more recent,
+        # so a cached punch that is still too recent is enough to skip
+        if self._is_too_soon(self.recent_punches.get(employee.pk), today, now):
+            return None
+        
         day_start, day_end = self._get_day_bounds(today)
         
         # Get last punch for this employee today
@@ -62,6 +80,7 @@ class AttendanceService:
             # Check minimum interval
             time_diff = (now - last_punch.timestamp).total_seconds() / 60
             if time_diff < self.min_punch_interval_minutes:
+                self._remember_punch(employee, today, last_punch)
                 return None  # Too soon since last punch
             
             # Alternate between IN and OUT
@@ -72,20 +91,190 @@ class AttendanceService:
             record = AttendanceRecord.objects.create(
                 employee=employee,
                 camera=camera,
+                timestamp=now,
                 punch_type=punch_type,
                 confidence_score=confidence_score,
                 face_distance=face_distance,
                 is_manual=is_manual
             )
             
-            # Update daily summary
-            self.update_daily_summary(employee, today)
+            # Fold the punch into the daily summary
+            self.apply_punches_to_summaries([record])
         
+        self._remember_punch(employee, today, record)
         return record
     
+    def record_punches(self, punches):
+        """
+        Write a batch of queued recognitions (see attendance/writer.py) with the
+        same rules as mark_attendance: one query for the day's last punches, one
+        bulk insert, one summary update per employee and day.
+        
+        Args:
+            punches: dicts with event_id, employee_id (pk), camera_id,
+                     confidence_score, face_distance, timestamp
+        
+        Returns:
+            list of created AttendanceRecords
+        """
+        # Replayed spool entries may already have been written
+        event_ids = [punch['event_id'] for punch in punches]
+        written = set(map(str, AttendanceRecord.objects.filter(
+            event_id__in=event_ids
+        ).values_list('event_id', flat=True)))
+        punches = sorted(
+            (punch for punch in punches if str(punch['event_id']) not in written),
+            key=lambda punch: punch['timestamp']
+        )
+        if not punches:
+            return []
+        
+        employees = Employee.objects.filter(
+            pk__in={punch['employee_id'] for punch in punches},
+            status='active'
+        ).in_bulk()
+        # Cameras deleted while the punch was queued are dropped like SET_NULL would
+        camera_ids = set(Camera.objects.filter(
+            pk__in={punch['camera_id'] for punch in punches if punch['camera_id']}
+        ).values_list('pk', flat=True))
+        
+        # Last punch per (employee, local date) from the first day in the batch on
+        day_start, _ = self._get_day_bounds(timezone.localdate(punches[0]['timestamp']))
+        last_punches = {}
+        for employee_id, timestamp, punch_type in AttendanceRecord.objects.filter(
+            employee_id__in=employees,
+            timestamp__gte=day_start
+        ).order_by('timestamp').values_list('employee_id', 'timestamp', 'punch_type'):
+            last_punches[employee_id, timezone.localdate(timestamp)] = (timestamp, punch_type)
+        
+        records = []
+        for punch in punches:
+            employee = employees.get(punch['employee_id'])
+            if employee is None:
+                continue
+            timestamp = punch['timestamp']
+            key = (employee.pk, timezone.localdate(timestamp))
+            last_punch = last_punches.get(key)
+            
+            if last_punch is None:
+                punch_type = 'IN'
+            else:
+                time_diff = (timestamp - last_punch[0]).total_seconds() / 60
+                if time_diff < self.min_punch_interval_minutes:
+                    continue  # Too soon since last punch
+                punch_type = 'OUT' if last_punch[1] == 'IN' else 'IN'
+            
+            last_punches[key] = (timestamp, punch_type)
+            records.append(AttendanceRecord(
+                employee=employee,
+                camera_id=punch['camera_id'] if punch['camera_id'] in camera_ids else None,
+                timestamp=timestamp,
+                punch_type=punch_type,
+                confidence_score=punch['confidence_score'],
+                face_distance=punch['face_distance'],
+                event_id=punch['event_id']
+            ))
+        
+        with transaction.atomic():
+            AttendanceRecord.objects.bulk_create(records)
+            # One summary write per employee and day, however many punches it got
+            self.apply_punches_to_summaries(records)
+        
+        for record in records:
+            self._remember_punch(record.employee, timezone.localdate(record.timestamp), record)
+        return records
+    
+    def _remember_punch(self, employee, date_obj, record):
+        self.recent_punches[employee.pk] = (date_obj, record.timestamp, record.punch_type)
+    
+    def _is_too_soon(self, recent, date_obj, now):
+        """True if a cached (date, timestamp, punch_type) rules out a punch today at `now`"""
+        if recent is None or recent[0] != date_obj:
+            return False
+        return (now - recent[1]).total_seconds() / 60 < self.min_punch_interval_minutes
+    
+    def apply_punches_to_summaries(self, records):
+        """
+        Incremental summary maintenance: fold new punches into their days'
+        DailyAttendanceSummary rows (the first IN only moves earlier, the last
+        OUT only later, hours follow arithmetically) without re-reading the
+        day's punches. One query for the existing rows, then one bulk insert
+        and/or one bulk update; the same again for the monthly rollups.
+        update_daily_summary is the full recompute (see the
+        rebuild_attendance_summaries command).
+        
+        Call inside the transaction that saved the records (they need pks).
+        """
+        days = {}
+        for record in sorted(records, key=lambda record: record.timestamp):
+            days.setdefault((record.employee_id, timezone.localdate(record.timestamp)), []).append(record)
+        
+        existing = {
+            (summary.employee_id, summary.date): summary
+            for summary in DailyAttendanceSummary.objects.select_for_update(of=('self',)).select_related(
+                'first_punch', 'last_punch'
+            ).filter(
+                employee_id__in={employee_id for employee_id, date_obj in days},
+                date__in={date_obj for employee_id, date_obj in days}
+            )
+            if (summary.employee_id, summary.date) in days
+        }
+        
+        created, updated = [], []
+        # Each day's monthly contribution before these punches
+        before = {}
+        for (employee_id, date_obj), day_records in days.items():
+            summary = existing.get((employee_id, date_obj))
+            before[employee_id, date_obj] = contribution(summary)
+            if summary is None:
+                summary = DailyAttendanceSummary(employee_id=employee_id, date=date_obj)
+                created.append(summary)
+            else:
+                # bulk_update skips auto_now
+                summary.updated_at = timezone.now()
+                updated.append(summary)
+            
+            first_in, last_out = summary.first_punch, summary.last_punch
+            for record in day_records:
+                if record.punch_type == 'IN' and (first_in is None or record.timestamp < first_in.timestamp):
+                    first_in = record
+                if record.punch_type == 'OUT' and (last_out is None or record.timestamp > last_out.timestamp):
+                    last_out = record
+            self._fill_summary(summary, first_in, last_out)
+        
+        # bulk_create sends no signals: the dashboards are invalidated here
+        company_ids = {record.employee.company_id for record in records}
+        transaction.on_commit(lambda: [invalidate_dashboard(company_id) for company_id in company_ids])
+        
+        conflicts = []
+        if updated:
+            DailyAttendanceSummary.objects.bulk_update(updated, SUMMARY_FIELDS + ['updated_at'])
+        if created:
+            # A concurrent writer may have created the same day's row: recompute those in full
+            DailyAttendanceSummary.objects.bulk_create(created, ignore_conflicts=True)
+            stored = set(DailyAttendanceSummary.objects.filter(
+                employee_id__in={summary.employee_id for summary in created},
+                date__in={summary.date for summary in created}
+            ).values_list('employee_id', 'date', 'first_punch_id', 'last_punch_id'))
+            conflicts = [
+                summary for summary in created
+                if (summary.employee_id, summary.date, summary.first_punch_id, summary.last_punch_id) not in stored
+            ]
+        
+        # Monthly rollups by delta (the recomputed days update their month themselves)
+        apply_monthly_changes([
+            (summary.employee_id, summary.date, before[summary.employee_id, summary.date], contribution(summary))
+            for summary in created + updated if summary not in conflicts
+        ])
+        for summary in conflicts:
+            self.update_daily_summary(summary.employee, summary.date)
+        
+        return created + updated
+    
     def update_daily_summary(self, employee, date_obj):
         """
-        Update or create daily attendance summary
+        Update or create daily attendance summary from all of the day's punches
+        (full recompute: repairs rows after punches were edited or deleted)
         """
         day_start, day_end = self._get_day_bounds(date_obj)
         
@@ -103,9 +292,22 @@ class AttendanceService:
         first_in = punches.filter(punch_type='IN').first()
         last_out = punches.filter(punch_type='OUT').last()
         
-        # Calculate totals
-        check_in_time = first_in.timestamp.time() if first_in else None
-        check_out_time = last_out.timestamp.time() if last_out else None
+        # Update or create summary
+        summary = DailyAttendanceSummary(employee=employee, date=date_obj)
+        self._fill_summary(summary, first_in, last_out)
+        summary, created = DailyAttendanceSummary.objects.update_or_create(
+            employee=employee,
+            date=date_obj,
+            defaults={field: getattr(summary, field) for field in SUMMARY_FIELDS}
+        )
+        
+        return summary
+    
+    def _fill_summary(self, summary, first_in, last_out):
+        """Set a summary's fields from the day's first IN and last OUT punch"""
+        # Calculate totals (local wall-clock times, compared with work_start/end_time)
+        check_in_time = timezone.localtime(first_in.timestamp).time() if first_in else None
+        check_out_time = timezone.localtime(last_out.timestamp).time() if last_out else None
         
         # Calculate total hours
         total_hours = None
@@ -126,23 +328,14 @@ class AttendanceService:
         if check_out_time and check_out_time < self.work_end_time and last_out:
             is_early_departure = True
         
-        # Update or create summary
-        summary, created = DailyAttendanceSummary.objects.update_or_create(
-            employee=employee,
-            date=date_obj,
-            defaults={
-                'check_in_time': check_in_time,
-                'check_out_time': check_out_time,
-                'total_hours': total_hours,
-                'is_present': is_present,
-                'is_late': is_late,
-                'is_early_departure': is_early_departure,
-                'first_punch': first_in,
-                'last_punch': last_out,
-            }
-        )
-        
-        return summary
+        summary.check_in_time = check_in_time
+        summary.check_out_time = check_out_time
+        summary.total_hours = total_hours
+        summary.is_present = is_present
+        summary.is_late = is_late
+        summary.is_early_departure = is_early_departure
+        summary.first_punch = first_in
+        summary.last_punch = last_out
     
     def _get_day_bounds(self, date_obj):
         """
@@ -191,22 +384,21 @@ class AttendanceService:
         if year is None:
             year = datetime.now().year
         
-        summaries = DailyAttendanceSummary.objects.filter(
+        # One row of the monthly rollup (see attendance/rollups.py)
+        rollup = MonthlyAttendanceSummary.objects.filter(
             employee=employee,
-            date__month=month,
-            date__year=year
-        )
+            month=date(year, month, 1)
+        ).first() or MonthlyAttendanceSummary(employee=employee, month=date(year, month, 1))
         
-        total_days = summaries.count()
-        present_days = summaries.filter(is_present=True).count()
-        late_days = summaries.filter(is_late=True).count()
-        early_departures = summaries.filter(is_early_departure=True).count()
+        total_days = rollup.total_days
+        present_days = rollup.present_days
         
         return {
             'total_days': total_days,
             'present_days': present_days,
-            'absent_days': total_days - present_days,
-            'late_days': late_days,
-            'early_departures': early_departures,
+            'absent_days': rollup.absent_days,
+            'late_days': rollup.late_days,
+            'early_departures': rollup.early_departures,
+            'total_hours': rollup.total_hours,
             'attendance_percentage': (present_days / total_days * 100) if total_days > 0 else 0
         }
\ No newline at end of file
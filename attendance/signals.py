@@ -0,0 +1,19 @@
+"""
+Monthly rollup signals
+A daily summary saved through the ORM (full recompute, admin) recomputes its
+month's MonthlyAttendanceSummary. Batched punch writes bypass signals and
+apply deltas instead, see AttendanceService.apply_punches_to_summaries.
+Deletes have no receiver (it would turn every employee/company cascade into
+row-by-row deletes): see rollups.delete_daily_summaries.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import DailyAttendanceSummary
+from .rollups import month_of, update_monthly_summary
+
+@receiver(post_save, sender=DailyAttendanceSummary)
+def daily_summary_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        # Fixture loading
+        return
+    update_monthly_summary(instance.employee_id, month_of(instance.date))
@@ -1,3 +1,367 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import tempfile
+import threading
+import uuid
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .aggregates import company_day_totals, summary_totals
+from .models import AttendanceRecord, DailyAttendanceSummary, MonthlyAttendanceSummary
+from .services import SUMMARY_FIELDS, AttendanceService
+from .rollups import delete_daily_summaries, rollup_values
+from .writer import AttendanceWriter
+from accounts.models import Company, User
+from employees.models import Employee
+
+
+# Dashboard/punch caching goes to memory, not the project's file cache
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class AttendanceTestMixin:
+    """One company with one active employee"""
+
+    def setUp(self):
+        cache_override = override_settings(CACHES=LOCMEM_CACHES)
+        cache_override.enable()
+        self.addCleanup(cache_override.disable)
+        self.company = Company.objects.create(name='Gatehouse', slug='gatehouse', contact_email='ops@example.com')
+        self.employee = Employee.objects.create(
+            company=self.company, employee_id='EMP001', first_name='Dana', last_name='Ray',
+            email='dana@example.com', date_of_joining='2024-01-01'
+        )
+
+    def at(self, when):
+        """Patch the clock used for punches"""
+        return mock.patch('django.utils.timezone.now', return_value=when)
+
+
+def punch(employee, when):
+    """A queued recognition (see writer.py) at a given local time"""
+    return {
+        'event_id': str(uuid.uuid4()), 'employee_id': employee.pk, 'camera_id': None,
+        'confidence_score': 95.0, 'face_distance': 0.3, 'timestamp': when,
+    }
+
+
+class IncrementalSummaryTests(AttendanceTestMixin, TestCase):
+    """Summaries folded punch by punch match a full recompute of the day"""
+
+    def setUp(self):
+        super().setUp()
+        self.service = AttendanceService()
+        self.day = timezone.localdate() - timedelta(days=1)
+
+    def local(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, datetime.min.time()).replace(hour=hour, minute=minute))
+
+    def summary_values(self):
+        summary = DailyAttendanceSummary.objects.get(employee=self.employee, date=self.day)
+        return {field: getattr(summary, field) for field in SUMMARY_FIELDS}
+
+    def test_incremental_matches_recompute(self):
+        # Separate batches, the second arriving out of order
+        self.service.record_punches([punch(self.employee, self.local(8, 50))])
+        self.service.record_punches([punch(self.employee, self.local(17, 30)), punch(self.employee, self.local(12))])
+        self.service.record_punches([punch(self.employee, self.local(13))])
+        incremental = self.summary_values()
+        self.assertIsNotNone(incremental['total_hours'])
+
+        self.service.update_daily_summary(self.employee, self.day)
+        self.assertEqual(self.summary_values(), incremental)
+
+    def test_one_read_one_write_per_batch(self):
+        self.service.record_punches([punch(self.employee, self.local(9))])
+        record = AttendanceRecord.objects.create(
+            employee=self.employee, timestamp=self.local(18), punch_type='OUT',
+            confidence_score=95.0, face_distance=0.3
+        )
+        # Daily row and monthly rollup: one read and one write each
+        with self.assertNumQueries(4):
+            self.service.apply_punches_to_summaries([record])
+        self.assertEqual(self.summary_values()['last_punch'], record)
+
+    def test_rebuild_command_repairs_summaries(self):
+        self.service.record_punches([punch(self.employee, self.local(9)), punch(self.employee, self.local(18))])
+        AttendanceRecord.objects.filter(punch_type='OUT').delete()
+        DailyAttendanceSummary.objects.create(employee=self.employee, date=self.day - timedelta(days=1), is_present=True)
+
+        call_command('rebuild_attendance_summaries', stdout=StringIO())
+        summary = DailyAttendanceSummary.objects.get()
+        self.assertIsNone(summary.last_punch)
+        self.assertIsNone(summary.total_hours)
+
+
+class RecentPunchCacheTests(AttendanceTestMixin, TestCase):
+    """Repeated recognitions within the punch interval don't query the DB"""
+
+    def test_repeat_recognitions_skip_the_database(self):
+        service = AttendanceService()
+        start = timezone.now().replace(hour=9, minute=30)
+        with self.at(start):
+            self.assertEqual(service.mark_attendance(self.employee, 95.0, 0.3).punch_type, 'IN')
+        with self.at(start + timedelta(seconds=30)), self.assertNumQueries(0):
+            self.assertIsNone(service.mark_attendance(self.employee, 95.0, 0.3))
+        with self.at(start + timedelta(minutes=6)):
+            self.assertEqual(service.mark_attendance(self.employee, 95.0, 0.3).punch_type, 'OUT')
+        self.assertEqual(AttendanceRecord.objects.count(), 2)
+
+    def test_punch_from_another_process_is_cached_after_one_query(self):
+        with self.at(timezone.now().replace(hour=9, minute=30)):
+            AttendanceService().mark_attendance(self.employee, 95.0, 0.3)
+            service = AttendanceService()
+            self.assertIsNone(service.mark_attendance(self.employee, 95.0, 0.3))
+            with self.assertNumQueries(0):
+                self.assertIsNone(service.mark_attendance(self.employee, 95.0, 0.3))
+
+    def test_new_day_is_not_blocked_by_yesterdays_punch(self):
+        service = AttendanceService()
+        today = timezone.localdate()
+        service.recent_punches[self.employee.pk] = (today - timedelta(days=1), timezone.now(), 'IN')
+        self.assertEqual(service.mark_attendance(self.employee, 95.0, 0.3).punch_type, 'IN')
+
+
+@override_settings(ATTENDANCE_ASYNC_WRITES=True)
+class AttendanceWriterTests(AttendanceTestMixin, TransactionTestCase):
+    """Queued punches reach the database exactly once, even through the spool"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = Employee.objects.create(
+            company=self.company, employee_id='EMP002', first_name='Sam', last_name='Lee',
+            email='sam@example.com', date_of_joining='2024-01-01'
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        service = AttendanceService()
+        # Every recognition is a punch, so none are legitimately skipped
+        service.min_punch_interval_minutes = 0
+        self.writer = AttendanceWriter(service, batch_size=7, interval=0.05, spool_path=Path(tmp.name) / 'spool.jsonl')
+
+    def submit_from_threads(self, count):
+        def submit(employee):
+            for _ in range(count):
+                self.assertTrue(self.writer.submit(employee, 95.0, 0.3))
+        threads = [threading.Thread(target=submit, args=(employee,)) for employee in (self.employee, self.other) * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.writer.flush()
+
+    def assert_punches(self, per_employee):
+        for employee in (self.employee, self.other):
+            records = list(AttendanceRecord.objects.filter(employee=employee).order_by('timestamp', 'pk'))
+            self.assertEqual(len(records), per_employee)
+            self.assertEqual([record.punch_type for record in records], ['IN', 'OUT'] * (per_employee // 2))
+        event_ids = list(AttendanceRecord.objects.values_list('event_id', flat=True))
+        self.assertEqual(len(set(event_ids)), len(event_ids))
+        self.assertEqual(DailyAttendanceSummary.objects.count(), 2)
+
+    def test_concurrent_punches_are_written_once(self):
+        self.submit_from_threads(10)
+        self.assert_punches(20)
+
+    def test_spooled_punches_are_replayed_once(self):
+        outage = mock.patch.object(
+            self.writer.service, 'record_punches', side_effect=OperationalError('connection refused')
+        )
+        with outage:
+            self.submit_from_threads(5)
+        self.assertEqual(AttendanceRecord.objects.count(), 0)
+        spooled = self.writer.spool_path.read_text()
+        self.assertEqual(len(spooled.splitlines()), 20)
+
+        # Back up: the next write replays the spool
+        self.submit_from_threads(5)
+        self.assert_punches(20)
+        self.assertEqual(self.writer.spool_path.read_text(), '')
+
+        # A spool replayed twice (e.g. a crash before it was emptied) adds nothing
+        self.writer.spool_path.write_text(spooled)
+        self.writer.replay_spool()
+        self.assert_punches(20)
+
+    def test_corrupt_spool_does_not_block_writes(self):
+        # One good spooled punch, then a line cut short by a crash
+        when = timezone.now() - timedelta(minutes=5)
+        self.writer._spool([punch(self.employee, when)])
+        with open(self.writer.spool_path, 'a') as f:
+            f.write('{"event_id": "9f1c", "employee_id": ')
+
+        self.assertTrue(self.writer.submit(self.other, 95.0, 0.3))
+        self.writer.flush()
+        self.assertEqual(AttendanceRecord.objects.filter(employee=self.employee).count(), 1)
+        self.assertEqual(AttendanceRecord.objects.filter(employee=self.other).count(), 1)
+        self.assertEqual(self.writer.spool_path.read_text(), '')
+        rejected = self.writer.spool_path.with_name('spool.jsonl.rejected').read_text()
+        self.assertEqual(rejected, '{"event_id": "9f1c", "employee_id": \n')
+
+    def test_failed_batch_is_spooled(self):
+        with mock.patch.object(self.writer.service, 'record_punches', side_effect=RuntimeError('bug')):
+            self.assertTrue(self.writer.submit(self.employee, 95.0, 0.3))
+            self.writer.flush()
+        self.assertEqual(AttendanceRecord.objects.count(), 0)
+        self.assertEqual(len(self.writer.spool_path.read_text().splitlines()), 1)
+
+        self.assertTrue(self.writer.submit(self.other, 95.0, 0.3))
+        self.writer.flush()
+        self.assertEqual(AttendanceRecord.objects.count(), 2)
+
+
+class AggregateTests(AttendanceTestMixin, TestCase):
+    """Summary counters come from a single aggregate query"""
+
+    def setUp(self):
+        super().setUp()
+        self.day = date(2025, 3, 3)
+        self.absent = Employee.objects.create(
+            company=self.company, employee_id='EMP002', first_name='Sam', last_name='Lee',
+            email='sam@example.com', date_of_joining='2024-01-01'
+        )
+        self.former = Employee.objects.create(
+            company=self.company, employee_id='EMP003', first_name='Lou', last_name='Kim',
+            email='lou@example.com', date_of_joining='2024-01-01', status='inactive'
+        )
+        for employee, day, late in ((self.employee, self.day, True), (self.former, self.day, False),
+                                    (self.employee, date(2025, 3, 4), False), (self.employee, date(2025, 4, 1), False)):
+            DailyAttendanceSummary.objects.create(
+                employee=employee, date=day, is_present=True, is_late=late, total_hours=Decimal('8.50')
+            )
+
+    def test_company_day_counts_missing_rows_as_absent(self):
+        with self.assertNumQueries(1):
+            totals = company_day_totals(self.company, self.day)
+        self.assertEqual(
+            (totals['total'], totals['present'], totals['absent'], totals['late']),
+            (2, 1, 1, 1)
+        )
+        self.assertEqual(totals['total_hours'], Decimal('8.50'))
+
+    def test_monthly_stats(self):
+        with self.assertNumQueries(1):
+            stats = AttendanceService().get_attendance_stats(self.employee, 3, 2025)
+        self.assertEqual((stats['total_days'], stats['present_days'], stats['late_days']), (2, 2, 1))
+        self.assertEqual(stats['total_hours'], Decimal('17.00'))
+        self.assertEqual(AttendanceService().get_attendance_stats(self.employee, 12, 2024)['total_days'], 0)
+
+
+class MonthlyRollupTests(AttendanceTestMixin, TestCase):
+    """Monthly rollups follow the daily summaries, however they change"""
+
+    def setUp(self):
+        super().setUp()
+        self.service = AttendanceService()
+        self.month = date(2025, 3, 1)
+
+    def local(self, day, hour):
+        return timezone.make_aware(datetime(2025, 3, day, hour))
+
+    def assert_rollup_matches_days(self):
+        totals = summary_totals(DailyAttendanceSummary.objects.filter(employee=self.employee, date__month=3))
+        rollup = MonthlyAttendanceSummary.objects.get(employee=self.employee, month=self.month)
+        self.assertEqual({field: getattr(rollup, field) for field in rollup_values(totals)}, rollup_values(totals))
+        return rollup
+
+    def test_batched_punches_and_recomputes(self):
+        self.service.record_punches([punch(self.employee, self.local(3, 9)), punch(self.employee, self.local(4, 10))])
+        self.service.record_punches([punch(self.employee, self.local(3, 17)), punch(self.employee, self.local(4, 19))])
+        rollup = self.assert_rollup_matches_days()
+        self.assertEqual((rollup.total_days, rollup.late_days, rollup.early_departures), (2, 1, 1))
+        self.assertEqual(rollup.total_hours, Decimal('17.00'))
+
+        # Punch deleted by hand and the day recomputed; a day removed
+        AttendanceRecord.objects.filter(timestamp=self.local(4, 19)).delete()
+        self.service.update_daily_summary(self.employee, date(2025, 3, 4))
+        self.assertEqual(self.assert_rollup_matches_days().total_hours, Decimal('8.00'))
+        delete_daily_summaries(DailyAttendanceSummary.objects.filter(date=date(2025, 3, 3)))
+        self.assertEqual(self.assert_rollup_matches_days().total_days, 1)
+        delete_daily_summaries(DailyAttendanceSummary.objects.all())
+        self.assertFalse(MonthlyAttendanceSummary.objects.exists())
+
+    def add_history(self, employee, days):
+        DailyAttendanceSummary.objects.bulk_create([
+            DailyAttendanceSummary(employee=employee, date=date(2025, 1, 1) + timedelta(days=i), is_present=True)
+            for i in range(days)
+        ])
+        AttendanceRecord.objects.bulk_create([
+            AttendanceRecord(
+                employee=employee, punch_type=punch_type, confidence_score=95.0, face_distance=0.3,
+                timestamp=timezone.make_aware(datetime(2025, 1, 1, hour)) + timedelta(days=i)
+            )
+            for i in range(days) for punch_type, hour in (('IN', 9), ('OUT', 17))
+        ])
+        call_command('rebuild_monthly_summaries', stdout=StringIO())
+
+    def test_cascade_deletes_are_not_row_by_row(self):
+        # 50 days and 100 punches: a fixed number of queries (one DELETE per table), not one per row
+        self.add_history(self.employee, 50)
+        with self.assertNumQueries(8):
+            Employee.objects.filter(company=self.company).delete()
+        self.assertFalse(MonthlyAttendanceSummary.objects.exists())
+
+        other = Employee.objects.create(
+            company=self.company, employee_id='EMP002', first_name='Sam', last_name='Lee',
+            email='sam@example.com', date_of_joining='2024-01-01'
+        )
+        self.add_history(other, 50)
+        with self.assertNumQueries(16):
+            self.company.delete()
+        self.assertFalse(DailyAttendanceSummary.objects.exists())
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+    def test_backfill_command(self):
+        self.service.record_punches([punch(self.employee, self.local(3, 9)), punch(self.employee, self.local(3, 18))])
+        MonthlyAttendanceSummary.objects.update(total_days=0, total_hours=0)
+        MonthlyAttendanceSummary.objects.create(employee=self.employee, month=date(2025, 1, 1), total_days=4)
+
+        call_command('rebuild_monthly_summaries', stdout=StringIO())
+        self.assertEqual(self.assert_rollup_matches_days().total_hours, Decimal('9.00'))
+        self.assertEqual(MonthlyAttendanceSummary.objects.count(), 1)
+
+
+class ExportTests(AttendanceTestMixin, TestCase):
+    """CSV exports stream every matching row of the user's company"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('boss', password='pw', company=self.company))
+        service = AttendanceService()
+        for day in (date(2025, 3, 3), date(2025, 3, 4)):
+            start = timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=9))
+            service.record_punches([punch(self.employee, start), punch(self.employee, start + timedelta(hours=8))])
+
+        other = Company.objects.create(name='Elsewhere', slug='elsewhere', contact_email='x@example.com')
+        outsider = Employee.objects.create(
+            company=other, employee_id='EMP900', first_name='Out', last_name='Sider',
+            email='out@example.com', date_of_joining='2024-01-01'
+        )
+        service.record_punches([punch(outsider, timezone.make_aware(datetime(2025, 3, 3, 9)))])
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_records_export_uses_history_filters(self):
+        lines = self.export('export_attendance_records')
+        self.assertTrue(lines[0].startswith('Employee ID,Employee Name,Date,Time'))
+        self.assertEqual(len(lines), 5)
+        self.assertNotIn('EMP900', ''.join(lines))
+
+        lines = self.export('export_attendance_records', date_from='2025-03-04', date_to='not-a-date')
+        self.assertEqual([line.split(',')[2:5] for line in lines[1:]], [['2025-03-04', '17:00:00', 'OUT'], ['2025-03-04', '09:00:00', 'IN']])
+
+    def test_summaries_export(self):
+        lines = self.export('export_daily_summaries', employee_id='EMP001', date_to='2025-03-03')
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split(',')[3:7], ['2025-03-03', '09:00:00', '17:00:00', '8.00'])
@@ -6,6 +6,8 @@ from . import views
 
 urlpatterns = [
     path('history/', views.attendance_history, name='attendance_history'),
+    path('export/records/', views.export_attendance_records, name='export_attendance_records'),
+    path('export/summaries/', views.export_daily_summaries, name='export_daily_summaries'),
     path('daily/', views.daily_summary, name='daily_summary'),
     path('employee/<str:employee_id>/', views.employee_attendance_detail, name='employee_attendance_detail'),
 ]
\ No newline at end of file
@@ -1,45 +1,87 @@
 """
 Attendance Views - Multi-Tenant Aware
 """
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.utils.dateparse import parse_date
 from datetime import date, datetime
 from .models import AttendanceRecord, DailyAttendanceSummary
 from employees.models import Employee
+from .aggregates import company_day_totals
+from .rollups import next_month
+from .exports import RECORD_HEADER, SUMMARY_HEADER, csv_response, record_rows, summary_rows
 from .services import AttendanceService
 
 attendance_service = AttendanceService()
 
-@login_required
-def attendance_history(request):
-    """View attendance history - Company Isolated"""
-    if not request.user.company:
-        return redirect('dashboard')
+def _history_filters(request):
+    """date_from / date_to / employee_id from the query string (invalid dates are ignored)"""
+    def valid_date(value):
+        try:
+            return value if value and parse_date(value) else None
+        except ValueError:
+            return None
 
-    # Get filter parameters
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    employee_id = request.GET.get('employee_id')
-    
-    # Base queryset - Filter by Company
+    return {
+        'date_from': valid_date(request.GET.get('date_from')),
+        'date_to': valid_date(request.GET.get('date_to')),
+        'employee_id': request.GET.get('employee_id') or None,
+    }
+
+def _filtered_records(company, filters):
+    """Company punches matching the history filters, newest first"""
     records = AttendanceRecord.objects.filter(
-        employee__company=request.user.company
+        employee__company=company
     ).select_related(
         'employee', 'camera'
     ).order_by('-timestamp')
     
-    # Apply filters
-    if date_from:
-        records = records.filter(timestamp__date__gte=date_from)
+    if filters['date_from']:
+        records = records.filter(timestamp__date__gte=filters['date_from'])
     
-    if date_to:
-        records = records.filter(timestamp__date__lte=date_to)
+    if filters['date_to']:
+        records = records.filter(timestamp__date__lte=filters['date_to'])
     
-    if employee_id:
-        records = records.filter(employee__employee_id=employee_id)
+    if filters['employee_id']:
+        records = records.filter(employee__employee_id=filters['employee_id'])
     
-    # Limit results for performance
+    return records
+
+def _filtered_summaries(company, filters):
+    """Company daily summaries matching the history filters, newest day first"""
+    summaries = DailyAttendanceSummary.objects.filter(
+        employee__company=company
+    ).select_related(
+        'employee', 'employee__department'
+    ).order_by('-date', 'employee__employee_id')
+    
+    if filters['date_from']:
+        summaries = summaries.filter(date__gte=filters['date_from'])
+    
+    if filters['date_to']:
+        summaries = summaries.filter(date__lte=filters['date_to'])
+    
+    if filters['employee_id']:
+        summaries = summaries.filter(employee__employee_id=filters['employee_id'])
+    
+    return summaries
+
+def _export_filename(prefix, filters):
+    parts = [prefix] + [filters[key] for key in ('employee_id', 'date_from', 'date_to') if filters[key]]
+    return '_'.join(parts) + '.csv'
+
+@login_required
+def attendance_history(request):
+    """View attendance history - Company Isolated"""
+    if not request.user.company:
+        return redirect('dashboard')
+
+    # Get filter parameters and the company's matching punches
+    filters = _history_filters(request)
+    records = _filtered_records(request.user.company, filters)
+    
+    # Limit results for performance (the CSV export has them all)
     records = records[:100]
     
     # Get employees for filter dropdown (Only own company)
@@ -51,13 +93,34 @@ def attendance_history(request):
     context = {
         'records': records,
         'employees': employees,
-        'date_from': date_from,
-        'date_to': date_to,
-        'employee_id': employee_id,
+        'date_from': filters['date_from'],
+        'date_to': filters['date_to'],
+        'employee_id': filters['employee_id'],
+        'export_query': request.GET.urlencode(),
     }
     
     return render(request, 'attendance/attendance_history.html', context)
 
+@login_required
+def export_attendance_records(request):
+    """CSV of every punch matching the history filters - Company Isolated"""
+    if not request.user.company:
+        return redirect('dashboard')
+
+    filters = _history_filters(request)
+    records = _filtered_records(request.user.company, filters)
+    return csv_response(request, RECORD_HEADER, record_rows(records), _export_filename('attendance', filters))
+
+@login_required
+def export_daily_summaries(request):
+    """CSV of the daily summaries matching the history filters - Company Isolated"""
+    if not request.user.company:
+        return redirect('dashboard')
+
+    filters = _history_filters(request)
+    summaries = _filtered_summaries(request.user.company, filters)
+    return csv_response(request, SUMMARY_HEADER, summary_rows(summaries), _export_filename('daily_summary', filters))
+
 @login_required
 def daily_summary(request):
     """View daily attendance summary - Company Isolated"""
@@ -78,23 +141,19 @@ def daily_summary(request):
         date=selected_date
     ).select_related('employee', 'employee__department').order_by('employee__employee_id')
     
-    # Calculate statistics for THIS company
-    total_employees = Employee.objects.filter(
-        company=request.user.company, 
-        status='active'
-    ).count()
-    
-    present_count = summaries.filter(is_present=True).count()
-    absent_count = total_employees - present_count
-    late_count = summaries.filter(is_late=True).count()
+    # Calculate statistics for THIS company in one query
+    # (active employees without a summary row count as absent)
+    totals = company_day_totals(request.user.company, selected_date)
+    total_employees = totals['total']
+    present_count = totals['present']
     
     context = {
         'summaries': summaries,
         'selected_date': selected_date,
         'total_employees': total_employees,
         'present_count': present_count,
-        'absent_count': absent_count,
-        'late_count': late_count,
+        'absent_count': totals['absent'],
+        'late_count': totals['late'],
         'attendance_percentage': (present_count / total_employees * 100) if total_employees > 0 else 0,
     }
     
@@ -114,18 +173,20 @@ def employee_attendance_detail(request, employee_id):
     try:
         month = int(request.GET.get('month', date.today().month))
         year = int(request.GET.get('year', date.today().year))
+        month_start = date(year, month, 1)
     except (TypeError, ValueError):
         month = date.today().month
         year = date.today().year
+        month_start = date(year, month, 1)
     
-    # Get monthly summaries
+    # Get monthly summaries (date range, so the (employee, date) index is used)
     summaries = DailyAttendanceSummary.objects.filter(
         employee=employee,
-        date__month=month,
-        date__year=year
+        date__gte=month_start,
+        date__lt=next_month(month_start)
     ).order_by('-date')
     
-    # Get statistics
+    # Get statistics (one row of the monthly rollup)
     stats = attendance_service.get_attendance_stats(employee, month, year)
     
     context = {
@@ -0,0 +1,216 @@
+"""
+Attendance Write Queue
+Recognition doesn't wait on the database: confident matches are queued here
+and a background thread writes them in batches (AttendanceService.record_punches:
+one bulk insert and one summary update per employee and day per batch).
+
+- A batch is written once ATTENDANCE_WRITE_BATCH_SIZE punches are waiting or
+  ATTENDANCE_WRITE_INTERVAL seconds after the first one arrived.
+- Each punch carries an event_id (unique on AttendanceRecord), so a punch is
+  never written twice, even when replayed.
+- While the database is unreachable (or a write fails for any other reason),
+  batches are appended to a local spool file (ATTENDANCE_SPOOL_PATH); the next
+  write replays it first, so punches still reach the database in time order.
+  Spooled lines that can't be read or written are moved to
+  <spool>.rejected instead of blocking every later replay.
+- flush() blocks until everything queued is written or spooled; it runs at
+  process exit (atexit / multiprocessing finalizer) and in gunicorn's worker_exit.
+
+ATTENDANCE_ASYNC_WRITES = False writes each punch in the calling thread (tests).
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from multiprocessing.util import Finalize
+from pathlib import Path
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .services import AttendanceService
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, no file locking
+    fcntl = None
+
+
+class AttendanceWriter:
+    """Queues recognitions and writes them as batched punches"""
+
+    def __init__(self, service=None, batch_size=None, interval=None, spool_path=None):
+        self.service = service or AttendanceService()
+        self.batch_size = batch_size or getattr(settings, 'ATTENDANCE_WRITE_BATCH_SIZE', 100)
+        self.interval = interval if interval is not None else getattr(settings, 'ATTENDANCE_WRITE_INTERVAL', 0.5)
+        self.spool_path = Path(spool_path or settings.ATTENDANCE_SPOOL_PATH)
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, employee, confidence_score, face_distance, camera=None):
+        """
+        Queue a recognition for attendance. Returns False if it can't produce
+        a punch (inactive employee, low confidence, last punch too recent).
+        """
+        service = self.service
+        if employee.status != 'active' or confidence_score < service.confidence_threshold:
+            return False
+
+        if not getattr(settings, 'ATTENDANCE_ASYNC_WRITES', True):
+            punch = self._punch(employee, confidence_score, face_distance, camera)
+            if punch is not None:
+                self._write([punch])
+            return punch is not None
+
+        self._ensure_thread()
+        # Timestamp and enqueue together: the queue stays in punch time order
+        with self._lock:
+            punch = self._punch(employee, confidence_score, face_distance, camera)
+            if punch is not None:
+                self.queue.put(punch)
+        return punch is not None
+
+    def _punch(self, employee, confidence_score, face_distance, camera):
+        """The queued form of a recognition, or None if the last punch is too recent"""
+        service = self.service
+        now = timezone.now()
+        today = timezone.localdate(now)
+        if service._is_too_soon(service.recent_punches.get(employee.pk), today, now):
+            return None
+        # Frames until the write are skipped as too soon (the type is decided by the writer)
+        service.recent_punches[employee.pk] = (today, now, None)
+        return {
+            'event_id': str(uuid.uuid4()),
+            'employee_id': employee.pk,
+            'camera_id': camera.pk if camera else None,
+            'confidence_score': float(confidence_score),
+            'face_distance': float(face_distance),
+            'timestamp': now,
+        }
+
+    def flush(self):
+        """Block until every queued punch is written (or spooled)"""
+        if self._thread is not None:
+            self.queue.join()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        close_old_connections()
+        try:
+            # Spooled punches (including a previous run's) are older: they go first
+            self.replay_spool()
+            self.service.record_punches(batch)
+        except (OperationalError, InterfaceError) as e:
+            # Database unreachable: keep the punches on disk, behind the older ones
+            print(f"Attendance Error: database unavailable ({e}), spooling {len(batch)} punches")
+            self._spool(batch)
+        except Exception as e:
+            # Never drop a batch: the next replay retries it (and rejects it if it fails again)
+            print(f"Attendance Error: {e}, spooling {len(batch)} punches")
+            self._spool(batch)
+
+    def _spool(self, batch):
+        try:
+            self._append_spool(batch)
+        except OSError as e:
+            print(f"Attendance Error: could not spool {len(batch)} punches ({e}), they are lost")
+
+    def _append_spool(self, batch):
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spool_path, 'a') as f:
+            self._lock_file(f)
+            for punch in batch:
+                f.write(json.dumps(dict(punch, timestamp=punch['timestamp'].isoformat())) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay_spool(self):
+        """
+        Write spooled punches; the spool is emptied only once they're in the
+        database (database errors propagate and leave it as it was).
+        Unreadable lines, and punches that fail to write for any other reason,
+        are moved to the rejected file.
+        """
+        if not self.spool_path.exists() or self.spool_path.stat().st_size == 0:
+            return
+        with open(self.spool_path, 'r+') as f:
+            # Other processes append/replay the same file
+            self._lock_file(f)
+            lines, punches, rejected = [], [], []
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    punch = json.loads(line)
+                    punch['timestamp'] = parse_datetime(punch['timestamp'])
+                    if punch['timestamp'] is None:
+                        raise ValueError(f"bad timestamp in {line!r}")
+                except (ValueError, KeyError, TypeError) as e:
+                    # e.g. a line cut short by a crash mid-write
+                    print(f"Attendance Error: unreadable spooled punch ({e})")
+                    rejected.append(line)
+                    continue
+                lines.append(line)
+                punches.append(punch)
+            
+            records = []
+            if punches:
+                try:
+                    records = self.service.record_punches(punches)
+                except (OperationalError, InterfaceError):
+                    raise
+                except Exception as e:
+                    print(f"Attendance Error: spooled punches could not be written ({e})")
+                    rejected.extend(lines)
+            if rejected:
+                self._reject(rejected)
+            f.seek(0)
+            f.truncate()
+        print(f"DEBUG: replayed {len(punches)} spooled punches, {len(records)} recorded, {len(rejected)} rejected")
+
+    def _reject(self, lines):
+        """Keep spool lines that can't be replayed aside, for a look by hand"""
+        with open(self.spool_path.with_name(self.spool_path.name + '.rejected'), 'a') as f:
+            f.writelines(line if line.endswith('\n') else line + '\n' for line in lines)
+
+    def _lock_file(self, f):
+        # Released when the file is closed
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+# One writer per process, shared by every recognition path
+attendance_writer = AttendanceWriter()
+
+# Normal interpreter exit and multiprocessing workers (which skip atexit)
+atexit.register(attendance_writer.flush)
+Finalize(attendance_writer, attendance_writer.flush, exitpriority=10)
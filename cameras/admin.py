@@ -22,6 +22,9 @@ class CameraAdmin(admin.ModelAdmin):
             'fields': ('name', 'location', 'status', 'is_primary')
         }),
         ('Configuration', {
-            'fields': ('stream_source',)
+            'fields': ('stream_source', 'api_key')
+        }),
+        ('Face Detection', {
+            'fields': ('detection_scale', 'detection_upsample')
         }),
     )
\ No newline at end of file
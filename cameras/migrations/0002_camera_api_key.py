@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='api_key',
+            field=models.CharField(blank=True, help_text='Device key for the recognition API', max_length=64, null=True, unique=True),
+        ),
+    ]
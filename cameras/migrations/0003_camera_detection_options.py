@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-17 06:42
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cameras', '0002_camera_api_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='detection_scale',
+            field=models.FloatField(blank=True, help_text='Resize factor applied before face detection (e.g. 0.5 for HD streams)', null=True, validators=[django.core.validators.MinValueValidator(0.1), django.core.validators.MaxValueValidator(2.0)]),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='detection_upsample',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Times the detector upsamples the image to find small faces', null=True, validators=[django.core.validators.MaxValueValidator(3)]),
+        ),
+    ]
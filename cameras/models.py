@@ -1,8 +1,11 @@
 """
 Camera Models - Multi-Tenant Isolation
 """
+from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from accounts.models import Company
+import secrets
 
 class Location(models.Model):
     """Physical locations (e.g., Gate 1, Floor 2) within a Company"""
@@ -38,6 +41,21 @@ class Camera(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     is_primary = models.BooleanField(default=False, help_text='Primary camera for attendance')
     
+    # Face detection tuning (blank = FACE_DETECTION_SCALE / FACE_DETECTION_UPSAMPLE settings)
+    detection_scale = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(0.1), MaxValueValidator(2.0)],
+        help_text='Resize factor applied before face detection (e.g. 0.5 for HD streams)'
+    )
+    detection_upsample = models.PositiveSmallIntegerField(
+        null=True, blank=True,
+        validators=[MaxValueValidator(3)],
+        help_text='Times the detector upsamples the image to find small faces'
+    )
+    
+    # Kiosk / device authentication for the recognition API (sent as X-Camera-Key)
+    api_key = models.CharField(max_length=64, unique=True, null=True, blank=True, help_text='Device key for the recognition API')
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -48,6 +66,17 @@ class Camera(models.Model):
     def __str__(self):
         return f"{self.name} - {self.location.name}"
     
+    def save(self, *args, **kwargs):
+        if not self.api_key:
+            self.api_key = secrets.token_hex(24)
+        super().save(*args, **kwargs)
+    
+    def get_detection_options(self):
+        """(scale, upsample) used for face detection on this camera's frames"""
+        scale = self.detection_scale if self.detection_scale is not None else settings.FACE_DETECTION_SCALE
+        upsample = self.detection_upsample if self.detection_upsample is not None else settings.FACE_DETECTION_UPSAMPLE
+        return scale, upsample
+    
     def get_stream_source_int(self):
         try:
             return int(self.stream_source)
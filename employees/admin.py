@@ -1,8 +1,17 @@
 """
 Employees Admin Configuration
 """
-from django.contrib import admin
+import uuid
+from pathlib import Path
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
 from django.utils.html import format_html
+from recognition.bulk_enrolment import JobStatus, start_bulk_enrolment
+from .forms import BulkEnrolmentForm
 from .models import Department, Designation, Employee
 
 @admin.register(Department)
@@ -58,4 +67,67 @@ class EmployeeAdmin(admin.ModelAdmin):
         if obj.face_image:
             return format_html('<img src="{}" width="150" height="150" />', obj.face_image.url)
         return "No image"
-    face_image_preview.short_description = 'Face Preview'
\ No newline at end of file
+    face_image_preview.short_description = 'Face Preview'
+    
+    def get_urls(self):
+        return [
+            path('bulk-enrol/', self.admin_site.admin_view(self.bulk_enrol_view), name='employees_employee_bulk_enrol'),
+            path(
+                'bulk-enrol/<str:job>/report/',
+                self.admin_site.admin_view(self.bulk_enrol_report_view),
+                name='employees_employee_bulk_enrol_report'
+            ),
+        ] + super().get_urls()
+    
+    def bulk_enrol_view(self, request):
+        """Upload a CSV + zip of faces; the import runs in its own process"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        
+        form = BulkEnrolmentForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            job = uuid.uuid4().hex
+            job_dir = Path(settings.FACE_ENROLMENT_UPLOAD_DIR) / job
+            job_dir.mkdir(parents=True)
+            for field, name in (('employees_csv', 'employees.csv'), ('images_zip', 'faces.zip')):
+                with open(job_dir / name, 'wb') as f:
+                    for chunk in form.cleaned_data[field].chunks():
+                        f.write(chunk)
+            
+            start_bulk_enrolment(form.cleaned_data['company'], job_dir)
+            report_url = reverse('admin:employees_employee_bulk_enrol_report', args=[job])
+            messages.success(request, format_html(
+                'Bulk enrolment started. The <a href="{}">per-row report</a> is available once it finishes.', report_url
+            ))
+            return redirect('admin:employees_employee_changelist')
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'form': form,
+            'opts': self.model._meta,
+            'title': 'Bulk enrol employees',
+        }
+        return render(request, 'admin/employees/employee/bulk_enrol.html', context)
+    
+    def bulk_enrol_report_view(self, request, job):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        if not job.isalnum():
+            raise Http404
+        job_dir = Path(settings.FACE_ENROLMENT_UPLOAD_DIR) / job
+        report = job_dir / 'report.csv'
+        if report.exists():
+            return FileResponse(open(report, 'rb'), as_attachment=True, filename=f'bulk_enrolment_{job}.csv')
+        if not job_dir.is_dir():
+            raise Http404
+        
+        status = JobStatus.read(job_dir / 'status.json')
+        if status is None or status['abandoned']:
+            messages.error(
+                request,
+                'Bulk enrolment stopped without a report (its process died). '
+                'Upload the same files again to resume it; finished employees are skipped.'
+            )
+        else:
+            messages.info(request, f"Bulk enrolment still running ({status['message']}), try again in a moment.")
+        return redirect('admin:employees_employee_changelist')
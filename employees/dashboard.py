@@ -0,0 +1,80 @@
+"""
+Dashboard Snapshot
+The per-company numbers on the dashboard, computed with one aggregate query
+per model and kept in the cache (settings.CACHES) until a write changes them.
+
+Like the gallery's GalleryVersion, each company has a generation number in
+the cache: employee and attendance writes bump it (invalidate_dashboard) and
+snapshots are stored under the generation they were computed at, so a
+snapshot computed while a write was committing can't outlive that write.
+DASHBOARD_CACHE_TIMEOUT bounds the age of a snapshot regardless.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Employee
+from attendance.models import AttendanceRecord, DailyAttendanceSummary
+
+
+def _generation_key(company_id):
+    return f'dashboard-generation:{company_id}'
+
+
+def invalidate_dashboard(company_id):
+    """Called after a write that changes a company's dashboard numbers"""
+    key = _generation_key(company_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_dashboard_snapshot(company):
+    """Dashboard numbers and lists for a company (cached)"""
+    today = timezone.localdate()
+    generation = cache.get_or_set(_generation_key(company.pk), 0, None)
+    key = f'dashboard:{company.pk}:{today.isoformat()}:{generation}'
+    
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = compute_dashboard_snapshot(company, today)
+        cache.set(key, snapshot, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+    return snapshot
+
+
+def compute_dashboard_snapshot(company, today):
+    """One aggregate query per model, plus the two short lists"""
+    active = Q(status='active')
+    employees = Employee.objects.filter(company=company).aggregate(
+        total_employees=Count('pk', filter=active),
+        face_registered=Count('pk', filter=active & Q(is_face_registered=True)),
+    )
+    
+    # Today's attendance (Filtered by Company via Employee)
+    attendance = DailyAttendanceSummary.objects.filter(
+        employee__company=company,
+        date=today
+    ).aggregate(today_present=Count('pk', filter=Q(is_present=True)))
+    
+    # Recent attendance records (Filtered by Company)
+    recent_records = list(AttendanceRecord.objects.filter(
+        employee__company=company
+    ).select_related(
+        'employee', 'camera'
+    ).order_by('-timestamp')[:10])
+    
+    # Employees without face registration (Filtered by Company)
+    pending_registration = list(Employee.objects.filter(
+        company=company,
+        status='active',
+        is_face_registered=False
+    ).select_related('department')[:5])
+    
+    return {
+        **employees,
+        **attendance,
+        'recent_records': recent_records,
+        'pending_registration': pending_registration,
+    }
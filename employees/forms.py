@@ -1,7 +1,9 @@
 """
 Employee Forms - Multi-Tenant Aware
 """
+import zipfile
 from django import forms
+from accounts.models import Company
 from .models import Employee, Department, Designation
 
 class EmployeeRegistrationForm(forms.ModelForm):
@@ -58,4 +60,24 @@ class EmployeeRegistrationForm(forms.ModelForm):
         employee.company = self.user.company
         if commit:
             employee.save()
-        return employee
\ No newline at end of file
+        return employee
+
+class BulkEnrolmentForm(forms.Form):
+    """Admin upload for recognition/bulk_enrolment.py"""
+    company = forms.ModelChoiceField(queryset=Company.objects.order_by('name'))
+    employees_csv = forms.FileField(
+        label='Employees CSV',
+        help_text='employee_id, first_name, last_name, email, date_of_joining; optional phone, '
+                  'department, designation (codes), status, image (file name in the zip)'
+    )
+    images_zip = forms.FileField(
+        label='Face images (zip)',
+        help_text='One photo per employee, named <employee_id>.jpg/.jpeg/.png unless the CSV has an image column'
+    )
+
+    def clean_images_zip(self):
+        images = self.cleaned_data['images_zip']
+        if not zipfile.is_zipfile(images):
+            raise forms.ValidationError('Not a zip file.')
+        images.seek(0)
+        return images
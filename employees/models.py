@@ -91,4 +91,4 @@ class Employee(models.Model):
     
     def get_encoding_filename(self):
         # Namespace encodings by company ID to prevent collisions
-        return f"face_encodings/{self.company.id}/{self.employee_id}.npy"
\ No newline at end of file
+        return f"face_encodings/{self.company_id}/{self.employee_id}.npy"
\ No newline at end of file
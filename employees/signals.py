@@ -0,0 +1,37 @@
+"""
+Dashboard invalidation signals
+Employee and attendance changes made through the ORM bump the company's
+dashboard generation once committed (bulk punch writes do it themselves,
+see AttendanceService.apply_punches_to_summaries).
+
+Attendance records have no delete receiver, so an employee or company delete
+removes their punches in one fast DELETE; the employee's own receiver covers
+the dashboard. Records deleted directly (admin) invalidate it themselves,
+see AttendanceRecordAdmin.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import Company
+from attendance.models import AttendanceRecord
+from .dashboard import invalidate_dashboard
+from .models import Employee
+
+def _invalidate_after_commit(company_id):
+    transaction.on_commit(lambda: invalidate_dashboard(company_id))
+
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, **kwargs):
+    _invalidate_after_commit(instance.company_id)
+
+@receiver(post_delete, sender=Employee)
+def employee_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Company) or (isinstance(origin, QuerySet) and origin.model is Company):
+        # Cascade of a company deletion, its dashboard goes with it
+        return
+    _invalidate_after_commit(instance.company_id)
+
+@receiver(post_save, sender=AttendanceRecord)
+def attendance_record_saved(sender, instance, **kwargs):
+    _invalidate_after_commit(instance.employee.company_id)
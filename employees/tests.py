@@ -1,3 +1,82 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from .models import Employee
+from accounts.models import Company, User
+from attendance.models import AttendanceRecord
+from attendance.services import AttendanceService
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardSnapshotTests(TestCase):
+    """Dashboard numbers come from the cache until an employee or attendance write"""
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            name='Gatehouse', slug='gatehouse', contact_email='ops@example.com', is_verified=True
+        )
+        self.user = User.objects.create_user('boss', password='pw', company=self.company)
+        self.client.force_login(self.user)
+        self.employee = self.add_employee('EMP001')
+
+    def add_employee(self, employee_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Employee.objects.create(
+                company=self.company, employee_id=employee_id, first_name='Dana', last_name='Ray',
+                email=f'{employee_id}@example.com', date_of_joining='2024-01-01'
+            )
+
+    def dashboard(self):
+        return self.client.get(reverse('dashboard')).context
+
+    def test_snapshot_is_cached_until_a_write(self):
+        context = self.dashboard()
+        self.assertEqual(context['total_employees'], 1)
+        self.assertEqual(context['today_present'], 0)
+
+        # Cached: only the session, user and company lookups hit the database
+        with self.assertNumQueries(3):
+            self.dashboard()
+
+        self.add_employee('EMP002')
+        self.assertEqual(self.dashboard()['total_employees'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceService().mark_attendance(self.employee, 95.0, 0.3)
+        context = self.dashboard()
+        self.assertEqual(context['today_present'], 1)
+        self.assertEqual(len(context['recent_records']), 1)
+
+    def add_punches(self, employee, count):
+        AttendanceRecord.objects.bulk_create([
+            AttendanceRecord(employee=employee, punch_type='IN', confidence_score=95.0, face_distance=0.3)
+            for _ in range(count)
+        ])
+
+    def test_punches_are_fast_deleted(self):
+        # No per-punch delete signal: the cascade costs the same for 1 or 60 punches
+        few, many = self.add_employee('EMP002'), self.add_employee('EMP003')
+        self.add_punches(few, 1)
+        self.add_punches(many, 60)
+        query_counts = []
+        for employee in (few, many):
+            with CaptureQueriesContext(connection) as queries:
+                employee.delete()
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_admin_punch_delete_invalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceService().mark_attendance(self.employee, 95.0, 0.3)
+        self.assertEqual(len(self.dashboard()['recent_records']), 1)
+
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw', company=self.company))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:attendance_attendancerecord_changelist'), {
+                'action': 'delete_selected', 'post': 'yes',
+                '_selected_action': list(AttendanceRecord.objects.values_list('pk', flat=True)),
+            })
+        self.assertFalse(AttendanceRecord.objects.exists())
+        self.assertEqual(len(self.dashboard()['recent_records']), 0)
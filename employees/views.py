@@ -4,16 +4,16 @@ Employee Management Views - Multi-Tenant Aware
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count, Q
+from django.db.models import Q
 from django.core.files.base import ContentFile
 import base64
 import os
-from datetime import date
 
 from .models import Employee, Department, Designation
 from .forms import EmployeeRegistrationForm
 from recognition.encoding_manager import EncodingManager
 from attendance.models import AttendanceRecord, DailyAttendanceSummary
+from .dashboard import get_dashboard_snapshot
 
 @login_required
 def dashboard(request):
@@ -30,39 +30,14 @@ def dashboard(request):
         return render(request, 'accounts/pending_approval.html')
 
     company = request.user.company
-    today = date.today()
     
-    # Statistics (Filtered by Company)
-    total_employees = Employee.objects.filter(company=company, status='active').count()
-    face_registered = Employee.objects.filter(company=company, status='active', is_face_registered=True).count()
-    
-    # Today's attendance (Filtered by Company via Employee)
-    today_present = DailyAttendanceSummary.objects.filter(
-        employee__company=company,
-        date=today,
-        is_present=True
-    ).count()
-    
-    # Recent attendance records (Filtered by Company)
-    recent_records = AttendanceRecord.objects.filter(
-        employee__company=company
-    ).select_related(
-        'employee', 'camera'
-    ).order_by('-timestamp')[:10]
-    
-    # Employees without face registration (Filtered by Company)
-    pending_registration = Employee.objects.filter(
-        company=company,
-        status='active',
-        is_face_registered=False
-    )[:5]
+    # Statistics (Filtered by Company), cached until an employee/attendance write
+    snapshot = get_dashboard_snapshot(company)
+    total_employees = snapshot['total_employees']
+    face_registered = snapshot['face_registered']
     
     context = {
-        'total_employees': total_employees,
-        'face_registered': face_registered,
-        'today_present': today_present,
-        'recent_records': recent_records,
-        'pending_registration': pending_registration,
+        **snapshot,
         'registration_percentage': (face_registered / total_employees * 100) if total_employees > 0 else 0,
         'company_name': company.name
     }
@@ -149,8 +124,7 @@ def employee_register(request):
                 )
                 
                 if success:
-                    # Update cache (for this company)
-                    encoding_manager.refresh_cache(company_id=request.user.company.id)
+                    # Serving workers pick up the new face via the GalleryVersion bump (recognition.signals)
                     messages.success(request, f'Employee {employee.employee_id} registered successfully!')
                 else:
                     messages.warning(request, f'Registered, but face error: {error_message}')
@@ -222,12 +196,9 @@ def employee_delete(request, employee_id):
                 print(f"Error deleting encoding file: {e}")
                 
         # 3. Delete database record
+        # (post_delete bumps the company's GalleryVersion so workers drop the face)
         employee.delete()
         
-        # 4. Refresh Cache for this company
-        encoding_manager = EncodingManager()
-        encoding_manager.refresh_cache(company_id=request.user.company.id)
-        
         messages.success(request, f"Employee {employee_id} deleted successfully.")
         return redirect('employee_list')
         
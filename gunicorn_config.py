@@ -1,4 +1,5 @@
 import multiprocessing
+import os
 
 # Bind to all interfaces on port 8000
 bind = "0.0.0.0:8000"
@@ -6,11 +7,23 @@ bind = "0.0.0.0:8000"
 # Worker Configuration
 # Face recognition is CPU bound. Don't spawn too many workers or they will fight for CPU.
 # Formula: (2 x num_cores) + 1 usually, but for heavy ML tasks, 1 worker per core is safer.
-workers = multiprocessing.cpu_count() 
+# With FACE_EXECUTOR_WORKERS > 0 recognition runs in each web worker's process pool,
+# so keep WEB_CONCURRENCY x FACE_EXECUTOR_WORKERS <= cores (e.g. 2 x (cores / 2)).
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
 
 # Use threads for handling concurrent requests within a worker
+# (a frame being recognized inline doesn't hold up the dashboard, exports or admin)
+# Run with: gunicorn -c gunicorn_config.py FaceCognitionPlatform.wsgi:application
+# The /recognition/ws/ streaming socket is served by a separate ASGI process,
+# see gunicorn_stream_config.py.
 threads = 2
 
+# Warm start: load the app (and, below, the dlib models + encoding galleries) once
+# in the master before forking, so workers share that memory copy-on-write and
+# the first request after a deploy/recycle doesn't pay for it.
+# Set GUNICORN_PRELOAD=0 to load per worker instead (e.g. to reload code with HUP).
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
 # Timeout configuration
 # ML tasks might take longer than standard requests
 timeout = 120 
@@ -22,4 +35,39 @@ errorlog = "-"
 loglevel = "info"
 
 # Process Naming
-proc_name = "face_cognition_app"
\ No newline at end of file
+proc_name = "face_cognition_app"
+
+
+# Server Hooks
+def when_ready(server):
+    """Master, before the workers are forked: warm up the preloaded app"""
+    if not server.cfg.preload_app:
+        return
+    from recognition.executor import recognition_executor
+    if recognition_executor.enabled:
+        # Recognition runs in each worker's executor processes, nothing to share
+        return
+    from django.db import connections
+    from recognition.pipeline import warm_up
+    warm_up()
+    # Forked workers must not share the master's DB connections
+    connections.close_all()
+    server.log.info("Recognition models and encoding galleries preloaded")
+
+
+def post_worker_init(worker):
+    """Worker, app loaded but not accepting traffic yet: finish warming up"""
+    from recognition.executor import recognition_executor
+    from recognition.pipeline import is_warm, warm_up
+    if recognition_executor.enabled:
+        # Executor workers are spawned per web worker (after fork)
+        recognition_executor.start()
+    elif not is_warm():
+        warm_up()
+    worker.log.info("Worker ready for recognition")
+
+
+def worker_exit(server, worker):
+    """Worker shutting down: write the attendance punches still queued"""
+    from attendance.writer import attendance_writer
+    attendance_writer.flush()
@@ -0,0 +1,19 @@
+# Streaming recognition socket (/recognition/ws/) only, next to the WSGI app
+# Run with: gunicorn -c gunicorn_stream_config.py FaceCognitionPlatform.asgi:application
+# Same timeouts, logging, warm start and hooks as the HTTP app (gunicorn_config.py);
+# nginx sends /recognition/ws/ here and everything else to port 8000.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gunicorn_config import *  # noqa: E402,F401,F403
+
+bind = os.environ.get('STREAM_BIND', "0.0.0.0:8001")
+
+# Each socket's frames are recognized off the event loop (FACE_EXECUTOR_WORKERS
+# or a thread), so a single uvicorn worker carries many cameras.
+workers = int(os.environ.get('STREAM_CONCURRENCY', 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+proc_name = "face_cognition_stream"
@@ -0,0 +1,389 @@
+"""
+Bulk Employee Enrolment
+Onboards a whole company from a CSV of employees plus their face images
+(a directory or a zip file):
+
+- Rows are validated up front and new employees are inserted with one
+  bulk_create per batch (employees that already exist are kept as they are).
+- Faces are encoded in a process pool (FACE_ENROLMENT_WORKERS); workers open
+  the image source themselves, only file names and encodings cross processes.
+- Every row gets an outcome (enrolled / skipped / failed, with the reason),
+  written to a report CSV.
+- Resumable: employees with a registered face are skipped and face fields are
+  saved batch by batch, so an interrupted or partly failed import is re-run
+  as is (after fixing the failed rows).
+- The company's packed store is rewritten once at the end, one GalleryVersion
+  bump (one gallery reload per worker) instead of one per employee.
+- Admin uploads run as a separate `manage.py bulk_enrol` process, never in a
+  web worker; it keeps a status file (JobStatus) with its progress and a
+  heartbeat, so a job whose process died is reported as such.
+
+CSV columns: employee_id, first_name, last_name, email, date_of_joining
+(YYYY-MM-DD), and optionally phone, department / designation (codes), status
+and image (file name; defaults to <employee_id>.jpg/.jpeg/.png).
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from employees.dashboard import invalidate_dashboard
+from employees.models import Department, Designation, Employee
+from .encoding_manager import EncodingManager
+from .face_engine import FaceEngine
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+REPORT_FIELDS = ['line', 'employee_id', 'status', 'message']
+# Saved per batch of encoded faces
+FACE_FIELDS = ['face_image', 'face_encoding_path', 'is_face_registered', 'updated_at']
+# Seconds between job status heartbeats; a running job silent for JOB_ABANDONED_AFTER has died
+JOB_HEARTBEAT = 10
+JOB_ABANDONED_AFTER = 60
+
+
+class ImageSource:
+    """Face images in a directory or a zip file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._zip = None if self.path.is_dir() else zipfile.ZipFile(self.path)
+        self._names = None
+
+    def names(self):
+        """Member paths of every file in the source"""
+        if self._names is None:
+            if self._zip is not None:
+                self._names = [name for name in self._zip.namelist() if not name.endswith('/')]
+            else:
+                self._names = [p.relative_to(self.path).as_posix() for p in self.path.rglob('*') if p.is_file()]
+            # File name / employee id (any case) -> member path; the first one found wins
+            self._by_name, self._by_stem = {}, {}
+            for name in self._names:
+                base = name.rsplit('/', 1)[-1]
+                stem, ext = os.path.splitext(base)
+                self._by_name.setdefault(base, name)
+                if ext.lower() in IMAGE_EXTENSIONS:
+                    self._by_stem.setdefault(stem.upper(), name)
+        return self._names
+
+    def find(self, employee_id, image=None):
+        """Member path of an employee's image, or None"""
+        self.names()
+        if image:
+            return self._by_name.get(image.replace('\\', '/').rsplit('/', 1)[-1])
+        return self._by_stem.get(employee_id.upper())
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+        return (self.path / name).read_bytes()
+
+
+# Pool workers keep their image sources open between jobs
+_worker_sources = {}
+
+
+def encode_image(source_path, name):
+    """
+    Pool job: (encoding, None) for a one-face image, or (None, error).
+    Same rules as EncodingManager.save_employee_encoding.
+    """
+    source = _worker_sources.get(source_path)
+    if source is None:
+        source = _worker_sources[source_path] = ImageSource(source_path)
+    try:
+        data = source.read(name)
+    except (OSError, KeyError) as e:
+        return None, f"Unreadable image: {e}"
+
+    encoding, face_count = FaceEngine().encode_face_from_file(io.BytesIO(data))
+    if face_count == 0:
+        return None, "No face detected."
+    if face_count > 1:
+        return None, "Multiple faces detected."
+    if encoding is None:
+        return None, "Unable to encode face."
+    return encoding, None
+
+
+class BulkEnrolment:
+    """One import of CSV rows + face images into a company"""
+
+    def __init__(self, company, images, workers=None, batch_size=None, log=None):
+        self.company = company
+        self.source = ImageSource(images)
+        self.workers = workers if workers is not None else getattr(settings, 'FACE_ENROLMENT_WORKERS', os.cpu_count() or 1)
+        self.batch_size = batch_size or getattr(settings, 'FACE_ENROLMENT_BATCH_SIZE', 500)
+        self.log = log or (lambda message: None)
+        self.manager = EncodingManager()
+        # One {line, employee_id, status, message} per CSV row
+        self.results = []
+
+    def run(self, rows):
+        """Import csv.DictReader rows; returns the per-row results"""
+        employees = self._create_employees(self._validate(rows))
+        enrolled = self._encode_faces(employees)
+
+        if enrolled:
+            # One store rewrite and one generation bump for the whole import
+            self.manager.pack_company(self.company.pk)
+        invalidate_dashboard(self.company.pk)
+
+        counts = self.counts()
+        self.log(f"Done. {counts['enrolled']} enrolled, {counts['skipped']} already enrolled, {counts['failed']} failed.")
+        return self.results
+
+    def counts(self):
+        counts = {'enrolled': 0, 'skipped': 0, 'failed': 0}
+        for result in self.results:
+            counts[result['status']] += 1
+        return counts
+
+    def _validate(self, rows):
+        """Returns [(result, unsaved Employee, image column)] of the valid rows; the rest are failed"""
+        departments = {d.code: d for d in Department.objects.filter(company=self.company)}
+        designations = {d.code: d for d in Designation.objects.filter(company=self.company)}
+        seen = set()
+        valid = []
+
+        # Line 1 is the header
+        for line, row in enumerate(rows, start=2):
+            # Cells beyond the header (key None) are ignored
+            row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+            employee_id = row.get('employee_id', '')
+            result = {'line': line, 'employee_id': employee_id, 'status': 'failed', 'message': ''}
+            self.results.append(result)
+
+            if employee_id in seen:
+                result['message'] = "Duplicate employee_id in the CSV."
+                continue
+            seen.add(employee_id)
+            try:
+                employee = self._build_employee(row, departments, designations)
+            except ValidationError as e:
+                result['message'] = _error_message(e)
+                continue
+            valid.append((result, employee, row.get('image')))
+        return valid
+
+    def _build_employee(self, row, departments, designations):
+        department = designation = None
+        if row.get('department'):
+            department = departments.get(row['department'])
+            if department is None:
+                raise ValidationError(f"Unknown department code {row['department']}.")
+        if row.get('designation'):
+            designation = designations.get(row['designation'])
+            if designation is None:
+                raise ValidationError(f"Unknown designation code {row['designation']}.")
+
+        employee = Employee(
+            company=self.company,
+            employee_id=row.get('employee_id', ''),
+            first_name=row.get('first_name', ''),
+            last_name=row.get('last_name', ''),
+            email=row.get('email', ''),
+            phone=row.get('phone') or None,
+            department=department,
+            designation=designation,
+            date_of_joining=row.get('date_of_joining') or None,
+            status=row.get('status') or 'active',
+        )
+        # Uniqueness is settled by the batched lookups; foreign keys were resolved above
+        employee.full_clean(exclude=['company', 'department', 'designation', 'face_image'], validate_unique=False)
+        return employee
+
+    def _create_employees(self, valid):
+        """
+        bulk_create the new employees, one batch at a time.
+        Returns [(result, saved Employee, image name)] still needing a face.
+        """
+        pending = []
+        for start in range(0, len(valid), self.batch_size):
+            batch = valid[start:start + self.batch_size]
+            employee_ids = [employee.employee_id for result, employee, image in batch]
+            with transaction.atomic():
+                existing = set(Employee.objects.filter(
+                    company=self.company, employee_id__in=employee_ids
+                ).values_list('employee_id', flat=True))
+                # No post_save signals: no per-employee gallery journal entries
+                Employee.objects.bulk_create(
+                    [employee for result, employee, image in batch if employee.employee_id not in existing],
+                    ignore_conflicts=True
+                )
+            saved = {
+                employee.employee_id: employee
+                for employee in Employee.objects.filter(company=self.company, employee_id__in=employee_ids)
+            }
+
+            for result, employee, image in batch:
+                stored = saved.get(employee.employee_id)
+                if stored is None:
+                    result['message'] = "Could not be created."
+                elif stored.is_face_registered:
+                    result['status'] = 'skipped'
+                    result['message'] = "Face already registered."
+                else:
+                    name = self.source.find(stored.employee_id, image)
+                    if name is None:
+                        result['message'] = "Employee saved, face image not found."
+                    else:
+                        pending.append((result, stored, name))
+            self.log(f"{min(start + self.batch_size, len(valid))}/{len(valid)} rows saved")
+        return pending
+
+    def _encode_faces(self, pending):
+        """Encode the pending faces in the pool; face fields are saved per batch"""
+        if not pending:
+            return 0
+        names = [name for result, employee, name in pending]
+        pool = None
+        if self.workers > 0:
+            # spawn: fresh workers (no forked DB connections), set up with the same settings
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            )
+            outcomes = pool.map(encode_image, repeat(str(self.source.path)), names, chunksize=4)
+        else:
+            outcomes = map(encode_image, repeat(str(self.source.path)), names)
+
+        enrolled, batch = 0, []
+        try:
+            for (result, employee, name), (encoding, error) in zip(pending, outcomes):
+                if error:
+                    result['message'] = f"Employee saved, {error}"
+                    continue
+                self._save_face(employee, name, encoding)
+                result['status'] = 'enrolled'
+                batch.append(employee)
+                enrolled += 1
+                if len(batch) >= self.batch_size:
+                    Employee.objects.bulk_update(batch, FACE_FIELDS)
+                    batch = []
+                    self.log(f"{enrolled}/{len(pending)} faces enrolled")
+        finally:
+            # Interrupted imports keep every finished face
+            if batch:
+                Employee.objects.bulk_update(batch, FACE_FIELDS)
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return enrolled
+
+    def _save_face(self, employee, name, encoding):
+        encoding_path = self.manager.get_encoding_path(employee)
+        self.manager.face_engine.save_encoding(encoding, encoding_path)
+        extension = os.path.splitext(name)[1].lower()
+        employee.face_image.save(
+            f'{employee.employee_id}_face{extension}', ContentFile(self.source.read(name)), save=False
+        )
+        employee.face_encoding_path = str(encoding_path)
+        employee.is_face_registered = True
+        # bulk_update skips auto_now
+        employee.updated_at = timezone.now()
+
+
+def _error_message(error):
+    if hasattr(error, 'error_dict'):
+        return ' '.join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+def read_rows(csv_path):
+    """CSV rows as dicts (tolerates the BOM spreadsheet programs write)"""
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+
+def write_report(results, path):
+    """Per-row outcomes as CSV"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+class JobStatus:
+    """
+    Status file of a background import: state (running / done / failed), the
+    latest progress message and a heartbeat refreshed every JOB_HEARTBEAT
+    seconds by the import process.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.state = 'running'
+        self.message = ''
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def update(self, state=None, message=None):
+        with self._lock:
+            self.state = state or self.state
+            self.message = self.message if message is None else message
+            # Written aside and renamed, so readers never see half a file
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_text(json.dumps({'state': self.state, 'message': self.message, 'heartbeat': time.time()}))
+            os.replace(tmp, self.path)
+
+    def start_heartbeat(self):
+        def beat():
+            while not self._stopping.wait(JOB_HEARTBEAT):
+                self.update()
+
+        self.update()
+        threading.Thread(target=beat, name='bulk-enrolment-heartbeat', daemon=True).start()
+
+    def stop_heartbeat(self):
+        self._stopping.set()
+
+    @staticmethod
+    def read(path):
+        """Status dict, with 'abandoned' set if a running job stopped beating; None if there is none"""
+        try:
+            status = json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return None
+        status['abandoned'] = status['state'] == 'running' and time.time() - status['heartbeat'] > JOB_ABANDONED_AFTER
+        return status
+
+
+def start_bulk_enrolment(company, job_dir):
+    """
+    Run an admin upload (job_dir/employees.csv + faces.zip) as a separate
+    `manage.py bulk_enrol` process. It writes job_dir/report.csv when it ends
+    and keeps job_dir/status.json current; its output goes to job_dir/output.log.
+    """
+    job_dir = Path(job_dir)
+    # Until the process takes over: a job that never starts is abandoned after JOB_ABANDONED_AFTER
+    JobStatus(job_dir / 'status.json').update(message="Starting")
+    command = [
+        sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'bulk_enrol',
+        str(job_dir / 'employees.csv'), str(job_dir / 'faces.zip'),
+        '--company', str(company.pk),
+        '--report', str(job_dir / 'report.csv'),
+        '--status', str(job_dir / 'status.json'),
+    ]
+    with open(job_dir / 'output.log', 'ab') as output:
+        # Own session: the import outlives a web worker restart
+        return subprocess.Popen(
+            command, cwd=settings.BASE_DIR, stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT,
+            start_new_session=True
+        )
@@ -2,11 +2,311 @@
 Face Encoding Manager
 Handles loading, caching, and managing employee face encodings
 """
+import threading
+import time
+from contextlib import contextmanager
 import numpy as np
 from pathlib import Path
 from django.conf import settings
 from employees.models import Employee
 from .face_engine import FaceEngine
+from .models import GalleryEvent, GalleryVersion
+from .indexes import build_index, squared_distances
+from .encoding_store import ENCODING_DIM, EncodingStore
+
+# Compact once tombstones exceed this many rows (or a quarter of the gallery)
+COMPACT_MIN_TOMBSTONES = 64
+
+class GalleryState:
+    """
+    One version of a CompanyGallery: row arrays, employee row map and index.
+    Row i of `matrix` is the encoding of `employee_ids[i]`.
+    
+    A state is never modified once published. Writers change a `copy()`,
+    which shares the matrix buffer: rows are only ever appended past `size`,
+    where no published state looks, and re-enrolments append a new row.
+    """
+    
+    def __init__(self, matrix, sq_norms, ids, size, rows, tombstones=0, store_epoch=None, index=None):
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+        self._ids = ids
+        self.size = size
+        self.rows = rows
+        self.tombstones = tombstones
+        self.store_epoch = store_epoch
+        self.index = index
+    
+    @property
+    def matrix(self):
+        return self._matrix[:self.size]
+    
+    @property
+    def sq_norms(self):
+        return self._sq_norms[:self.size]
+    
+    @property
+    def employee_ids(self):
+        return self._ids[:self.size]
+    
+    def copy(self):
+        """Private copy for a writer (the matrix buffer is shared, see above)"""
+        state = GalleryState(
+            self._matrix, self._sq_norms.copy(), self._ids.copy(), self.size,
+            dict(self.rows), self.tombstones, self.store_epoch, self.index.copy()
+        )
+        state.index.rebind(state.matrix, state.sq_norms)
+        return state
+    
+    def _grow(self):
+        """Double the spare capacity (amortized O(1) appends) into a private buffer"""
+        capacity = max(16, 2 * len(self._matrix))
+        matrix = np.zeros((capacity, ENCODING_DIM), dtype=np.float32)
+        sq_norms = np.full(capacity, np.inf, dtype=np.float32)
+        ids = np.empty(capacity, dtype=object)
+        matrix[:self.size] = self.matrix
+        sq_norms[:self.size] = self.sq_norms
+        ids[:self.size] = self.employee_ids
+        self._matrix, self._sq_norms, self._ids = matrix, sq_norms, ids
+    
+    def append(self, employee_id, encoding):
+        if not self._matrix.flags.writeable:
+            # Read-only store mapping: detach onto a private copy
+            self._grow()
+            self.store_epoch = None
+        elif self.size == len(self._matrix):
+            self._grow()
+        
+        row = self.size
+        self._matrix[row] = encoding
+        self.size += 1
+        self.index.rebind(self.matrix, self.sq_norms)
+        self._register_row(employee_id, row, encoding.dot(encoding))
+    
+    def register_rows(self, start, employee_ids, live_ids=None):
+        """Make rows [start, start + len(employee_ids)) searchable; later rows win"""
+        block = self._matrix[start:start + len(employee_ids)]
+        block_sq_norms = np.einsum('ij,ij->i', block, block)
+        for offset, employee_id in enumerate(employee_ids):
+            if live_ids is not None and employee_id not in live_ids:
+                self.tombstones += 1
+                continue
+            self._register_row(employee_id, start + offset, block_sq_norms[offset])
+    
+    def _register_row(self, employee_id, row, sq_norm):
+        self.remove(employee_id)
+        self.rows[employee_id] = row
+        self._ids[row] = employee_id
+        self._sq_norms[row] = sq_norm
+        if self.index is not None:
+            self.index.add(row)
+    
+    def remove(self, employee_id):
+        """Tombstone an employee's row (id None, infinite norm)"""
+        row = self.rows.pop(employee_id, None)
+        if row is None:
+            return False
+        self._ids[row] = None
+        self._sq_norms[row] = np.inf
+        self.tombstones += 1
+        if self.index is not None:
+            self.index.remove(row)
+        return True
+
+class CompanyGallery:
+    """
+    Prebuilt matching structure for one company.
+    `index` is the search backend (exact scan or IVF, see indexes.py).
+    
+    Searches take no lock: they read `_state` (a GalleryState) once and use
+    only that. Updates are copy-on-write: new employees are appended into
+    spare capacity, re-enrolled and removed employees leave tombstones
+    until the gallery compacts, and the changed copy is published with a
+    single assignment. `edit()` batches several changes into one copy.
+    
+    A gallery built with `from_store` searches the packed store's shared
+    memmap directly; `store_epoch` is then set and new rows appended to the
+    store are picked up with `attach_store_rows` instead of being copied.
+    """
+    
+    def __init__(self, employee_ids, encodings, index_options=None):
+        self.index_options = index_options or {}
+        self._write_lock = threading.RLock()
+        self._draft = None
+        self._state = self._build(list(employee_ids), encodings)
+    
+    @classmethod
+    def from_store(cls, header, matrix, store_ids, live_ids, index_options=None):
+        """
+        Gallery over a packed store mapping (no copy of the encodings).
+        Only the last row of each employee in `live_ids` is searchable.
+        """
+        gallery = cls.__new__(cls)
+        gallery.index_options = index_options or {}
+        gallery._write_lock = threading.RLock()
+        gallery._draft = None
+        state = GalleryState(
+            matrix,
+            np.full(len(matrix), np.inf, dtype=np.float32),
+            np.empty(len(matrix), dtype=object),
+            len(store_ids),
+            {},
+            store_epoch=header['epoch']
+        )
+        state.register_rows(0, store_ids, live_ids)
+        state.index = build_index(state.matrix, state.sq_norms, **gallery.index_options)
+        gallery._state = state
+        return gallery
+    
+    def _build(self, employee_ids, encodings):
+        matrix = np.ascontiguousarray(np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM))
+        # ||x||^2 per row, so a query needs just one matrix-vector product
+        sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+        ids = np.empty(len(matrix), dtype=object)
+        ids[:] = employee_ids
+        
+        state = GalleryState(
+            matrix, sq_norms, ids, len(matrix),
+            {employee_id: row for row, employee_id in enumerate(employee_ids)}
+        )
+        state.index = build_index(state.matrix, state.sq_norms, **self.index_options)
+        return state
+    
+    @contextmanager
+    def edit(self):
+        """
+        Apply the changes made inside the block as one published version.
+        Yields the private state being changed; searches keep using the
+        previous version until the block exits.
+        """
+        with self._write_lock:
+            if self._draft is not None:
+                # Nested edit: part of the enclosing one
+                yield self._draft
+                return
+            self._draft = self._state.copy()
+            try:
+                yield self._draft
+                state = self._draft
+                # Store-backed galleries keep sharing the mapping; the store is compacted by pack_encodings
+                if state.store_epoch is None and state.tombstones > max(COMPACT_MIN_TOMBSTONES, state.size // 4):
+                    state = self._compacted(state)
+                self._state = state
+            finally:
+                self._draft = None
+    
+    def attach_store_rows(self, matrix, employee_ids):
+        """
+        Register rows the writer appended to the backing store after this
+        gallery was built. `matrix` is the (possibly remapped) store mapping.
+        """
+        with self.edit() as state:
+            if len(matrix) > len(state._sq_norms):
+                # Store capacity grew: widen the private per-row arrays to match
+                sq_norms = np.full(len(matrix), np.inf, dtype=np.float32)
+                ids = np.empty(len(matrix), dtype=object)
+                sq_norms[:state.size] = state.sq_norms
+                ids[:state.size] = state.employee_ids
+                state._sq_norms, state._ids = sq_norms, ids
+            state._matrix = matrix
+            start = state.size
+            state.size += len(employee_ids)
+            state.index.rebind(state.matrix, state.sq_norms)
+            state.register_rows(start, employee_ids)
+    
+    @property
+    def matrix(self):
+        return self._state.matrix
+    
+    @property
+    def sq_norms(self):
+        return self._state.sq_norms
+    
+    @property
+    def employee_ids(self):
+        return self._state.employee_ids
+    
+    @property
+    def rows(self):
+        return self._state.rows
+    
+    @property
+    def size(self):
+        return self._state.size
+    
+    @property
+    def store_epoch(self):
+        return self._state.store_epoch
+    
+    @property
+    def index(self):
+        return self._state.index
+    
+    def __len__(self):
+        return len(self._state.rows)
+    
+    def __contains__(self, employee_id):
+        return employee_id in self._state.rows
+    
+    def upsert(self, employee_id, encoding):
+        """Add an employee's encoding, or replace it if already present"""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIM)
+        with self.edit() as state:
+            state.append(employee_id, encoding)
+    
+    def remove(self, employee_id):
+        """Tombstone an employee's row. Returns False if it wasn't present."""
+        with self._write_lock:
+            if self._draft is None and employee_id not in self._state.rows:
+                return False
+            with self.edit() as state:
+                return state.remove(employee_id)
+    
+    def _compacted(self, state):
+        live_rows = sorted(state.rows.values())
+        return self._build(state._ids[live_rows].tolist(), state._matrix[live_rows])
+    
+    def compact(self):
+        """Rebuild without tombstones (also retrains an IVF index)"""
+        with self._write_lock:
+            if self._draft is not None:
+                self._draft = self._compacted(self._draft)
+            else:
+                self._state = self._compacted(self._state)
+    
+    def distances(self, encoding):
+        """Euclidean distance from `encoding` to every row of the gallery (exact)"""
+        state = self._state
+        query = np.asarray(encoding, dtype=np.float32)
+        return np.sqrt(squared_distances(query, state.matrix, state.sq_norms)[0])
+    
+    def best_match(self, encoding):
+        """
+        Returns (employee_id, distance) of the closest row,
+        or (None, 1.0) when the gallery is empty.
+        """
+        state = self._state
+        if len(state.rows) == 0:
+            return None, 1.0
+        row, distance = state.index.search(np.asarray(encoding, dtype=np.float32))
+        if row is None or not np.isfinite(distance):
+            return None, 1.0
+        return state._ids[row], distance
+    
+    def best_matches(self, encodings):
+        """
+        best_match for many encodings at once (one matrix product on the exact index).
+        Returns a list of (employee_id, distance).
+        """
+        state = self._state
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(state.rows) == 0 or len(encodings) == 0:
+            return [(None, 1.0)] * len(encodings)
+        rows, distances = state.index.search_batch(encodings)
+        return [
+            (state._ids[row], float(distance)) if row >= 0 and np.isfinite(distance) else (None, 1.0)
+            for row, distance in zip(rows, distances)
+        ]
 
 class EncodingManager:
     """
@@ -16,7 +316,22 @@ class EncodingManager:
     def __init__(self):
         self.face_engine = FaceEngine()
         self.encodings_cache = {}
+        # GalleryVersion generation each cached company was loaded at
+        self.generations = {}
+        self._checked_at = {}
+        # When every company's gallery was last fully loaded (refresh_cache), for readiness
+        self.loaded_at = None
+        self._reload_lock = threading.Lock()
+        self.check_interval = getattr(settings, 'FACE_GALLERY_CHECK_INTERVAL', 1.0)
+        # Beyond this many journal entries a full company reload is cheaper
+        self.max_incremental = getattr(settings, 'FACE_GALLERY_MAX_INCREMENTAL', 256)
         self.encodings_dir = settings.FACE_ENCODINGS_DIR
+        self.index_options = {
+            'backend': getattr(settings, 'FACE_INDEX_BACKEND', 'auto'),
+            'ivf_min_size': getattr(settings, 'FACE_INDEX_IVF_MIN_SIZE', 20000),
+            'n_probe': getattr(settings, 'FACE_INDEX_IVF_NPROBE', 8),
+            'n_lists': getattr(settings, 'FACE_INDEX_IVF_NLISTS', None),
+        }
         self._ensure_directories()
     
     def _ensure_directories(self):
@@ -49,33 +364,117 @@ class EncodingManager:
             print(f"DEBUG: Saving encoding to {encoding_path}")
             self.face_engine.save_encoding(encoding, encoding_path)
             
+            # Append to the packed store BEFORE the save below journals the change,
+            # so workers replaying the event already find the new row
+            store = self.get_store(employee.company_id)
+            if store.exists():
+                store.append(employee.employee_id, encoding)
+            
             employee.face_encoding_path = str(encoding_path)
             employee.is_face_registered = True
+            # Journaled even if re-enrolled to the same path (recognition.signals)
+            employee._encoding_changed = True
             employee.save()
             
+            if not store.exists():
+                # First enrolment since packing was introduced: build the store from the per-employee files
+                self.pack_company(employee.company_id)
+            
             return True, None
         except Exception as e:
             print(f"ERROR: {e}")
             return False, str(e)
     
+    def get_store(self, company_id):
+        """Packed encoding store of a company (see encoding_store.py)"""
+        return EncodingStore(Path(self.encodings_dir) / str(company_id))
+    
+    def pack_company(self, company_id):
+        """
+        (Re)write a company's packed store from the per-employee encoding files.
+        Also compacts away rows of deleted/re-enrolled employees.
+        Returns the number of encodings packed.
+        """
+        employees = Employee.objects.filter(
+            company_id=company_id,
+            is_face_registered=True,
+            status='active'
+        )
+        # Exact backend: this gallery is only used to collect the encodings
+        gallery = self._load_galleries(employees, {'backend': 'exact'}).get(company_id)
+        employee_ids = list(gallery.employee_ids) if gallery else []
+        encodings = gallery.matrix if gallery else np.zeros((0, ENCODING_DIM), dtype=np.float32)
+        self.get_store(company_id).write(employee_ids, encodings)
+        
+        # New store epoch: every worker does a full reload of this company
+        GalleryVersion.bump(company_id)
+        return len(employee_ids)
+    
+    def _live_employee_ids(self, company_id):
+        return set(
+            Employee.objects.filter(
+                company_id=company_id,
+                is_face_registered=True,
+                status='active'
+            ).values_list('employee_id', flat=True)
+        )
+    
     def load_all_encodings(self):
         """
         Load ALL encodings.
+        Companies with a packed store are memory-mapped, the rest fall back to per-employee files.
         """
         print("DEBUG: Starting load_all_encodings...")
         employees = Employee.objects.filter(is_face_registered=True, status='active')
-        print(f"DEBUG: Found {employees.count()} active employees with is_face_registered=True")
+        company_ids = set(employees.order_by().values_list('company_id', flat=True).distinct())
+        packed = {cid for cid in company_ids if self.get_store(cid).exists()}
+        print(f"DEBUG: {len(company_ids)} companies with registered faces, {len(packed)} packed")
         
-        # Structure: { company_id: { employee_id: encoding } }
-        cache = {}
+        galleries = self._load_galleries(employees.exclude(company_id__in=packed))
+        for company_id in packed:
+            galleries[company_id] = self.load_company_encodings(company_id)
+        return galleries
+    
+    def load_company_encodings(self, company_id):
+        """
+        Load the encodings of a single company.
+        """
+        snapshot = self.get_store(company_id).snapshot()
+        if snapshot is not None:
+            header, matrix, store_ids = snapshot
+            live_ids = self._live_employee_ids(company_id)
+            gallery = CompanyGallery.from_store(header, matrix, store_ids, live_ids, self.index_options)
+            
+            # Registered employees the store doesn't know about (written outside save_employee_encoding)
+            missing = live_ids - set(gallery.rows)
+            if missing:
+                print(f"DEBUG: {len(missing)} encodings missing from packed store of {company_id}, run pack_encodings")
+                with gallery.edit():
+                    for employee in Employee.objects.filter(company_id=company_id, employee_id__in=missing):
+                        encoding = self.face_engine.load_encoding(self.get_encoding_path(employee))
+                        if encoding is not None:
+                            gallery.upsert(employee.employee_id, encoding)
+            return gallery
+        
+        employees = Employee.objects.filter(
+            company_id=company_id,
+            is_face_registered=True,
+            status='active'
+        )
+        galleries = self._load_galleries(employees)
+        return galleries.get(company_id) or CompanyGallery([], [], self.index_options)
+    
+    def _load_galleries(self, employees, index_options=None):
+        # Structure while loading: { company_id: ([employee_id, ...], [encoding, ...]) }
+        loaded = {}
         
         for employee in employees:
             # DEBUG: Check company link
             company_id = employee.company_id if employee.company_id else "NO_COMPANY"
             
-            # Initialize company dict if missing
-            if company_id not in cache:
-                cache[company_id] = {}
+            # Initialize company lists if missing
+            if company_id not in loaded:
+                loaded[company_id] = ([], [])
                 
             path = self.get_encoding_path(employee)
             
@@ -86,13 +485,147 @@ class EncodingManager:
             encoding = self.face_engine.load_encoding(path)
             
             if encoding is not None:
-                cache[company_id][employee.employee_id] = encoding
+                ids, encodings = loaded[company_id]
+                ids.append(employee.employee_id)
+                encodings.append(encoding)
                 print(f"DEBUG: Loaded encoding for {employee.employee_id} (Company: {company_id})")
             else:
-                print(f"DEBUG: Failed to load pickle for {employee.employee_id}")
+                print(f"DEBUG: Failed to load encoding for {employee.employee_id}")
                 
-        return cache
+        # Structure: { company_id: CompanyGallery }
+        return {
+            company_id: CompanyGallery(ids, encodings, index_options or self.index_options)
+            for company_id, (ids, encodings) in loaded.items()
+        }
     
     def refresh_cache(self, company_id=None):
+        """
+        Full reload from disk/DB: one company if `company_id` is given, otherwise all.
+        Normal changes are patched in place (see add_employee/_apply_events);
+        this is the recovery path.
+        Generations are read BEFORE loading, so a change that lands mid-load
+        is picked up by the next version check.
+        """
+        now = time.monotonic()
+        if company_id is not None:
+            generation = GalleryVersion.current(company_id)
+            self.encodings_cache[company_id] = self.load_company_encodings(company_id)
+            self.generations[company_id] = generation
+            self._checked_at[company_id] = now
+            return self.encodings_cache
+        
+        generations = dict(GalleryVersion.objects.values_list('company_id', 'generation'))
         self.encodings_cache = self.load_all_encodings()
-        return self.encodings_cache
\ No newline at end of file
+        self.generations = {cid: generations.get(cid, 0) for cid in self.encodings_cache}
+        self._checked_at = {cid: now for cid in self.encodings_cache}
+        self.loaded_at = now
+        return self.encodings_cache
+    
+    def add_employee(self, employee, encoding=None):
+        """
+        Patch one employee into their company's cached gallery.
+        `encoding` defaults to the employee's saved encoding file.
+        Inactive or unregistered employees are removed instead.
+        """
+        if employee.status != 'active' or not employee.is_face_registered:
+            return self.remove_employee(employee.company_id, employee.employee_id)
+        
+        if encoding is None:
+            encoding = self.face_engine.load_encoding(self.get_encoding_path(employee))
+        if encoding is None:
+            print(f"DEBUG: No encoding on disk for {employee.employee_id}")
+            return self.remove_employee(employee.company_id, employee.employee_id)
+        
+        gallery = self.encodings_cache.get(employee.company_id)
+        if gallery is None:
+            # Company not cached in this worker yet; it is loaded on first use
+            return False
+        gallery.upsert(employee.employee_id, encoding)
+        return True
+    
+    # Re-enrolment and status changes go through the same path
+    update_employee = add_employee
+    
+    def remove_employee(self, company_id, employee_id):
+        """Drop one employee from their company's cached gallery"""
+        gallery = self.encodings_cache.get(company_id)
+        if gallery is None:
+            return False
+        return gallery.remove(employee_id)
+    
+    def _apply_events(self, company_id, generation):
+        """
+        Replay journaled changes since the cached generation.
+        Returns False if the journal has a gap (bump without event,
+        pruned entries) so the caller falls back to a full reload.
+        """
+        cached_generation = self.generations.get(company_id, 0)
+        if generation - cached_generation > self.max_incremental:
+            return False
+        
+        employee_ids = list(
+            GalleryEvent.objects.filter(
+                company_id=company_id,
+                generation__gt=cached_generation,
+                generation__lte=generation
+            ).values_list('employee_id', flat=True)
+        )
+        if len(employee_ids) != generation - cached_generation:
+            return False
+        
+        gallery = self.encodings_cache[company_id]
+        snapshot = None
+        if gallery.store_epoch is not None:
+            # Map in rows appended to the packed store since the gallery was built
+            snapshot = self.get_store(company_id).snapshot(start=gallery.size)
+            if snapshot is None or snapshot[0]['epoch'] != gallery.store_epoch:
+                return False
+        
+        changed = set(employee_ids)
+        employees = {
+            employee.employee_id: employee
+            for employee in Employee.objects.filter(company_id=company_id, employee_id__in=changed)
+        }
+        # Searches see the whole batch at once, as one new gallery version
+        with gallery.edit() as state:
+            if snapshot is not None:
+                header, matrix, new_ids = snapshot
+                gallery.attach_store_rows(matrix, new_ids)
+            for employee_id in changed:
+                employee = employees.get(employee_id)
+                if employee is None:
+                    self.remove_employee(company_id, employee_id)
+                elif state.store_epoch is not None and employee_id in state.rows and employee.status == 'active' and employee.is_face_registered:
+                    # Current row already attached from the store
+                    continue
+                else:
+                    self.update_employee(employee)
+        
+        self.generations[company_id] = generation
+        return True
+    
+    def get_gallery(self, company_id):
+        """
+        Gallery for one company, kept current against its GalleryVersion.
+        The version row is checked at most once per `check_interval` seconds;
+        journaled changes are patched in place, anything else reloads the company.
+        """
+        now = time.monotonic()
+        cached = company_id in self.encodings_cache
+        if cached and now - self._checked_at.get(company_id, 0.0) < self.check_interval:
+            return self.encodings_cache[company_id]
+        
+        generation = GalleryVersion.current(company_id)
+        self._checked_at[company_id] = now
+        if cached and generation == self.generations.get(company_id):
+            return self.encodings_cache[company_id]
+        
+        with self._reload_lock:
+            # Another thread may have caught up while we waited
+            if company_id in self.encodings_cache and generation == self.generations.get(company_id):
+                return self.encodings_cache[company_id]
+            if company_id in self.encodings_cache and self._apply_events(company_id, generation):
+                return self.encodings_cache[company_id]
+            print(f"Reloading encodings for company {company_id} (generation {generation})...")
+            self.refresh_cache(company_id=company_id)
+        return self.encodings_cache[company_id]
@@ -0,0 +1,163 @@
+"""
+Packed Encoding Store
+One set of files per company, shared by every worker through np.memmap:
+
+    face_encodings/<company_id>/gallery.f32   float32 rows, preallocated capacity
+    face_encodings/<company_id>/gallery.ids   employee_id of each row, one per line
+    face_encodings/<company_id>/gallery.json  header (format, dim, rows, capacity, ids_bytes, epoch)
+
+Rows are append-only: a re-enrolment appends a new row and the last row
+for an employee wins. The header is written last and is the commit point,
+so readers never look past `rows`. A full rewrite (pack/compact) gets a
+new `epoch` and replaces the files atomically.
+"""
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+STORE_FORMAT = 1
+ENCODING_DIM = 128
+ROW_BYTES = ENCODING_DIM * 4
+MIN_CAPACITY = 64
+
+
+class EncodingStore:
+    """Packed encodings of one company"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.matrix_path = self.directory / 'gallery.f32'
+        self.ids_path = self.directory / 'gallery.ids'
+        self.header_path = self.directory / 'gallery.json'
+        self.lock_path = self.directory / 'gallery.lock'
+
+    def exists(self):
+        return self.header_path.exists()
+
+    def read_header(self):
+        """Committed header, or None if the store doesn't exist / is unreadable"""
+        try:
+            with open(self.header_path) as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if header.get('format') != STORE_FORMAT or header.get('dim') != ENCODING_DIM:
+            return None
+        return header
+
+    def open_matrix(self, header):
+        """Read-only shared mapping of the whole capacity (rows past header['rows'] are unused)"""
+        if header['capacity'] == 0:
+            return np.zeros((0, ENCODING_DIM), dtype=np.float32)
+        return np.memmap(
+            self.matrix_path, dtype=np.float32, mode='r',
+            shape=(header['capacity'], ENCODING_DIM)
+        )
+
+    def read_ids(self, header, start=0):
+        """Employee ids of committed rows [start, header['rows'])"""
+        with open(self.ids_path, 'rb') as f:
+            ids = f.read(header['ids_bytes']).decode().splitlines()
+        return ids[start:header['rows']]
+
+    def snapshot(self, start=0):
+        """
+        Consistent (header, matrix, ids[start:]) triple, read under a shared
+        lock so a concurrent pack can't swap files between the reads.
+        Returns None if the store doesn't exist.
+        """
+        if not self.exists():
+            return None
+        with self._locked(shared=True):
+            header = self.read_header()
+            if header is None:
+                return None
+            return header, self.open_matrix(header), self.read_ids(header, start)
+
+    @contextmanager
+    def _locked(self, shared=False):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_header(self, header):
+        tmp_path = self.header_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self.header_path)
+
+    def append(self, employee_id, encoding):
+        """
+        Append one encoding without rewriting the file.
+        Returns the row it was written to.
+        """
+        row_bytes = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIM).tobytes()
+        with self._locked():
+            header = self.read_header()
+            if header is None:
+                raise FileNotFoundError(f"No encoding store at {self.directory}")
+            row = header['rows']
+
+            with open(self.matrix_path, 'r+b') as f:
+                if row >= header['capacity']:
+                    # Grow the preallocated region; existing mappings stay valid
+                    header['capacity'] = max(MIN_CAPACITY, 2 * header['capacity'])
+                    f.truncate(header['capacity'] * ROW_BYTES)
+                f.seek(row * ROW_BYTES)
+                f.write(row_bytes)
+
+            line = f'{employee_id}\n'.encode()
+            with open(self.ids_path, 'r+b') as f:
+                # Drop id bytes left behind by an append that never committed
+                f.truncate(header['ids_bytes'])
+                f.seek(header['ids_bytes'])
+                f.write(line)
+
+            header['rows'] = row + 1
+            header['ids_bytes'] += len(line)
+            self._write_header(header)
+        return row
+
+    def write(self, employee_ids, encodings):
+        """Replace the whole store (used by pack/compact)"""
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        rows = len(matrix)
+        capacity = max(MIN_CAPACITY, 2 * rows)
+
+        with self._locked():
+            tmp_matrix = self.matrix_path.with_suffix('.f32.tmp')
+            with open(tmp_matrix, 'wb') as f:
+                f.write(matrix.tobytes())
+                f.truncate(capacity * ROW_BYTES)
+            ids_data = ''.join(f'{employee_id}\n' for employee_id in employee_ids).encode()
+            tmp_ids = self.ids_path.with_suffix('.ids.tmp')
+            with open(tmp_ids, 'wb') as f:
+                f.write(ids_data)
+
+            # Workers holding the old files keep their mappings (old inodes)
+            os.replace(tmp_matrix, self.matrix_path)
+            os.replace(tmp_ids, self.ids_path)
+            self._write_header({
+                'format': STORE_FORMAT,
+                'dim': ENCODING_DIM,
+                'dtype': 'float32',
+                'rows': rows,
+                'capacity': capacity,
+                'ids_bytes': len(ids_data),
+                'epoch': uuid.uuid4().hex,
+            })
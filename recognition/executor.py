@@ -0,0 +1,149 @@
+"""
+Recognition Executor
+Runs recognition jobs in a pool of warm worker processes instead of the
+web request thread, so web concurrency (gunicorn workers) and CPU-bound
+ML concurrency (FACE_EXECUTOR_WORKERS) are sized independently.
+
+- Workers are spawned once, set up Django, load the dlib models and the
+  encoding galleries, then serve jobs (frames travel as JPEG bytes).
+- At most FACE_EXECUTOR_MAX_PENDING jobs are queued or running; beyond
+  that submit fails fast with RecognitionBusy (load shedding, HTTP 503).
+- A caller waits at most FACE_EXECUTOR_TIMEOUT seconds (RecognitionTimeout).
+- Workers don't write attendance: jobs return their punches and the web
+  process submits them to its attendance writer (pipeline.submit_punches),
+  so shutting the pool down never loses a queued punch.
+
+FACE_EXECUTOR_WORKERS = 0 runs jobs inline in the calling thread (dev, tests).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+class RecognitionBusy(Exception):
+    """Every executor slot is taken; the job was not queued"""
+
+
+class RecognitionTimeout(Exception):
+    """The job didn't finish within the executor timeout"""
+
+
+def warm_worker():
+    """Pool initializer: the ML stack and galleries are loaded before the first job"""
+    django.setup()
+    from . import pipeline
+    try:
+        pipeline.warm_up()
+    except Exception as e:
+        # Not fatal: galleries are then loaded by the first job of each company
+        print(f"DEBUG: recognition worker warm-up failed: {e}")
+    finally:
+        connections.close_all()
+
+
+def run_job(function, *args):
+    """Runs in the worker: fresh DB connection state for every job"""
+    close_old_connections()
+    return function(*args)
+
+
+class RecognitionExecutor:
+    """Bounded, timed submission of recognition jobs to a process pool"""
+
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        self.workers = workers if workers is not None else getattr(settings, 'FACE_EXECUTOR_WORKERS', 0)
+        self.max_pending = max_pending or getattr(settings, 'FACE_EXECUTOR_MAX_PENDING', None) or 2 * max(self.workers, 1)
+        self.timeout = timeout if timeout is not None else getattr(settings, 'FACE_EXECUTOR_TIMEOUT', 10.0)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        # Set once a worker has finished warm_worker (see start)
+        self.ready = False
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def start(self):
+        """
+        Create the worker pool now instead of on the first job, and wait
+        until a warm worker has answered (the workers warm up in parallel).
+        """
+        if not self.enabled:
+            return
+        try:
+            self._get_pool().submit(run_job, os.getpid).result()
+            self.ready = True
+        except Exception as e:
+            print(f"DEBUG: recognition executor failed to start: {e}")
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: workers don't inherit the web process' DB connections or threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=warm_worker
+                )
+            return self._pool
+
+    def _reset(self, pool):
+        """Drop a pool whose worker died; the next job starts a new one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.ready = False
+        pool.shutdown(wait=False)
+
+    def call(self, function, *args):
+        """
+        Run function(*args) in a worker and return its result.
+        Raises RecognitionBusy when saturated, RecognitionTimeout when too slow.
+        """
+        if not self.enabled:
+            return function(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise RecognitionBusy()
+
+        pool = self._get_pool()
+        try:
+            future = pool.submit(run_job, function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset(pool)
+            raise
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the worker is really done, even if the caller gave up
+        future.add_done_callback(lambda done: self._slots.release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+            self.ready = True
+            return result
+        except FutureTimeoutError:
+            future.cancel()
+            raise RecognitionTimeout()
+        except BrokenProcessPool:
+            self._reset(pool)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# One executor per web process, shared by the HTTP views and the websocket handler
+recognition_executor = RecognitionExecutor()
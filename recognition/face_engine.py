@@ -1,8 +1,30 @@
-import face_recognition
 import numpy as np
-import cv2
+import os
 import pickle
 from pathlib import Path
+from django.conf import settings
+from .ml import ml
+
+# First bytes of every file written by np.save
+NPY_MAGIC = b'\x93NUMPY'
+
+# The only globals a pickled encoding (numpy array, or list of numpy floats) refers to
+LEGACY_PICKLE_GLOBALS = {
+    ('numpy', 'ndarray'),
+    ('numpy', 'dtype'),
+    ('numpy.core.multiarray', '_reconstruct'),
+    ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy._core.multiarray', 'scalar'),
+}
+
+class EncodingUnpickler(pickle.Unpickler):
+    """Unpickler for legacy encoding files: refuses anything but numpy arrays/scalars"""
+    
+    def find_class(self, module, name):
+        if (module, name) not in LEGACY_PICKLE_GLOBALS:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from an encoding file")
+        return super().find_class(module, name)
 
 class FaceEngine:
     """
@@ -10,18 +32,60 @@ class FaceEngine:
     Ensures consistent RGB processing for both registration and recognition.
     """
     
-    def encode_face_from_file(self, file_path):
+    def detect_faces(self, image, scale=1.0, upsample=1, model="hog"):
+        """
+        Finds faces in an RGB image.
+        Detection runs on a copy resized by `scale` (cost scales with pixel count)
+        and the boxes are mapped back to the full-resolution image, so callers
+        encode from the full-resolution crop.
+        `upsample` is face_recognition's number_of_times_to_upsample.
+        
+        Returns [(top, right, bottom, left), ...] in `image` coordinates.
+        """
+        cv2, face_recognition = ml().cv2, ml().face_recognition
+        if scale == 1.0:
+            return face_recognition.face_locations(image, number_of_times_to_upsample=upsample, model=model)
+        
+        height, width = image.shape[:2]
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        small = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=interpolation
+        )
+        # Exact per-axis factors of the resized copy
+        scale_y, scale_x = small.shape[0] / height, small.shape[1] / width
+        
+        return [
+            (
+                max(0, round(top / scale_y)),
+                min(width, round(right / scale_x)),
+                min(height, round(bottom / scale_y)),
+                max(0, round(left / scale_x)),
+            )
+            for top, right, bottom, left in face_recognition.face_locations(
+                small, number_of_times_to_upsample=upsample, model=model
+            )
+        ]
+    
+    def encode_face_from_file(self, file_path, scale=None, upsample=None):
         """
         Generates encoding from an image file (Registration).
+        scale/upsample default to FACE_REGISTRATION_DETECTION_SCALE / FACE_REGISTRATION_UPSAMPLE.
         Returns (encoding, face_count)
         """
+        if scale is None:
+            scale = getattr(settings, 'FACE_REGISTRATION_DETECTION_SCALE', 1.0)
+        if upsample is None:
+            upsample = getattr(settings, 'FACE_REGISTRATION_UPSAMPLE', 1)
+        face_recognition = ml().face_recognition
         try:
             # load_image_file loads image in RGB format automatically
             image = face_recognition.load_image_file(file_path)
             
             # Detect faces
             # We use the default model here as accuracy > speed for registration
-            face_locations = face_recognition.face_locations(image)
+            face_locations = self.detect_faces(image, scale=scale, upsample=upsample)
             
             if not face_locations:
                 return None, 0
@@ -34,13 +98,13 @@ class FaceEngine:
             print(f"Error encoding file {file_path}: {e}")
             return None, 0
 
-    def recognize_face(self, unknown_encoding, known_encodings_dict, tolerance=0.6):
+    def recognize_face(self, unknown_encoding, gallery, tolerance=0.6):
         """
-        Compares an encoding against a dictionary of {id: encoding}.
+        Compares an encoding against a prebuilt company gallery.
         
         Args:
             unknown_encoding: The 128D vector from the live camera.
-            known_encodings_dict: Dictionary {employee_id: known_encoding}.
+            gallery: CompanyGallery (contiguous matrix of known encodings).
             tolerance: Distance threshold. 
                        0.6 is default. 
                        0.5 is strict. 
@@ -49,58 +113,83 @@ class FaceEngine:
         Returns:
             (best_match_id, confidence_percent, min_distance)
         """
-        if unknown_encoding is None or not known_encodings_dict:
+        if unknown_encoding is None or gallery is None or len(gallery) == 0:
             return None, 0.0, 1.0
-            
-        known_ids = list(known_encodings_dict.keys())
-        known_encodings_list = list(known_encodings_dict.values())
         
-        # Calculate Euclidean distance to all known faces
+        # One vectorized Euclidean distance over the whole gallery
         # Lower distance = Better match
-        distances = face_recognition.face_distance(known_encodings_list, unknown_encoding)
-        
-        # Find the best match index
-        best_match_index = np.argmin(distances)
-        min_distance = distances[best_match_index]
+        best_match_id, min_distance = gallery.best_match(unknown_encoding)
         
         # DEBUG: Print the closest match distance to console
         # This helps debug why a face might be "Unknown"
-        best_match_id_debug = known_ids[best_match_index]
-        print(f"DEBUG: Best match: {best_match_id_debug}, Distance: {min_distance:.4f}, Threshold: {tolerance}")
+        print(f"DEBUG: Best match: {best_match_id}, Distance: {min_distance:.4f}, Threshold: {tolerance}")
 
+        return self._score_match(best_match_id, min_distance, tolerance)
+
+    def recognize_faces(self, unknown_encodings, gallery, tolerance=0.6):
+        """
+        recognize_face for many encodings at once: all of them are matched
+        against the gallery in a single distance computation.
+        
+        Returns:
+            [(best_match_id, confidence_percent, min_distance), ...] in input order
+        """
+        if gallery is None or len(gallery) == 0:
+            return [(None, 0.0, 1.0) for _ in unknown_encodings]
+        
+        return [
+            self._score_match(best_match_id, min_distance, tolerance)
+            for best_match_id, min_distance in gallery.best_matches(unknown_encodings)
+        ]
+
+    def _score_match(self, best_match_id, min_distance, tolerance):
+        """Turn a (best_match_id, distance) into (id, confidence, distance), applying the tolerance"""
         # Check if the best match is within tolerance
-        if min_distance <= tolerance:
-            best_match_id = known_ids[best_match_index]
-            
+        if best_match_id is not None and min_distance <= tolerance:
             # Calculate a user-friendly "confidence" score (0-100%)
             # This is not a probability, but a normalized distance score.
             # 0.0 dist -> 100% conf
             # tolerance dist -> 0% conf
-            if min_distance > tolerance:
-                confidence = 0.0
-            else:
-                confidence = max(0, (1.0 - (min_distance / tolerance)) * 100)
+            confidence = max(0, (1.0 - (min_distance / tolerance)) * 100)
             
             return best_match_id, confidence, min_distance
             
         return None, 0.0, min_distance
 
     def save_encoding(self, encoding, path):
-        """Save encoding to a binary pickle file"""
+        """Save encoding as a real .npy array (no pickle)"""
         try:
-            Path(path).parent.mkdir(parents=True, exist_ok=True)
-            with open(path, 'wb') as f:
-                pickle.dump(encoding, f)
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write through a file handle so np.save doesn't append another .npy suffix,
+            # and swap it in atomically so readers never see a half-written file
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.asarray(encoding, dtype=np.float64), allow_pickle=False)
+            os.replace(tmp_path, path)
         except Exception as e:
             print(f"Error saving encoding to {path}: {e}")
 
     def load_encoding(self, path):
-        """Load encoding from a binary pickle file"""
+        """
+        Load encoding from a .npy file.
+        Files written before the switch from pickle are still read (see convert_encodings).
+        """
         try:
-            if not Path(path).exists():
-                return None
             with open(path, 'rb') as f:
-                return pickle.load(f)
+                if f.read(len(NPY_MAGIC)) == NPY_MAGIC:
+                    f.seek(0)
+                    return np.load(f, allow_pickle=False)
+                # Legacy pickle file: only numpy arrays/scalars are unpickled
+                f.seek(0)
+                return np.asarray(EncodingUnpickler(f).load(), dtype=np.float64)
+        except FileNotFoundError:
+            return None
         except Exception as e:
             print(f"Error loading encoding from {path}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def is_legacy_encoding(self, path):
+        """True if `path` is an old pickle-format encoding file"""
+        with open(path, 'rb') as f:
+            return f.read(len(NPY_MAGIC)) != NPY_MAGIC
@@ -0,0 +1,269 @@
+"""
+Nearest-Neighbour Index Backends
+Pure NumPy search structures over a CompanyGallery matrix.
+
+- ExactIndex: brute-force scan, used for small galleries.
+- IVFIndex: k-means partitioned (inverted file) index for large galleries.
+  Only the `n_probe` closest partitions are scanned per query, so
+  `n_probe` is the recall/latency knob (n_probe == n_lists is exact).
+
+Both answer single queries (`search`) and batches (`search_batch`), and
+both support in-place updates: `rebind()` after the gallery arrays change,
+`add(row)` after a row is written and `remove(row)` after it is tombstoned.
+Updates are only applied to a `copy()` that no search is using yet;
+CompanyGallery publishes it once the change is complete.
+"""
+import copy
+
+import numpy as np
+
+# Default switch-over point for backend='auto'
+IVF_MIN_SIZE = 20000
+DEFAULT_N_PROBE = 8
+
+# Rows per block when assigning the whole gallery to partitions
+ASSIGN_CHUNK = 8192
+
+# Rows added since the last list rebuild are scanned brute force until
+# there are more than this many (or 5% of the gallery)
+IVF_PENDING_MIN = 256
+
+
+def squared_distances(queries, matrix, sq_norms):
+    """
+    Squared Euclidean distance between each query row and each matrix row.
+    Uses ||q||^2 + ||x||^2 - 2 q.x so it is a single matrix product.
+    """
+    queries = np.atleast_2d(queries)
+    sq_queries = np.einsum('ij,ij->i', queries, queries)
+    sq_dist = sq_queries[:, None] + sq_norms[None, :] - 2.0 * (queries @ matrix.T)
+    # Float32 rounding can push an exact match slightly below zero
+    np.maximum(sq_dist, 0.0, out=sq_dist)
+    return sq_dist
+
+
+class ExactIndex:
+    """Brute-force scan over every row"""
+
+    name = 'exact'
+
+    def __init__(self, matrix, sq_norms):
+        self.rebind(matrix, sq_norms)
+
+    def rebind(self, matrix, sq_norms):
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+
+    def copy(self):
+        return ExactIndex(self.matrix, self.sq_norms)
+
+    def add(self, row):
+        # The scan always reads the gallery arrays directly
+        pass
+
+    def remove(self, row):
+        pass
+
+    def search(self, query):
+        """Returns (row, distance) of the nearest row"""
+        if len(self.matrix) == 0:
+            return None, float('inf')
+        sq_dist = squared_distances(query, self.matrix, self.sq_norms)[0]
+        row = int(np.argmin(sq_dist))
+        return row, float(np.sqrt(sq_dist[row]))
+
+    def search_batch(self, queries):
+        """
+        Nearest row for each query with one (M, 128) x (N, 128) product.
+        Returns (rows, distances); rows are -1 when the index is empty.
+        """
+        queries = np.atleast_2d(queries)
+        if len(self.matrix) == 0:
+            return np.full(len(queries), -1, dtype=np.int64), np.full(len(queries), np.inf)
+        sq_dist = squared_distances(queries, self.matrix, self.sq_norms)
+        rows = np.argmin(sq_dist, axis=1)
+        return rows, np.sqrt(sq_dist[np.arange(len(queries)), rows])
+
+
+class IVFIndex:
+    """
+    Inverted file index: rows are bucketed by their nearest k-means centroid,
+    and a query only scans the buckets of its `n_probe` nearest centroids.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, matrix, sq_norms, n_lists=None, n_probe=DEFAULT_N_PROBE,
+                 iterations=10, sample_size=50000, seed=0):
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+        size = len(matrix)
+
+        # sqrt(N) partitions keeps centroid scan and bucket scan balanced
+        if n_lists is None:
+            n_lists = int(np.sqrt(size))
+        self.n_lists = max(1, min(int(n_lists), size))
+        self.n_probe = max(1, min(int(n_probe), self.n_lists))
+
+        rng = np.random.default_rng(seed)
+        self.centroids = self._train(rng, iterations, sample_size)
+        self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self._build_lists(self._assign(self.matrix))
+
+    def rebind(self, matrix, sq_norms):
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+
+    def copy(self):
+        """
+        Independent index over the same lists. Only the arrays written in
+        place (tombstoned list norms, pending rows) are copied; a reindex
+        replaces the rest.
+        """
+        index = copy.copy(self)
+        index.list_sq_norms = self.list_sq_norms.copy()
+        index.pending = set(self.pending)
+        return index
+
+    def add(self, row):
+        """
+        Row `row` was added or overwritten. Its old list slot (if any) is
+        tombstoned and the row is scanned brute force until the next rebuild.
+        """
+        self._drop_listed(row)
+        self.pending.add(row)
+        if len(self.pending) > max(IVF_PENDING_MIN, len(self.matrix) // 20):
+            self.reindex()
+
+    def remove(self, row):
+        self._drop_listed(row)
+        self.pending.discard(row)
+
+    def _drop_listed(self, row):
+        if row < len(self.list_positions):
+            self.list_sq_norms[self.list_positions[row]] = np.inf
+
+    def reindex(self):
+        """
+        Fold pending rows into the partition lists. Only the pending rows
+        are assigned; centroids are kept (retraining happens on full reload).
+        """
+        labels = np.empty(len(self.matrix), dtype=np.int32)
+        labels[:len(self.labels)] = self.labels
+        pending = np.fromiter(sorted(self.pending), dtype=np.int64, count=len(self.pending))
+        if len(pending):
+            labels[pending] = self._assign(self.matrix[pending])
+        self._build_lists(labels)
+
+    def _train(self, rng, iterations, sample_size):
+        """Lloyd's k-means on a random sample of the gallery"""
+        size = len(self.matrix)
+        sample_rows = rng.choice(size, size=min(size, max(sample_size, self.n_lists)), replace=False)
+        sample = self.matrix[sample_rows]
+        centroids = sample[rng.choice(len(sample), size=self.n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+            labels = np.argmin(
+                squared_distances(sample, centroids, centroid_sq_norms), axis=1
+            )
+            counts = np.bincount(labels, minlength=self.n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # Re-seed empty partitions from random sample points
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+
+        return centroids.astype(np.float32)
+
+    def _assign(self, rows):
+        """Nearest centroid for each row, in bounded-memory chunks"""
+        labels = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), ASSIGN_CHUNK):
+            block = rows[start:start + ASSIGN_CHUNK]
+            labels[start:start + ASSIGN_CHUNK] = np.argmin(
+                squared_distances(block, self.centroids, self.centroid_sq_norms), axis=1
+            )
+        return labels
+
+    def _build_lists(self, labels):
+        """
+        Group rows by partition. Each partition's rows are copied into one
+        contiguous block so a probe is a slice + small matrix product, not a gather.
+        """
+        self.labels = labels
+        self.list_rows = np.argsort(labels, kind='stable').astype(np.int64)
+        self.list_offsets = np.searchsorted(
+            labels[self.list_rows], np.arange(self.n_lists + 1)
+        )
+        self.list_matrix = np.ascontiguousarray(self.matrix[self.list_rows])
+        self.list_sq_norms = self.sq_norms[self.list_rows]
+        # Gallery row -> slot in the lists, used to tombstone updated/removed rows
+        self.list_positions = np.empty(len(labels), dtype=np.int64)
+        self.list_positions[self.list_rows] = np.arange(len(labels))
+        self.pending = set()
+
+    def probe(self, query):
+        """Ids of the `n_probe` partitions whose centroids are closest to `query`"""
+        centroid_dist = squared_distances(query, self.centroids, self.centroid_sq_norms)[0]
+        if self.n_probe < self.n_lists:
+            return np.argpartition(centroid_dist, self.n_probe - 1)[:self.n_probe]
+        return np.arange(self.n_lists)
+
+    def search(self, query):
+        """Returns (row, distance) of the nearest row found in the probed partitions"""
+        best_position, best_score = None, np.inf
+        for partition in self.probe(query):
+            start, end = self.list_offsets[partition], self.list_offsets[partition + 1]
+            if start == end:
+                continue
+            # ||x||^2 - 2 q.x ranks rows the same as the full squared distance
+            scores = self.list_sq_norms[start:end] - 2.0 * (self.list_matrix[start:end] @ query)
+            position = int(np.argmin(scores))
+            if scores[position] < best_score:
+                best_position, best_score = start + position, scores[position]
+        best_row = None if best_position is None else int(self.list_rows[best_position])
+
+        if self.pending:
+            rows = np.fromiter(self.pending, dtype=np.int64, count=len(self.pending))
+            scores = self.sq_norms[rows] - 2.0 * (self.matrix[rows] @ query)
+            position = int(np.argmin(scores))
+            if scores[position] < best_score:
+                best_row, best_score = int(rows[position]), scores[position]
+
+        if best_row is None or not np.isfinite(best_score):
+            return None, float('inf')
+        sq_dist = max(float(best_score + query.dot(query)), 0.0)
+        return best_row, float(np.sqrt(sq_dist))
+
+    def search_batch(self, queries):
+        """Per-query probe (each query visits different partitions)"""
+        queries = np.atleast_2d(queries)
+        rows = np.full(len(queries), -1, dtype=np.int64)
+        distances = np.full(len(queries), np.inf)
+        for i, query in enumerate(queries):
+            row, distance = self.search(query)
+            if row is not None:
+                rows[i], distances[i] = row, distance
+        return rows, distances
+
+
+def build_index(matrix, sq_norms, backend='auto', ivf_min_size=IVF_MIN_SIZE,
+                n_probe=DEFAULT_N_PROBE, n_lists=None):
+    """
+    Pick and build the index for a gallery.
+
+    backend: 'exact' (always brute force), 'ivf' (always partitioned)
+             or 'auto' (ivf once the gallery reaches `ivf_min_size` rows).
+    """
+    if backend not in ('auto', 'exact', 'ivf'):
+        raise ValueError(f"Unknown face index backend: {backend}")
+
+    use_ivf = backend == 'ivf' or (backend == 'auto' and len(matrix) >= ivf_min_size)
+    if use_ivf and len(matrix) > 0:
+        return IVFIndex(matrix, sq_norms, n_lists=n_lists, n_probe=n_probe)
+    return ExactIndex(matrix, sq_norms)
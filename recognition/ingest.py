@@ -0,0 +1,219 @@
+"""
+Camera Ingestion
+Server-side recognition for IP/RTSP cameras (see the `run_cameras` command).
+
+- One reader thread per camera keeps its stream drained (so RTSP buffers
+  never lag behind real time) and samples frames at `sample_fps`.
+- Detection + encoding run in a process pool sized to the cores.
+- A camera has at most one frame in the pool. Frames sampled while it is
+  busy replace the waiting one (dropped), so a slow server skips frames
+  instead of falling further and further behind.
+- Frames of a static scene are skipped before they reach the pool
+  (FrameGate), and each camera has a FaceTracker so the pool only encodes
+  faces that are new or due for re-verification.
+- Matching and attendance writes happen in the main process, with the
+  `camera` FK set on every punch.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.db import close_old_connections
+
+from .ml import ml
+from .pipeline import detect_and_encode, match_tracked_faces
+from .motion import FrameGate
+from .tracking import FaceTracker
+
+# Seconds before a lost live stream is reopened
+RECONNECT_DELAY = 5.0
+# Main loop wake-up interval while waiting for frames/results
+POLL_INTERVAL = 0.02
+
+
+class CameraReader(threading.Thread):
+    """
+    Reads one camera and keeps only the latest sampled frame.
+    Local video files are played back at their own frame rate (like a live
+    camera would deliver them) and end the reader when they run out.
+    """
+
+    def __init__(self, camera, sample_fps):
+        super().__init__(name=f'camera-{camera.pk}', daemon=True)
+        self.camera = camera
+        self.source = camera.get_stream_source_int()
+        self.is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        self.sample_interval = 1.0 / sample_fps
+        self.stopping = threading.Event()
+        self.finished = False
+        self.tracker = FaceTracker()
+        self.gate = FrameGate()
+
+        # Stats
+        self.sampled = 0
+        self.dropped = 0
+        self.processed = 0
+
+        self._frame = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        cv2 = ml().cv2
+        try:
+            while not self.stopping.is_set():
+                capture = cv2.VideoCapture(self.source)
+                if capture.isOpened():
+                    self._read(capture)
+                else:
+                    print(f"Camera {self.camera.name}: cannot open {self.camera.stream_source}")
+                capture.release()
+
+                if self.is_file:
+                    break
+                print(f"Camera {self.camera.name}: stream lost, reconnecting in {RECONNECT_DELAY:.0f}s")
+                self.stopping.wait(RECONNECT_DELAY)
+        finally:
+            self.finished = True
+
+    def _read(self, capture):
+        cv2 = ml().cv2
+        started = time.monotonic()
+        next_sample = 0.0
+
+        while not self.stopping.is_set():
+            # grab() every frame so the stream stays current; decode only the sampled ones
+            if not capture.grab():
+                return
+
+            if self.is_file:
+                position = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                ahead = position - (time.monotonic() - started)
+                if ahead > 0:
+                    self.stopping.wait(ahead)
+            else:
+                position = time.monotonic() - started
+
+            if position < next_sample:
+                continue
+            next_sample = position + self.sample_interval
+
+            ok, frame = capture.retrieve()
+            if ok:
+                self._put(frame)
+
+    def _put(self, frame):
+        with self._lock:
+            if self._frame is not None:
+                # Still waiting for the previous frame to be picked up: it's stale now
+                self.dropped += 1
+            self._frame = frame
+            self.sampled += 1
+
+    def take(self):
+        """Latest sampled frame (or None), clearing the slot"""
+        with self._lock:
+            frame, self._frame = self._frame, None
+            return frame
+
+    def has_frame(self):
+        with self._lock:
+            return self._frame is not None
+
+    def stop(self):
+        self.stopping.set()
+
+
+class CameraIngestor:
+    """Runs recognition for a set of cameras until their streams end or stop() is called"""
+
+    def __init__(self, cameras, sample_fps=2.0, workers=None):
+        self.readers = [CameraReader(camera, sample_fps) for camera in cameras]
+        self.workers = workers or os.cpu_count() or 1
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self, duration=None):
+        """
+        Process frames until every stream has ended (local files),
+        `duration` seconds have passed, or stop() is called.
+        """
+        deadline = time.monotonic() + duration if duration else None
+        in_flight = {}
+
+        # spawn: fresh workers, not forks of a process with reader threads and open DB connections;
+        # each sets Django up itself
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        ) as pool:
+            for reader in self.readers:
+                reader.start()
+            try:
+                while not self.stopping.is_set():
+                    if deadline and time.monotonic() >= deadline:
+                        break
+
+                    busy = {reader for reader, now in in_flight.values()}
+                    for reader in self.readers:
+                        if reader in busy:
+                            continue
+                        frame = reader.take()
+                        now = time.monotonic()
+                        if frame is not None and reader.gate.changed(frame, now):
+                            # The tracker travels with the frame (one frame per camera in flight)
+                            future = pool.submit(
+                                detect_and_encode, frame, False, reader.tracker, now,
+                                *reader.camera.get_detection_options()
+                            )
+                            in_flight[future] = (reader, now)
+
+                    if not in_flight:
+                        if all(reader.finished and not reader.has_frame() for reader in self.readers):
+                            break
+                        time.sleep(POLL_INTERVAL)
+                        continue
+
+                    done, _ = wait(in_flight, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._handle_result(future, *in_flight.pop(future))
+
+                # Let frames already in the pool finish
+                for future in list(in_flight):
+                    self._handle_result(future, *in_flight.pop(future))
+            finally:
+                for reader in self.readers:
+                    reader.stop()
+                for reader in self.readers:
+                    reader.join(timeout=RECONNECT_DELAY)
+
+    def _handle_result(self, future, reader, now):
+        reader.processed += 1
+        try:
+            face_locations, face_encodings = future.result()
+        except Exception as e:
+            print(f"Camera {reader.camera.name}: recognition failed: {e}")
+            return
+
+        # Long-running process: drop DB connections that timed out
+        close_old_connections()
+        try:
+            match_tracked_faces(
+                reader.camera.company, reader.camera, reader.tracker,
+                face_locations, face_encodings, now
+            )
+        except Exception as e:
+            # e.g. the database went away: skip this frame, keep every camera running
+            print(f"Camera {reader.camera.name}: matching failed: {e}")
+
+    def stats(self):
+        """Per camera (camera, sampled, dropped, static, processed)"""
+        return [
+            (reader.camera, reader.sampled, reader.dropped, reader.gate.skipped, reader.processed)
+            for reader in self.readers
+        ]
@@ -0,0 +1,70 @@
+"""
+Enrol a company's employees from a CSV plus a directory or zip of face images
+(see recognition/bulk_enrolment.py for the CSV columns). Faces are encoded in
+parallel; re-running the same import resumes it (enrolled employees are skipped).
+Admin uploads run this command in its own process, with --status.
+"""
+from pathlib import Path
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import Company
+from recognition.bulk_enrolment import BulkEnrolment, JobStatus, read_rows, write_report
+
+class Command(BaseCommand):
+    help = 'Bulk enrol employees from a CSV and their face images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv', help='Employees CSV')
+        parser.add_argument('images', help='Directory or zip file of face images')
+        parser.add_argument('--company', required=True, help='Company UUID or slug')
+        parser.add_argument('--workers', type=int, help='Encoding processes (default FACE_ENROLMENT_WORKERS, 0 = inline)')
+        parser.add_argument('--batch-size', type=int, help='Employees per insert/update (default FACE_ENROLMENT_BATCH_SIZE)')
+        parser.add_argument('--report', help='Per-row report CSV (default <csv>.report.csv)')
+        parser.add_argument('--status', help='Job status file to keep current (progress + heartbeat)')
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.filter(pk=options['company']).first()
+        except ValidationError:
+            company = None
+        company = company or Company.objects.filter(slug=options['company']).first()
+        if company is None:
+            raise CommandError(f"No company {options['company']}")
+        if not Path(options['images']).exists():
+            raise CommandError(f"No such file or directory: {options['images']}")
+        
+        report = options['report'] or f"{options['csv']}.report.csv"
+        status = JobStatus(options['status']) if options['status'] else None
+        
+        def log(message):
+            self.stdout.write(message)
+            if status:
+                status.update(message=message)
+        
+        if status:
+            status.start_heartbeat()
+        results = []
+        try:
+            enrolment = BulkEnrolment(
+                company, options['images'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                log=log
+            )
+            results = enrolment.results
+            enrolment.run(read_rows(options['csv']))
+        except Exception as e:
+            # Rows handled so far, plus why the rest weren't
+            results.append({'line': '', 'employee_id': '', 'status': 'failed', 'message': f"Import stopped: {e}"})
+            write_report(results, report)
+            if status:
+                status.update('failed', f"Import stopped: {e}")
+            raise
+        finally:
+            if status:
+                status.stop_heartbeat()
+        
+        write_report(results, report)
+        if status:
+            status.update('done')
+        self.stdout.write(self.style.SUCCESS(f"Per-row report: {report}"))
@@ -0,0 +1,48 @@
+"""
+Rewrite legacy pickle encoding files as plain .npy arrays.
+FaceEngine.load_encoding still reads pickles, this just removes the slow/unsafe path.
+Employees' face_encoding_path is pointed at the converted file (older rows may
+hold a relative or outdated path, which employee deletion uses to remove the file).
+"""
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from employees.models import Employee
+from recognition.face_engine import FaceEngine
+
+class Command(BaseCommand):
+    help = 'Convert pickle-format face encoding files to .npy (allow_pickle=False)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report files that would be converted')
+
+    def handle(self, *args, **options):
+        face_engine = FaceEngine()
+        converted = failed = relinked = 0
+        
+        for path in sorted(Path(settings.FACE_ENCODINGS_DIR).rglob('*.npy')):
+            if not face_engine.is_legacy_encoding(path):
+                continue
+            
+            encoding = face_engine.load_encoding(path)
+            if encoding is None:
+                failed += 1
+                self.stderr.write(f"Could not read {path}")
+                continue
+            
+            if not options['dry_run']:
+                face_engine.save_encoding(encoding, path)
+                # face_encodings/<company_id>/<employee_id>.npy (Employee.get_encoding_filename);
+                # update() skips the gallery signals, the encoding itself is unchanged
+                try:
+                    relinked += Employee.objects.filter(
+                        company_id=path.parent.name, employee_id=path.stem
+                    ).exclude(face_encoding_path=str(path)).update(face_encoding_path=str(path))
+                except ValidationError:
+                    # Not in a company directory
+                    pass
+            converted += 1
+            self.stdout.write(f"{'Would convert' if options['dry_run'] else 'Converted'} {path}")
+        
+        self.stdout.write(self.style.SUCCESS(f"Done. {converted} converted, {failed} failed, {relinked} employee paths updated."))
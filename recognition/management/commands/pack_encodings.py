@@ -0,0 +1,29 @@
+"""
+Migrate per-employee encoding files into the packed per-company store.
+Re-running it also compacts stores (drops rows of deleted/re-enrolled employees).
+"""
+from django.core.management.base import BaseCommand
+from employees.models import Employee
+from recognition.encoding_manager import EncodingManager
+
+class Command(BaseCommand):
+    help = 'Pack per-employee face encodings into one memory-mapped store per company'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Only pack this company (UUID)')
+
+    def handle(self, *args, **options):
+        manager = EncodingManager()
+        
+        company_ids = Employee.objects.filter(is_face_registered=True)
+        if options['company']:
+            company_ids = company_ids.filter(company_id=options['company'])
+        company_ids = company_ids.order_by().values_list('company_id', flat=True).distinct()
+        
+        total = 0
+        for company_id in company_ids:
+            count = manager.pack_company(company_id)
+            total += count
+            self.stdout.write(f"Packed {count} encodings for company {company_id}")
+        
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} encodings packed."))
@@ -0,0 +1,53 @@
+"""
+Long-running worker: server-side recognition for the active IP/RTSP cameras.
+Attendance is marked with the camera FK set. Stop with Ctrl+C / SIGTERM.
+"""
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from attendance.writer import attendance_writer
+from cameras.models import Camera
+from recognition.ingest import CameraIngestor
+
+class Command(BaseCommand):
+    help = 'Read active camera streams and mark attendance from them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--camera', type=int, action='append', help='Only this camera id (repeatable)')
+        parser.add_argument('--company', help='Only cameras of this company (UUID)')
+        parser.add_argument(
+            '--fps', type=float, default=getattr(settings, 'FACE_CAMERA_SAMPLE_FPS', 2.0),
+            help='Frames sampled per second per camera'
+        )
+        parser.add_argument('--workers', type=int, help='Recognition processes (default: CPU cores)')
+        parser.add_argument('--duration', type=float, help='Stop after this many seconds')
+
+    def handle(self, *args, **options):
+        cameras = Camera.objects.filter(status='active').select_related('company', 'location')
+        if options['camera']:
+            cameras = cameras.filter(pk__in=options['camera'])
+        if options['company']:
+            cameras = cameras.filter(company_id=options['company'])
+        cameras = list(cameras)
+        if not cameras:
+            raise CommandError('No active cameras to read.')
+        
+        ingestor = CameraIngestor(cameras, sample_fps=options['fps'], workers=options['workers'])
+        signal.signal(signal.SIGTERM, lambda signum, frame: ingestor.stop())
+        
+        self.stdout.write(
+            f"Reading {len(cameras)} camera(s) at {options['fps']} fps with {ingestor.workers} worker(s)"
+        )
+        try:
+            ingestor.run(duration=options['duration'])
+        except KeyboardInterrupt:
+            pass
+        # Punches still queued for the database
+        attendance_writer.flush()
+        
+        for camera, sampled, dropped, static, processed in ingestor.stats():
+            self.stdout.write(
+                f"{camera.name}: {sampled} frames sampled, {processed} processed, "
+                f"{static} static, {dropped} dropped"
+            )
+        self.stdout.write(self.style.SUCCESS('Camera workers stopped.'))
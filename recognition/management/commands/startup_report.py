@@ -0,0 +1,41 @@
+"""
+Startup timing report: what a process pays to serve the web app (URLconf,
+i.e. every view module) versus the ML stack and the encoding galleries,
+which are only loaded on first recognition (see recognition/ml.py).
+"""
+import resource
+import time
+from importlib import import_module
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recognition.ml import is_loaded, load_times, ml
+
+class Command(BaseCommand):
+    help = 'Report load time and memory of the web app, the ML stack and the encoding galleries'
+    # System checks import the URLconf, which is what's being measured
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-gallery', action='store_true', help="Don't load the encoding galleries")
+
+    def handle(self, *args, **options):
+        self.report('URLconf (all views)', lambda: import_module(settings.ROOT_URLCONF))
+        if is_loaded():
+            self.stderr.write("The ML stack was loaded by the URLconf: some view imports it eagerly")
+
+        self.report('ML stack', ml)
+        for name, seconds in load_times.items():
+            self.stdout.write(f"    {name:<22}{seconds:8.2f}s")
+
+        if not options['skip_gallery']:
+            from recognition.pipeline import encoding_manager
+            cache = self.report('Encoding galleries', encoding_manager.refresh_cache)
+            self.stdout.write(f"    {len(cache)} companies, {sum(len(gallery) for gallery in cache.values())} encodings")
+
+    def report(self, label, load):
+        started = time.monotonic()
+        result = load()
+        # ru_maxrss is in KB on Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f"{label:<26}{time.monotonic() - started:8.2f}s   peak RSS {peak_mb:.0f} MB")
+        return result
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-17 06:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0002_company_is_verified_company_proof_document_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryVersion',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='gallery_version', serialize=False, to='accounts.company')),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'gallery_versions',
+            },
+        ),
+    ]
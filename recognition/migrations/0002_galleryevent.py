@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-17 06:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_company_is_verified_company_proof_document_and_more'),
+        ('recognition', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveBigIntegerField()),
+                ('employee_id', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gallery_events', to='accounts.company')),
+            ],
+            options={
+                'db_table': 'gallery_events',
+                'ordering': ['generation'],
+                'unique_together': {('company', 'generation')},
+            },
+        ),
+    ]
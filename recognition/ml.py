@@ -0,0 +1,49 @@
+"""
+ML Stack Loader
+cv2 and face_recognition (whose import loads the dlib models) are imported on
+first use through ml(), never at module import. Processes that only serve the
+dashboard, reports or admin - and management commands such as migrate - start
+without them.
+
+    from .ml import ml
+    cv2 = ml().cv2
+    ml().face_recognition.face_encodings(...)
+"""
+import importlib
+import threading
+import time
+from types import SimpleNamespace
+
+# Import order: face_recognition pulls in dlib and loads its models
+ML_MODULES = ('cv2', 'dlib', 'face_recognition')
+
+_stack = None
+_lock = threading.Lock()
+
+# Seconds each module took to import in this process (see the startup_report command)
+load_times = {}
+
+
+def ml():
+    """The loaded ML modules (namespace with .cv2, .dlib, .face_recognition)"""
+    global _stack
+    if _stack is None:
+        with _lock:
+            if _stack is None:
+                _stack = _load()
+    return _stack
+
+
+def is_loaded():
+    return _stack is not None
+
+
+def _load():
+    started = time.monotonic()
+    modules = {}
+    for name in ML_MODULES:
+        module_started = time.monotonic()
+        modules[name] = importlib.import_module(name)
+        load_times[name] = time.monotonic() - module_started
+    print(f"DEBUG: ML stack loaded in {time.monotonic() - started:.2f}s")
+    return SimpleNamespace(**modules)
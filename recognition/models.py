@@ -1,3 +1,99 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from accounts.models import Company
 
-# Create your models here.
+# Journal entries kept per company; workers further behind do a full company reload
+GALLERY_EVENT_RETENTION = 1000
+
+class GalleryVersion(models.Model):
+    """
+    Per-company generation counter for the face encoding gallery.
+    Bumped whenever a company's enrolled faces change, so every worker
+    can cheaply tell whether its in-memory gallery is stale.
+    """
+    company = models.OneToOneField(
+        Company,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='gallery_version'
+    )
+    generation = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'gallery_versions'
+    
+    def __str__(self):
+        return f"{self.company_id} @ {self.generation}"
+    
+    @classmethod
+    def current(cls, company_id):
+        """Current generation for a company (0 if never bumped)"""
+        generation = cls.objects.filter(company_id=company_id).values_list('generation', flat=True).first()
+        return generation or 0
+    
+    @classmethod
+    def record_change(cls, company_id, employee_id):
+        """
+        Advance the generation and journal which employee changed,
+        so workers can patch that one row instead of reloading.
+        Returns None if the company has been deleted meanwhile.
+        """
+        with transaction.atomic():
+            if not Company.objects.filter(pk=company_id).exists():
+                # Deleted (on_commit callbacks run after the cascade); no gallery left to version
+                return None
+            version, _ = cls.objects.select_for_update().get_or_create(company_id=company_id)
+            version.generation += 1
+            version.save(update_fields=['generation', 'updated_at'])
+            GalleryEvent.objects.create(
+                company_id=company_id,
+                generation=version.generation,
+                employee_id=employee_id
+            )
+            GalleryEvent.objects.filter(
+                company_id=company_id,
+                generation__lte=version.generation - GALLERY_EVENT_RETENTION
+            ).delete()
+        return version.generation
+    
+    @classmethod
+    def bump(cls, company_id):
+        """
+        Atomically advance the company's generation without a journal entry.
+        Workers see the gap and fall back to a full reload of the company.
+        """
+        updated = cls.objects.filter(company_id=company_id).update(
+            generation=F('generation') + 1,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(company_id=company_id, generation=1)
+            except IntegrityError:
+                # Another process created the row first
+                cls.objects.filter(company_id=company_id).update(
+                    generation=F('generation') + 1,
+                    updated_at=timezone.now()
+                )
+
+
+class GalleryEvent(models.Model):
+    """
+    Journal of single-employee gallery changes, one row per generation.
+    Workers replay these in order to patch their cached gallery in place.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='gallery_events')
+    generation = models.PositiveBigIntegerField()
+    employee_id = models.CharField(max_length=20)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'gallery_events'
+        ordering = ['generation']
+        unique_together = ['company', 'generation']
+    
+    def __str__(self):
+        return f"{self.company_id} @ {self.generation}: {self.employee_id}"
@@ -0,0 +1,50 @@
+"""
+Frame-Change Gate
+Cheap pre-detection check: a stream's frame is compared with the last frame
+that was actually processed (downscaled, blurred grayscale diff). When the
+scene is static the previous results are returned and detection is skipped,
+so an idle kiosk costs a resize and a diff per frame.
+
+A static scene is still re-processed every `max_skip_seconds` in case the
+change was too gradual to trip the threshold.
+"""
+import numpy as np
+from django.conf import settings
+
+from .ml import ml
+
+# Comparison resolution: enough to see a person walk in, tiny to diff
+GATE_SIZE = (64, 48)
+
+
+class FrameGate:
+    """Per-stream static-scene detector"""
+
+    def __init__(self, pixel_threshold=None, min_changed=None, max_skip_seconds=None):
+        # Grey-level difference (0-255) for a pixel to count as changed
+        self.pixel_threshold = pixel_threshold if pixel_threshold is not None else getattr(settings, 'FACE_GATE_PIXEL_THRESHOLD', 20)
+        # Share of changed pixels that makes the frame worth detecting on
+        self.min_changed = min_changed if min_changed is not None else getattr(settings, 'FACE_GATE_MIN_CHANGED', 0.01)
+        self.max_skip_seconds = max_skip_seconds if max_skip_seconds is not None else getattr(settings, 'FACE_GATE_MAX_SKIP_SECONDS', 10.0)
+        self.reference = None
+        self.processed_at = None
+        # Results of the last processed frame, served for static frames
+        self.results = []
+        self.skipped = 0
+
+    def changed(self, frame, now):
+        """True if `frame` should go through detection (it becomes the new reference)"""
+        cv2 = ml().cv2
+        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), GATE_SIZE, interpolation=cv2.INTER_AREA)
+        # Blur away sensor noise / JPEG artefacts
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+
+        if self.reference is not None and now - self.processed_at < self.max_skip_seconds:
+            diff = cv2.absdiff(small, self.reference)
+            if np.count_nonzero(diff > self.pixel_threshold) < self.min_changed * diff.size:
+                self.skipped += 1
+                return False
+
+        self.reference = small
+        self.processed_at = now
+        return True
@@ -0,0 +1,342 @@
+"""
+Frame Pipeline Helpers
+Shared by the HTTP recognition API and other frame sources.
+"""
+import base64
+import binascii
+import json
+import time
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from .face_engine import FaceEngine
+from .ml import is_loaded, ml
+from .encoding_manager import EncodingManager
+from employees.models import Employee
+from cameras.models import Camera
+from attendance.writer import attendance_writer
+
+# Global instances (one gallery cache per process)
+face_engine = FaceEngine()
+encoding_manager = EncodingManager()
+# The writer's service: its recent-punch cache is shared with the write queue
+attendance_service = attendance_writer.service
+
+# Bodies sent as raw encoded images (live feed uses canvas.toBlob -> image/jpeg)
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+def warm_up():
+    """
+    Load everything recognition needs (ML stack with the dlib models, every
+    company's gallery) now, so the first request doesn't pay for it.
+    Called by the gunicorn hooks (gunicorn_config.py) and executor workers.
+    """
+    ml()
+    encoding_manager.refresh_cache()
+
+def is_warm():
+    """True once warm_up() has run in this process"""
+    return is_loaded() and encoding_manager.loaded_at is not None
+
+def camera_for_key(api_key):
+    """Active camera owning a device key (X-Camera-Key), or None"""
+    if not api_key:
+        return None
+    return Camera.objects.select_related('company').filter(
+        api_key=api_key,
+        status='active'
+    ).first()
+
+def decode_image(data):
+    """
+    Decode JPEG/PNG bytes (or any buffer) straight into a BGR frame.
+    Returns None if the data isn't a readable image.
+    """
+    if not data:
+        return None
+    cv2 = ml().cv2
+    nparr = np.frombuffer(data, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def read_frame_request(request):
+    """
+    Read the encoded frame from a recognition request, by content type:
+      - image/jpeg etc: the raw body IS the image (no base64, no JSON)
+      - multipart/form-data: uploaded file field "image"
+      - application/json: legacy {"image": "data:image/jpeg;base64,..."}
+    Returns the image bytes (decoded later by decode_image) or None.
+    Frames over DATA_UPLOAD_MAX_MEMORY_SIZE raise RequestDataTooBig, whatever the format.
+    """
+    content_type = request.content_type
+    
+    if content_type in RAW_IMAGE_TYPES:
+        return request.body
+    
+    if content_type == 'multipart/form-data':
+        upload = request.FILES.get('image')
+        if upload is None:
+            return None
+        return read_upload(upload)
+    
+    data = json.loads(request.body)
+    return data_url_bytes(data.get('image'))
+
+def read_upload(upload):
+    """Bytes of an uploaded image; RequestDataTooBig over DATA_UPLOAD_MAX_MEMORY_SIZE"""
+    # File uploads aren't covered by DATA_UPLOAD_MAX_MEMORY_SIZE, so check them here
+    max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    if max_size is not None and upload.size > max_size:
+        raise RequestDataTooBig('Uploaded image exceeds DATA_UPLOAD_MAX_MEMORY_SIZE.')
+    return upload.read()
+
+def data_url_bytes(image_data):
+    """Browser data URL "data:image/jpeg;base64,<payload>" -> image bytes, None if missing or malformed"""
+    if not isinstance(image_data, str) or "," not in image_data:
+        return None
+    header, encoded = image_data.split(",", 1)
+    try:
+        return base64.b64decode(encoded)
+    except binascii.Error:
+        return None
+
+def read_batch_request(request):
+    """
+    Read the encoded frames of a batch request:
+      - multipart/form-data: files "images" (full frames) and/or "crops" (face crops)
+      - application/json: {"images": [<data URL>, ...], "crops": [...]}
+    Returns (images, crops), lists of image bytes (None for a malformed item).
+    Any file over DATA_UPLOAD_MAX_MEMORY_SIZE raises RequestDataTooBig.
+    """
+    if request.content_type == 'multipart/form-data':
+        return tuple(
+            [read_upload(upload) for upload in request.FILES.getlist(field)]
+            for field in ('images', 'crops')
+        )
+    
+    data = json.loads(request.body)
+    return tuple(
+        [data_url_bytes(image_data) for image_data in data.get(field) or []]
+        for field in ('images', 'crops')
+    )
+
+def detection_options(camera=None):
+    """(scale, upsample) for face detection: the camera's own, else the global settings"""
+    if camera is not None:
+        return camera.get_detection_options()
+    return settings.FACE_DETECTION_SCALE, settings.FACE_DETECTION_UPSAMPLE
+
+def detect_and_encode(frame, crop=False, tracker=None, now=None, scale=1.0, upsample=1):
+    """
+    Detect and encode the faces of one BGR frame.
+    crop=True: the frame is already a single face crop, detection is skipped.
+    tracker: faces continuing a recently identified track (see tracking.py)
+             are not encoded; their entry in face_encodings is None.
+    scale/upsample: detection resolution (see detection_options); boxes are
+             returned and encoded at full resolution.
+    Returns (face_locations, face_encodings).
+    """
+    cv2, face_recognition = ml().cv2, ml().face_recognition
+    
+    # Color Space Conversion (CRITICAL)
+    # face_recognition library EXPECTS RGB. OpenCV gives BGR.
+    # If this is wrong, a known face will look "blue" to the AI and won't match "skin" tones.
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    
+    if crop:
+        height, width = rgb_frame.shape[:2]
+        face_locations = [(0, width, height, 0)]
+    else:
+        # Using 'hog' model is faster for CPU. If accuracy is poor, use model="cnn".
+        face_locations = face_engine.detect_faces(rgb_frame, scale=scale, upsample=upsample, model="hog")
+    
+    if tracker is None:
+        return face_locations, face_recognition.face_encodings(rgb_frame, face_locations)
+    
+    # Encoding is the expensive step: skip faces whose identity the tracker already knows
+    reused = tracker.reusable(face_locations, now)
+    encoded = iter(face_recognition.face_encodings(
+        rgb_frame,
+        [location for location, track in zip(face_locations, reused) if track is None]
+    ))
+    face_encodings = [None if track else next(encoded) for track in reused]
+    return face_locations, face_encodings
+
+def match_faces(company, camera, face_locations, face_encodings, punches=None):
+    """
+    Match faces (from one frame or many) against the company's gallery in
+    one distance computation and mark attendance for confident matches.
+    With a `punches` list the punches are collected there instead, for the
+    caller to submit in its own process (see submit_punches).
+    Returns the per-face results sent back to clients, in input order.
+    """
+    # Company gallery (reloaded only when its GalleryVersion changed)
+    gallery = encoding_manager.get_gallery(company.id)
+
+    # Match Faces (tenant scoped: only this company's gallery is searched)
+    matches = face_engine.recognize_faces(face_encodings, gallery)
+
+    # One query for every employee that will be marked
+    confident_ids = {
+        employee_id for employee_id, confidence, distance in matches
+        if employee_id and confidence >= attendance_service.confidence_threshold
+    }
+    employees = {}
+    if confident_ids:
+        employees = {
+            employee.employee_id: employee
+            for employee in Employee.objects.filter(company=company, employee_id__in=confident_ids)
+        }
+
+    results = []
+
+    for (top, right, bottom, left), (employee_id, confidence, distance) in zip(face_locations, matches):
+        name = "Unknown"
+        
+        if len(gallery):
+            # DEBUG PRINT: Watch your terminal to see the distance score!
+            # Distance < 0.6 is a match. Lower is better.
+            print(f"Face detected. Best match: {employee_id}, Distance: {distance:.4f}")
+
+        if employee_id:
+            name = employee_id
+            
+            # Mark Attendance (queued: the response doesn't wait on the database)
+            employee = employees.get(employee_id)
+            if employee and confidence >= attendance_service.confidence_threshold:
+                punch = {
+                    'employee': employee,
+                    'confidence_score': confidence,
+                    'face_distance': distance,
+                    'camera': camera
+                }
+                if punches is not None:
+                    punches.append(punch)
+                else:
+                    submit_punches([punch])
+
+        results.append({
+            'id': name,
+            'name': name,
+            'confidence': round(confidence, 1),
+            'box': {
+                'top': top,
+                'right': right,
+                'bottom': bottom,
+                'left': left
+            }
+        })
+
+    return results
+
+def submit_punches(punches):
+    """
+    Queue attendance for punches collected by match_faces. Recognition jobs
+    hand theirs back to the web process, so every punch goes through that
+    process' one attendance writer and recent-punch cache, wherever the job ran.
+    """
+    for punch in punches:
+        try:
+            attendance_writer.submit(**punch)
+        except Exception as e:
+            print(f"Attendance Error: {e}")
+
+def match_tracked_faces(company, camera, tracker, face_locations, face_encodings, now, punches=None):
+    """
+    match_faces for the output of detect_and_encode(..., tracker=tracker, now=now):
+    faces without an encoding take their tracked identity, the rest are
+    matched (and marked) as usual. Advances the tracker to this frame.
+    """
+    reused = tracker.reusable(face_locations, now)
+    encoded = [encoding is not None for encoding in face_encodings]
+    matched = iter(match_faces(
+        company, camera,
+        [location for location, fresh in zip(face_locations, encoded) if fresh],
+        [encoding for encoding in face_encodings if encoding is not None],
+        punches
+    ))
+    results = [
+        next(matched) if fresh else track.result_at(location)
+        for location, fresh, track in zip(face_locations, encoded, reused)
+    ]
+    tracker.update(face_locations, results, encoded, now)
+    return results
+
+def recognize_image(frame, company, camera=None, tracker=None, gate=None, punches=None):
+    """
+    Detect, encode and match every face in a BGR frame against the
+    company's gallery, marking attendance for confident matches.
+    With a per-stream `tracker`, already identified faces skip encoding;
+    with a per-stream `gate`, static frames skip detection entirely and
+    get the previous results. `punches` as in match_faces.
+    Returns the per-face results sent back to clients.
+    """
+    now = time.monotonic()
+    if gate is not None and not gate.changed(frame, now):
+        return gate.results
+    
+    scale, upsample = detection_options(camera)
+    if tracker is None:
+        face_locations, face_encodings = detect_and_encode(frame, scale=scale, upsample=upsample)
+        results = match_faces(company, camera, face_locations, face_encodings, punches)
+    else:
+        face_locations, face_encodings = detect_and_encode(
+            frame, tracker=tracker, now=now, scale=scale, upsample=upsample
+        )
+        results = match_tracked_faces(company, camera, tracker, face_locations, face_encodings, now, punches)
+    
+    if gate is not None:
+        gate.results = results
+    return results
+
+def recognize_batch(frames, company, camera=None, crops=(), punches=None):
+    """
+    recognize_image for many frames and/or pre-cropped faces: the faces of
+    every item are matched together in a single gallery lookup.
+    Items may be None where the upload couldn't be decoded. `punches` as in match_faces.
+    Returns (frame_results, crop_results), one {'status', 'faces'} per item in input order.
+    """
+    scale, upsample = detection_options(camera)
+    items = [(frame, False) for frame in frames] + [(crop, True) for crop in crops]
+    detected = [
+        detect_and_encode(frame, crop=crop, scale=scale, upsample=upsample) if frame is not None else None
+        for frame, crop in items
+    ]
+    face_locations = [location for item in detected if item for location in item[0]]
+    face_encodings = [encoding for item in detected if item for encoding in item[1]]
+    faces = iter(match_faces(company, camera, face_locations, face_encodings, punches))
+
+    results = []
+    for item in detected:
+        if item is None:
+            results.append({'status': 'error', 'message': 'No image data'})
+        else:
+            results.append({'status': 'success', 'faces': [next(faces) for _ in item[0]]})
+    return results[:len(frames)], results[len(frames):]
+
+def recognize_frame_data(data, company, camera=None, tracker=None, gate=None):
+    """
+    Recognition job for one encoded frame (see executor.py): decode + recognize_image.
+    The stream state is returned so it can travel back from a worker process,
+    and so are the punches, which the caller submits (submit_punches).
+    Returns (results or None if undecodable, tracker, gate, punches).
+    """
+    punches = []
+    frame = decode_image(data)
+    if frame is None:
+        return None, tracker, gate, punches
+    return recognize_image(frame, company, camera, tracker, gate, punches), tracker, gate, punches
+
+def recognize_batch_data(images, crops, company, camera=None):
+    """
+    Recognition job for a batch of encoded frames/crops: decode + recognize_batch.
+    Returns (frame_results, crop_results, punches); the caller submits the punches.
+    """
+    punches = []
+    frame_results, crop_results = recognize_batch(
+        [decode_image(data) for data in images],
+        company,
+        camera,
+        crops=[decode_image(data) for data in crops],
+        punches=punches
+    )
+    return frame_results, crop_results, punches
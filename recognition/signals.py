@@ -0,0 +1,59 @@
+"""
+Gallery invalidation signals
+Changes to what the gallery holds for an employee (enrolment, encoding file,
+status, employee ID, deletion) advance the company's GalleryVersion and
+journal the employee, so serving workers patch just that row of their cached
+gallery. Other edits (name, phone, department...) leave the gallery alone.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import Company
+from employees.models import Employee
+from .models import GalleryVersion
+
+# Employee fields the cached gallery depends on
+GALLERY_FIELDS = ('employee_id', 'is_face_registered', 'face_encoding_path', 'status')
+
+def _record_after_commit(company_id, employee_id):
+    # Record only once the change is visible to other workers' connections
+    transaction.on_commit(lambda: GalleryVersion.record_change(company_id, employee_id))
+
+def _gallery_state(employee):
+    return tuple(getattr(employee, field) for field in GALLERY_FIELDS)
+
+@receiver(pre_save, sender=Employee)
+def employee_saving(sender, instance, update_fields=None, **kwargs):
+    # Stored gallery fields, to compare against once saved (None: nothing to compare)
+    instance._gallery_before = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not set(update_fields) & set(GALLERY_FIELDS):
+        return
+    instance._gallery_before = Employee.objects.filter(pk=instance.pk).values_list(*GALLERY_FIELDS).first()
+
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, created, **kwargs):
+    before = instance.__dict__.pop('_gallery_before', None)
+    # Re-enrolment writes a new encoding to the same path (see EncodingManager.save_employee_encoding)
+    encoding_changed = instance.__dict__.pop('_encoding_changed', False)
+    
+    if created:
+        if instance.is_face_registered:
+            _record_after_commit(instance.company_id, instance.employee_id)
+        return
+    if before is None and not encoding_changed:
+        return
+    if encoding_changed or before != _gallery_state(instance):
+        _record_after_commit(instance.company_id, instance.employee_id)
+    if before is not None and before[0] != instance.employee_id:
+        # Renamed: drop the row under the old ID too
+        _record_after_commit(instance.company_id, before[0])
+
+@receiver(post_delete, sender=Employee)
+def employee_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Company) or (isinstance(origin, QuerySet) and origin.model is Company):
+        # Cascade of a company deletion, the whole gallery goes with it
+        return
+    _record_after_commit(instance.company_id, instance.employee_id)
@@ -0,0 +1,164 @@
+"""
+Streaming Recognition (WebSocket)
+Raw ASGI handler mounted by FaceCognitionPlatform/asgi.py at /recognition/ws/.
+
+A kiosk keeps one socket open and pushes binary JPEG frames; results come
+back as JSON text messages. Only the newest frame waits while one is being
+processed - older ones are dropped, so a slow server never builds a backlog.
+"""
+import asyncio
+import json
+import time
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+
+from .executor import RecognitionBusy, RecognitionTimeout, recognition_executor
+from .pipeline import camera_for_key, recognize_frame_data, submit_punches
+from .motion import FrameGate
+from .tracking import FaceTracker
+
+STREAM_PATH = '/recognition/ws/'
+
+
+class LatestFrame:
+    """Single-slot frame buffer: put() overwrites whatever is still waiting"""
+
+    def __init__(self):
+        self.data = None
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def put(self, data):
+        if self.data is not None:
+            # Server is behind: the waiting frame is stale, replace it
+            self.dropped += 1
+        self.data = data
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self):
+        """Newest frame, or None once the socket is closed"""
+        await self._ready.wait()
+        self._ready.clear()
+        if self.closed:
+            return None
+        data, self.data = self.data, None
+        return data
+
+
+def authenticate(scope):
+    """
+    Same rules as views.resolve_caller, applied to the websocket handshake.
+    Device key: X-Camera-Key header or ?key= (browsers can't set socket headers).
+    Session: the sessionid cookie, only from a same-origin page.
+
+    Returns (company, camera) - both None if the caller is unknown.
+    """
+    close_old_connections()
+    headers = {name.decode('latin1'): value.decode('latin1') for name, value in scope['headers']}
+    query = parse_qs(scope.get('query_string', b'').decode())
+
+    api_key = headers.get('x-camera-key') or query.get('key', [None])[0]
+    if api_key:
+        camera = camera_for_key(api_key)
+        if camera:
+            return camera.company, camera
+        return None, None
+
+    # Cookies ride along on cross-site sockets too, so check the Origin
+    origin = headers.get('origin')
+    if not origin or urlsplit(origin).netloc != headers.get('host'):
+        return None, None
+
+    cookies = SimpleCookie(headers.get('cookie', ''))
+    session_cookie = cookies.get(settings.SESSION_COOKIE_NAME)
+    if session_cookie is None:
+        return None, None
+
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_cookie.value)
+    user = get_user(SimpleNamespace(session=session))
+    if user.is_authenticated and user.company_id:
+        return user.company, None
+    return None, None
+
+
+def recognize_message(data, company, camera, tracker, gate):
+    """
+    Decode + detect + match one binary frame through the recognition
+    executor (called from a worker thread). Returns (result, tracker, gate).
+    """
+    close_old_connections()
+    try:
+        faces, tracker, gate, punches = recognition_executor.call(
+            recognize_frame_data, data, company, camera, tracker, gate
+        )
+        submit_punches(punches)
+    except RecognitionBusy:
+        return {'status': 'error', 'message': 'Recognition busy'}, tracker, gate
+    except RecognitionTimeout:
+        return {'status': 'error', 'message': 'Recognition timed out'}, tracker, gate
+    if faces is None:
+        return {'status': 'error', 'message': 'No image data'}, tracker, gate
+    return {'status': 'success', 'faces': faces}, tracker, gate
+
+
+async def process_frames(slot, send, company, camera):
+    """Recognize frames one at a time, always taking the newest"""
+    # thread_sensitive=False: sockets don't queue behind each other on one thread
+    recognize = sync_to_async(recognize_message, thread_sensitive=False)
+    # One socket = one stream: identities and the static-scene reference carry over between its frames
+    tracker = FaceTracker()
+    gate = FrameGate()
+    while True:
+        data = await slot.get()
+        if data is None:
+            return
+
+        started = time.monotonic()
+        try:
+            result, tracker, gate = await recognize(data, company, camera, tracker, gate)
+        except Exception as e:
+            result = {'status': 'error', 'message': str(e)}
+        result['process_ms'] = round((time.monotonic() - started) * 1000)
+        result['dropped'] = slot.dropped
+        await send({'type': 'websocket.send', 'text': json.dumps(result)})
+
+
+async def recognition_stream(scope, receive, send):
+    """ASGI websocket application for one kiosk/camera connection"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    company, camera = await sync_to_async(authenticate)(scope)
+    if company is None:
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    await send({'type': 'websocket.accept'})
+
+    slot = LatestFrame()
+    worker = asyncio.create_task(process_frames(slot, send, company, camera))
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes'):
+                slot.put(message['bytes'])
+            if worker.done():
+                # The sender failed (e.g. socket already gone)
+                break
+    finally:
+        slot.close()
+        worker.cancel()
@@ -1,3 +1,951 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import base64
+import csv
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+import cv2
+import numpy as np
 
-# Create your tests here.
+from .bulk_enrolment import BulkEnrolment, JobStatus, read_rows
+from .encoding_manager import CompanyGallery
+from .face_engine import FaceEngine
+from .encoding_store import EncodingStore
+from .executor import RecognitionBusy, RecognitionExecutor, RecognitionTimeout
+from .indexes import ExactIndex, IVFIndex, build_index
+from .ml import ml
+from .models import GalleryEvent, GalleryVersion
+from .streaming import LatestFrame
+from . import pipeline
+from .pipeline import camera_for_key
+from .ingest import CameraIngestor
+from .motion import FrameGate
+from .tracking import FaceTracker, box_iou
+from accounts.models import Company, User
+from attendance.models import AttendanceRecord
+from cameras.models import Camera, Location
+from employees.models import Department, Employee
+
+# Sample enrolment photo shipped with the repo
+FACE_IMAGE = Path(settings.BASE_DIR) / 'media' / 'faces' / 'DA01_face.jpeg'
+# Dashboard/punch caching goes to memory, not the project's file cache
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def synthetic_gallery(size, seed=0, groups=64, dim=128):
+    """
+    Clustered 128-D vectors roughly shaped like dlib face encodings:
+    different people sit ~1.0 apart, re-captures of one person ~0.2-0.3.
+    Returns (matrix, sq_norms, rng).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.05, (groups, dim))
+    members = rng.integers(0, groups, size)
+    matrix = (centers[members] + rng.normal(0, 0.035, (size, dim))).astype(np.float32)
+    sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+    return matrix, sq_norms, rng
+
+
+def recall_at_1(index, exact, queries):
+    """Share of queries where `index` returns the same nearest row as exact search"""
+    hits = sum(index.search(q)[0] == exact.search(q)[0] for q in queries)
+    return hits / len(queries)
+
+
+class IVFRecallTests(SimpleTestCase):
+    """Recall-vs-exact harness for the approximate gallery index"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.matrix, cls.sq_norms, rng = synthetic_gallery(20000)
+        rows = rng.choice(len(cls.matrix), 300, replace=False)
+        cls.queries = (cls.matrix[rows] + rng.normal(0, 0.02, (300, 128))).astype(np.float32)
+        cls.exact = ExactIndex(cls.matrix, cls.sq_norms)
+        cls.ivf = IVFIndex(cls.matrix, cls.sq_norms)
+
+    def test_default_probe_recall(self):
+        self.assertGreaterEqual(recall_at_1(self.ivf, self.exact, self.queries), 0.99)
+
+    def test_recall_grows_with_probes(self):
+        recalls = []
+        for n_probe in (1, 4, 16):
+            self.ivf.n_probe = n_probe
+            recalls.append(recall_at_1(self.ivf, self.exact, self.queries))
+        self.ivf.n_probe = 8
+        self.assertEqual(recalls, sorted(recalls))
+
+    def test_probing_all_lists_is_exact(self):
+        self.ivf.n_probe = self.ivf.n_lists
+        try:
+            for query in self.queries[:50]:
+                row, distance = self.ivf.search(query)
+                exact_row, exact_distance = self.exact.search(query)
+                self.assertEqual(row, exact_row)
+                self.assertAlmostEqual(distance, exact_distance, places=4)
+        finally:
+            self.ivf.n_probe = 8
+
+
+class BuildIndexTests(SimpleTestCase):
+
+    def test_backend_selection(self):
+        matrix, sq_norms, _ = synthetic_gallery(500)
+        self.assertIsInstance(build_index(matrix, sq_norms), ExactIndex)
+        self.assertIsInstance(build_index(matrix, sq_norms, ivf_min_size=100), IVFIndex)
+        self.assertIsInstance(build_index(matrix, sq_norms, backend='ivf'), IVFIndex)
+        self.assertIsInstance(
+            build_index(matrix, sq_norms, backend='exact', ivf_min_size=100), ExactIndex
+        )
+
+    def test_unknown_backend(self):
+        matrix, sq_norms, _ = synthetic_gallery(10)
+        with self.assertRaises(ValueError):
+            build_index(matrix, sq_norms, backend='faiss')
+
+
+class CompanyGalleryUpdateTests(SimpleTestCase):
+    """Copy-on-write add/update/remove must match a gallery rebuilt from scratch"""
+
+    def check_against_rebuild(self, gallery, queries):
+        live = sorted(gallery.rows)
+        rebuilt = CompanyGallery(live, gallery.matrix[[gallery.rows[e] for e in live]])
+        for query in queries:
+            self.assertEqual(gallery.best_match(query)[0], rebuilt.best_match(query)[0])
+
+    def exercise(self, index_options):
+        matrix, _, rng = synthetic_gallery(3000, seed=3)
+        ids = [f'E{i}' for i in range(len(matrix))]
+        gallery = CompanyGallery(ids[:2000], matrix[:2000], index_options)
+
+        for employee_id, encoding in zip(ids[2000:], matrix[2000:]):
+            gallery.upsert(employee_id, encoding)
+        for employee_id in ids[:300]:
+            gallery.remove(employee_id)
+        gallery.upsert('E500', matrix[2999])
+
+        self.assertEqual(len(gallery), 2700)
+        self.assertNotIn('E0', gallery)
+        self.assertNotIn(gallery.best_match(matrix[0] + 0.001)[0], ids[:300])
+        self.assertIn(gallery.best_match(matrix[2999])[0], ('E500', 'E2999'))
+        self.check_against_rebuild(gallery, matrix[rng.choice(3000, 100, replace=False)])
+
+    def test_exact_updates(self):
+        self.exercise({'backend': 'exact'})
+
+    def test_ivf_updates(self):
+        self.exercise({'backend': 'ivf', 'n_probe': 1000})
+
+    def test_best_matches_agree_with_best_match(self):
+        matrix, _, rng = synthetic_gallery(2000, seed=4)
+        ids = [f'E{i}' for i in range(len(matrix))]
+        queries = matrix[rng.choice(2000, 40, replace=False)] + 0.001
+        for options in ({'backend': 'exact'}, {'backend': 'ivf', 'n_probe': 4}):
+            gallery = CompanyGallery(ids, matrix, options)
+            gallery.remove('E7')
+            batch = gallery.best_matches(queries)
+            for query, (employee_id, distance) in zip(queries, batch):
+                single_id, single_distance = gallery.best_match(query)
+                self.assertEqual(employee_id, single_id)
+                self.assertAlmostEqual(distance, single_distance, places=4)
+        self.assertEqual(CompanyGallery([], []).best_matches(queries[:2]), [(None, 1.0)] * 2)
+
+    def test_published_arrays_are_never_modified(self):
+        matrix, _, _ = synthetic_gallery(40, seed=6)
+        ids = [f'E{i}' for i in range(len(matrix))]
+        for options in ({'backend': 'exact'}, {'backend': 'ivf', 'n_probe': 2}):
+            gallery = CompanyGallery(ids[:30], matrix[:30], options)
+            before = (gallery.matrix.copy(), gallery.sq_norms.copy(), list(gallery.employee_ids))
+            published = (gallery.matrix, gallery.sq_norms, gallery.employee_ids, gallery.index)
+
+            gallery.remove('E1')
+            gallery.upsert('E2', matrix[35])
+            gallery.upsert('E31', matrix[31])
+
+            np.testing.assert_array_equal(published[0], before[0])
+            np.testing.assert_array_equal(published[1], before[1])
+            self.assertEqual(list(published[2]), before[2])
+            # The old index still answers for the old version
+            self.assertEqual(published[2][published[3].search(matrix[1])[0]], 'E1')
+            self.assertNotEqual(gallery.best_match(matrix[2])[0], 'E2')
+            self.assertEqual(gallery.best_match(matrix[35])[0], 'E2')
+
+    def test_edit_publishes_once(self):
+        matrix, _, _ = synthetic_gallery(10, seed=7)
+        gallery = CompanyGallery(['A', 'B'], matrix[:2])
+        with gallery.edit():
+            gallery.upsert('C', matrix[2])
+            gallery.remove('A')
+            # Searches still see the previous version
+            self.assertIn('A', gallery)
+            self.assertNotIn('C', gallery)
+            self.assertEqual(gallery.best_match(matrix[0])[0], 'A')
+        self.assertNotIn('A', gallery)
+        self.assertEqual(gallery.best_match(matrix[2])[0], 'C')
+
+    def test_remove_everything(self):
+        gallery = CompanyGallery(['A'], np.ones((1, 128)))
+        self.assertTrue(gallery.remove('A'))
+        self.assertFalse(gallery.remove('A'))
+        self.assertEqual(gallery.best_match(np.ones(128)), (None, 1.0))
+
+
+class EncodingStoreTests(SimpleTestCase):
+
+    def test_append_and_attach(self):
+        matrix, _, _ = synthetic_gallery(100, seed=5)
+        with tempfile.TemporaryDirectory() as directory:
+            store = EncodingStore(directory)
+            self.assertIsNone(store.snapshot())
+            store.write([f'E{i}' for i in range(10)], matrix[:10])
+
+            header, mapped, ids = store.snapshot()
+            gallery = CompanyGallery.from_store(header, mapped, ids, {f'E{i}' for i in range(1, 10)})
+            self.assertEqual(len(gallery), 9)
+            self.assertNotIn('E0', gallery)
+
+            # Grow past the preallocated capacity, including a re-enrolment of E3
+            for i in range(10, 100):
+                store.append(f'E{i}', matrix[i])
+            store.append('E3', matrix[50] + 0.001)
+
+            header, mapped, new_ids = store.snapshot(start=gallery.size)
+            self.assertEqual(header['rows'], 101)
+            self.assertEqual(header['epoch'], gallery.store_epoch)
+            gallery.attach_store_rows(mapped, new_ids)
+
+            self.assertEqual(len(gallery), 99)
+            self.assertEqual(gallery.best_match(matrix[20])[0], 'E20')
+            self.assertIn(gallery.best_match(matrix[50])[0], ('E3', 'E50'))
+            self.assertNotEqual(gallery.best_match(matrix[3])[0], 'E3')
+            self.assertIsInstance(gallery.matrix, np.memmap)
+
+
+class EncodingFileTests(TestCase):
+    """Per-employee encodings are plain .npy; legacy pickle files still load and get converted"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.encodings_dir = Path(tmp.name) / 'face_encodings'
+        settings_override = override_settings(FACE_ENCODINGS_DIR=self.encodings_dir, CACHES=LOCMEM_CACHES)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.engine = FaceEngine()
+        self.encoding = np.random.default_rng(0).normal(0, 0.1, 128)
+
+    def write_pickle(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(self.encoding, f)
+
+    def test_round_trip(self):
+        path = self.encodings_dir / 'c1' / 'EMP001.npy'
+        self.engine.save_encoding(self.encoding, path)
+        self.assertEqual(list(path.parent.iterdir()), [path])
+        self.assertFalse(self.engine.is_legacy_encoding(path))
+        np.testing.assert_array_equal(np.load(path, allow_pickle=False), self.encoding)
+        np.testing.assert_array_equal(self.engine.load_encoding(path), self.encoding)
+        self.assertIsNone(self.engine.load_encoding(path.with_name('missing.npy')))
+
+    def test_legacy_pickle_is_read(self):
+        path = self.encodings_dir / 'c1' / 'EMP001.npy'
+        self.write_pickle(path)
+        self.assertTrue(self.engine.is_legacy_encoding(path))
+        np.testing.assert_array_equal(self.engine.load_encoding(path), self.encoding)
+
+        with open(path, 'wb') as f:
+            pickle.dump(list(self.encoding), f)
+        np.testing.assert_array_equal(self.engine.load_encoding(path), self.encoding)
+
+    def test_malicious_pickle_is_refused(self):
+        path = self.encodings_dir / 'c1' / 'EMP001.npy'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        marker = self.encodings_dir / 'marker'
+        marker.touch()
+
+        class Payload:
+            def __reduce__(self):
+                return os.remove, (str(marker),)
+
+        with open(path, 'wb') as f:
+            pickle.dump(Payload(), f)
+        self.assertIsNone(self.engine.load_encoding(path))
+        self.assertTrue(marker.exists())
+
+    def test_convert_encodings(self):
+        company = Company.objects.create(name='Gatehouse', slug='gatehouse', contact_email='ops@example.com')
+        employee = Employee.objects.create(
+            company=company, employee_id='EMP001', first_name='Dana', last_name='Ray',
+            email='dana@example.com', date_of_joining='2024-01-01',
+            is_face_registered=True, face_encoding_path='face_encodings/old/EMP001.npy'
+        )
+        path = self.encodings_dir / str(company.pk) / 'EMP001.npy'
+        self.write_pickle(path)
+
+        call_command('convert_encodings', '--dry-run', stdout=StringIO())
+        self.assertTrue(self.engine.is_legacy_encoding(path))
+
+        output = StringIO()
+        call_command('convert_encodings', stdout=output)
+        self.assertIn('1 converted, 0 failed, 1 employee paths updated', output.getvalue())
+        self.assertFalse(self.engine.is_legacy_encoding(path))
+        np.testing.assert_array_equal(np.load(path, allow_pickle=False), self.encoding)
+        employee.refresh_from_db()
+        self.assertEqual(employee.face_encoding_path, str(path))
+
+
+class LatestFrameTests(SimpleTestCase):
+    """Streaming backpressure: a busy socket keeps only its newest frame"""
+
+    async def test_stale_frames_are_dropped(self):
+        slot = LatestFrame()
+        for data in (b'1', b'2', b'3'):
+            slot.put(data)
+        self.assertEqual(await slot.get(), b'3')
+        self.assertEqual(slot.dropped, 2)
+
+        slot.put(b'4')
+        self.assertEqual(await slot.get(), b'4')
+        self.assertEqual(slot.dropped, 2)
+
+    async def test_close_wakes_reader(self):
+        slot = LatestFrame()
+        slot.put(b'1')
+        slot.close()
+        self.assertIsNone(await slot.get())
+
+
+class EnrolledEmployeeMixin:
+    """One company with EMP001 enrolled from the sample photo, in a temporary MEDIA_ROOT"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media_root = Path(self.tmp.name)
+        # Punches are written synchronously so the tests can assert on them
+        media_override = override_settings(MEDIA_ROOT=media_root, ATTENDANCE_ASYNC_WRITES=False, CACHES=LOCMEM_CACHES)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        # The shared pipeline manager resolved its directory at import time
+        patcher = mock.patch.object(pipeline.encoding_manager, 'encodings_dir', media_root / 'face_encodings')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pipeline.encoding_manager.encodings_cache.clear()
+        pipeline.attendance_service.recent_punches.clear()
+        
+        self.company = Company.objects.create(name='Gatehouse', slug='gatehouse', contact_email='ops@example.com')
+        self.employee = Employee.objects.create(
+            company=self.company, employee_id='EMP001', first_name='Dana', last_name='Ray',
+            email='dana@example.com', date_of_joining='2024-01-01'
+        )
+        (media_root / 'face_encodings').mkdir()
+        saved, error = pipeline.encoding_manager.save_employee_encoding(self.employee, str(FACE_IMAGE))
+        self.assertTrue(saved, error)
+
+
+class CameraIngestionTests(EnrolledEmployeeMixin, TestCase):
+    """run_cameras pipeline against a local video file as the camera stream"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = Path(self.tmp.name)
+        location = Location.objects.create(company=self.company, name='Main gate', code='MG')
+        self.camera = Camera.objects.create(
+            company=self.company, location=location, name='Gate 1',
+            stream_source=self.write_video(media_root / 'gate.avi')
+        )
+
+    def write_video(self, path, seconds=1.5, fps=10):
+        frame = cv2.imread(str(FACE_IMAGE))
+        height, width = frame.shape[:2]
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+        for _ in range(int(seconds * fps)):
+            writer.write(frame)
+        writer.release()
+        return str(path)
+
+    def test_video_stream_marks_attendance_with_camera(self):
+        ingestor = CameraIngestor([self.camera], sample_fps=4, workers=1)
+        ingestor.run(duration=30)
+        
+        (camera, sampled, dropped, static, processed), = ingestor.stats()
+        self.assertGreater(processed, 0)
+        self.assertEqual(sampled, processed + static + dropped)
+        # The test video is one still image: after the first frame the gate skips detection
+        self.assertEqual(processed, 1)
+        
+        record = AttendanceRecord.objects.get(employee=self.employee)
+        self.assertEqual(record.camera, self.camera)
+        self.assertEqual(record.punch_type, 'IN')
+
+    def test_matching_failure_does_not_stop_ingestion(self):
+        ingestor = CameraIngestor([self.camera], sample_fps=4, workers=1)
+        with mock.patch('recognition.ingest.match_tracked_faces', side_effect=DatabaseError('gone away')) as match:
+            ingestor.run(duration=30)
+        
+        self.assertEqual(match.call_count, 1)
+        (camera, sampled, dropped, static, processed), = ingestor.stats()
+        self.assertEqual(processed, 1)
+        self.assertEqual(sampled, processed + static + dropped)
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+
+class TenantIsolationTests(EnrolledEmployeeMixin, TestCase):
+    """Recognition callers only ever search their own company's gallery"""
+
+    def setUp(self):
+        super().setUp()
+        location = Location.objects.create(company=self.company, name='Main gate', code='MG')
+        self.camera = Camera.objects.create(company=self.company, location=location, name='Gate 1')
+        self.other = Company.objects.create(name='Harbour', slug='harbour', contact_email='ops@harbour.example.com')
+        self.url = reverse('recognize_frame_api')
+        self.frame = FACE_IMAGE.read_bytes()
+
+    def post_frame(self, **headers):
+        return self.client.post(self.url, self.frame, content_type='image/jpeg', **headers)
+
+    def test_unknown_or_inactive_camera_key_is_refused(self):
+        self.assertEqual(self.post_frame(HTTP_X_CAMERA_KEY='not-a-key').status_code, 403)
+        self.camera.status = 'inactive'
+        self.camera.save()
+        self.assertIsNone(camera_for_key(self.camera.api_key))
+        self.assertEqual(self.post_frame(HTTP_X_CAMERA_KEY=self.camera.api_key).status_code, 403)
+        self.assertEqual(self.post_frame().status_code, 403)
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+    def test_camera_key_resolves_to_its_company(self):
+        self.assertTrue(self.camera.api_key)
+        self.assertEqual(camera_for_key(self.camera.api_key), self.camera)
+
+        response = self.post_frame(HTTP_X_CAMERA_KEY=self.camera.api_key)
+        self.assertEqual(response.json()['faces'][0]['id'], 'EMP001')
+        record = AttendanceRecord.objects.get()
+        self.assertEqual((record.employee, record.camera), (self.employee, self.camera))
+
+    def test_other_company_never_matches(self):
+        # A user of another company, and a camera of another company, sending our employee's face
+        self.client.force_login(User.objects.create_user('harbour', password='pw', company=self.other))
+        self.assertEqual(self.post_frame().json()['faces'][0]['id'], 'Unknown')
+
+        location = Location.objects.create(company=self.other, name='Dock', code='DK')
+        camera = Camera.objects.create(company=self.other, location=location, name='Dock 1')
+        self.assertEqual(self.post_frame(HTTP_X_CAMERA_KEY=camera.api_key).json()['faces'][0]['id'], 'Unknown')
+        self.assertFalse(AttendanceRecord.objects.exists())
+        self.assertNotIn('EMP001', pipeline.encoding_manager.get_gallery(self.other.pk))
+
+    def test_session_callers_need_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.create_user('boss', password='pw', company=self.company))
+        batch_url = reverse('recognize_batch_api')
+        self.assertEqual(client.post(self.url, self.frame, content_type='image/jpeg').status_code, 403)
+        self.assertEqual(client.post(batch_url, {'images': [SimpleUploadedFile('a.jpg', self.frame)]}).status_code, 403)
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+        # The live feed page hands out the token
+        client.get(reverse('live_feed'))
+        token = client.cookies['csrftoken'].value
+        response = client.post(self.url, self.frame, content_type='image/jpeg', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.json()['faces'][0]['id'], 'EMP001')
+
+        # Camera keys send no cookies and need no token
+        response = Client(enforce_csrf_checks=True).post(
+            self.url, self.frame, content_type='image/jpeg', HTTP_X_CAMERA_KEY=self.camera.api_key
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class FrameRequestTests(EnrolledEmployeeMixin, TestCase):
+    """Every frame format the recognition endpoint accepts, through the view"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('boss', password='pw', company=self.company))
+        self.url = reverse('recognize_frame_api')
+        self.frame = FACE_IMAGE.read_bytes()
+
+    def assertRecognized(self, response):
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status'], 'success', body)
+        self.assertEqual([face['id'] for face in body['faces']], ['EMP001'])
+
+    def test_raw_jpeg_body(self):
+        self.assertRecognized(self.client.post(self.url, self.frame, content_type='image/jpeg'))
+
+    def test_multipart_upload(self):
+        with open(FACE_IMAGE, 'rb') as image:
+            self.assertRecognized(self.client.post(self.url, {'image': image}))
+        self.assertEqual(self.client.post(self.url, {'other': 'x'}).json()['message'], 'No image data')
+
+    def test_legacy_json_data_url(self):
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(self.frame).decode()
+        self.assertRecognized(self.client.post(self.url, {'image': data_url}, content_type='application/json'))
+
+    def test_oversized_frame(self):
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=len(self.frame) - 1):
+            response = self.client.post(self.url, self.frame, content_type='image/jpeg')
+            self.assertEqual(response.status_code, 413)
+            with open(FACE_IMAGE, 'rb') as image:
+                self.assertEqual(self.client.post(self.url, {'image': image}).status_code, 413)
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+
+class BatchRecognitionTests(EnrolledEmployeeMixin, TestCase):
+    """Batch endpoint: frames and crops matched together, one result per item in input order"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('boss', password='pw', company=self.company))
+        self.url = reverse('recognize_batch_api')
+        self.face = FACE_IMAGE.read_bytes()
+        image = cv2.imread(str(FACE_IMAGE))
+        (top, right, bottom, left), = FaceEngine().detect_faces(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        self.crop = cv2.imencode('.jpg', image[top:bottom, left:right])[1].tobytes()
+        self.blank = cv2.imencode('.png', np.full((200, 200, 3), 255, dtype=np.uint8))[1].tobytes()
+
+    def upload(self, name, data):
+        return SimpleUploadedFile(name, data, content_type='image/jpeg')
+
+    def summary(self, results):
+        return [
+            [face['id'] for face in result['faces']] if result['status'] == 'success' else result['status']
+            for result in results
+        ]
+
+    def test_mixed_images_and_crops(self):
+        response = self.client.post(self.url, {
+            'images': [self.upload('a.jpg', self.face), self.upload('b.png', self.blank),
+                       self.upload('c.jpg', b'not an image'), self.upload('d.jpg', self.face)],
+            'crops': [self.upload('e.jpg', b'not an image'), self.upload('f.jpg', self.crop)],
+        })
+        body = response.json()
+        self.assertEqual(body['status'], 'success')
+        self.assertEqual(self.summary(body['images']), [['EMP001'], [], 'error', ['EMP001']])
+        self.assertEqual(self.summary(body['crops']), ['error', ['EMP001']])
+        self.assertEqual(body['images'][2], {'status': 'error', 'message': 'No image data'})
+        # Several sightings of one employee in a batch are still one punch
+        self.assertEqual(AttendanceRecord.objects.filter(employee=self.employee).count(), 1)
+
+    def test_json_data_urls(self):
+        def data_url(data):
+            return 'data:image/jpeg;base64,' + base64.b64encode(data).decode()
+
+        response = self.client.post(self.url, {
+            'images': [data_url(self.blank), data_url(self.face)], 'crops': [data_url(self.crop)]
+        }, content_type='application/json')
+        body = response.json()
+        self.assertEqual(self.summary(body['images']), [[], ['EMP001']])
+        self.assertEqual(self.summary(body['crops']), [['EMP001']])
+
+    def test_malformed_data_url_is_a_per_item_error(self):
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(self.face).decode()
+        response = self.client.post(self.url, {
+            'images': ['no comma here', data_url, 42, 'data:image/jpeg;base64,abc'],
+        }, content_type='application/json')
+        body = response.json()
+        self.assertEqual(body['status'], 'success')
+        self.assertEqual(self.summary(body['images']), ['error', ['EMP001'], 'error', 'error'])
+
+    def test_oversized_upload(self):
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=len(self.face) - 1):
+            response = self.client.post(self.url, {
+                'crops': [self.upload('a.jpg', self.crop)],
+                'images': [self.upload('b.jpg', self.face)],
+            })
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['message'], 'Image too large')
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+    @override_settings(FACE_BATCH_MAX_ITEMS=2)
+    def test_too_many_items(self):
+        response = self.client.post(self.url, {
+            'images': [self.upload('a.jpg', self.face), self.upload('b.jpg', self.face)],
+            'crops': [self.upload('c.jpg', self.crop)],
+        })
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+
+class FaceTrackerTests(SimpleTestCase):
+
+    def result(self, employee_id):
+        return {'id': employee_id, 'name': employee_id, 'confidence': 90.0, 'box': {}}
+
+    def test_iou(self):
+        self.assertEqual(box_iou((0, 10, 10, 0), (0, 10, 10, 0)), 1.0)
+        self.assertEqual(box_iou((0, 10, 10, 0), (20, 30, 30, 20)), 0.0)
+        self.assertAlmostEqual(box_iou((0, 10, 10, 0), (0, 15, 10, 5)), 50 / 150)
+
+    def test_identified_track_is_reused_until_reverify(self):
+        tracker = FaceTracker(iou_threshold=0.3, reverify_seconds=3.0, max_missed=1)
+        first = [(100, 200, 200, 100)]
+        self.assertEqual(tracker.reusable(first, now=0.0), [None])
+        tracker.update(first, [self.result('EMP001')], [True], now=0.0)
+
+        # Same person moved a little, plus a newcomer: only the newcomer is encoded
+        second = [(105, 205, 205, 105), (100, 400, 200, 300)]
+        reused = tracker.reusable(second, now=1.0)
+        self.assertIs(reused[0], tracker.tracks[0])
+        self.assertIsNone(reused[1])
+        self.assertEqual(reused[0].result_at(second[0])['box']['top'], 105)
+        tracker.update(second, [reused[0].result_at(second[0]), self.result('Unknown')], [False, True], now=1.0)
+
+        # Unknown faces are always retried, identified ones once reverify_seconds have passed
+        self.assertEqual(tracker.reusable(second, now=2.0)[1], None)
+        self.assertIsNotNone(tracker.reusable(second, now=2.0)[0])
+        self.assertIsNone(tracker.reusable(second, now=3.5)[0])
+
+    def test_lost_tracks_expire(self):
+        tracker = FaceTracker(max_missed=1)
+        tracker.update([(0, 10, 10, 0)], [self.result('EMP001')], [True], now=0.0)
+        tracker.update([], [], [], now=1.0)
+        self.assertEqual(len(tracker.tracks), 1)
+        tracker.update([], [], [], now=2.0)
+        self.assertEqual(tracker.tracks, [])
+
+
+class TrackedRecognitionTests(EnrolledEmployeeMixin, TestCase):
+
+    def test_tracked_face_is_encoded_once(self):
+        frame = cv2.imread(str(FACE_IMAGE))
+        tracker = FaceTracker(reverify_seconds=60)
+        with mock.patch.object(
+            ml().face_recognition, 'face_encodings', wraps=ml().face_recognition.face_encodings
+        ) as face_encodings:
+            results = [pipeline.recognize_image(frame, self.company, tracker=tracker) for _ in range(3)]
+        
+        encoded_faces = sum(len(call.args[1]) for call in face_encodings.call_args_list)
+        self.assertEqual(encoded_faces, 1)
+        self.assertEqual([faces[0]['id'] for faces in results], ['EMP001'] * 3)
+        self.assertTrue(results[2][0]['tracked'])
+
+    def test_jobs_return_punches_to_the_caller(self):
+        data = FACE_IMAGE.read_bytes()
+        results, tracker, gate, punches = pipeline.recognize_frame_data(data, self.company)
+        self.assertEqual(results[0]['id'], 'EMP001')
+        # Nothing is written where the job ran (an executor worker)
+        self.assertFalse(AttendanceRecord.objects.exists())
+        self.assertEqual([punch['employee'] for punch in punches], [self.employee])
+
+        pipeline.submit_punches(punches)
+        self.assertEqual(AttendanceRecord.objects.get().employee, self.employee)
+
+
+class GalleryInvalidationTests(EnrolledEmployeeMixin, TestCase):
+    """Workers' cached galleries follow GalleryVersion: journal replay, or a reload on a gap"""
+
+    def setUp(self):
+        super().setUp()
+        self.manager = pipeline.encoding_manager
+        patcher = mock.patch.object(self.manager, 'check_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gallery = self.manager.get_gallery(self.company.pk)
+        self.assertIn('EMP001', self.gallery)
+
+    def reloads(self):
+        return mock.patch.object(self.manager, 'refresh_cache', wraps=self.manager.refresh_cache)
+
+    def test_generation_change_reloads(self):
+        with self.reloads() as refresh_cache:
+            self.manager.get_gallery(self.company.pk)
+            refresh_cache.assert_not_called()
+            GalleryVersion.bump(self.company.pk)
+            self.manager.get_gallery(self.company.pk)
+        refresh_cache.assert_called_once_with(company_id=self.company.pk)
+
+    def test_journal_replay_removes_and_upserts(self):
+        with self.reloads() as refresh_cache:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.employee.status = 'inactive'
+                self.employee.save()
+            self.assertNotIn('EMP001', self.manager.get_gallery(self.company.pk))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.employee.status = 'active'
+                self.employee.save()
+            gallery = self.manager.get_gallery(self.company.pk)
+        refresh_cache.assert_not_called()
+        self.assertIs(gallery, self.gallery)
+        self.assertIn('EMP001', gallery)
+
+    def test_store_backed_gallery_attaches_appended_row(self):
+        self.assertIsNotNone(self.gallery.store_epoch)
+        size = self.gallery.size
+        newcomer = Employee.objects.create(
+            company=self.company, employee_id='EMP002', first_name='Lee', last_name='Moss',
+            email='lee@example.com', date_of_joining='2024-02-01'
+        )
+        with self.reloads() as refresh_cache:
+            with self.captureOnCommitCallbacks(execute=True):
+                saved, error = self.manager.save_employee_encoding(newcomer, str(FACE_IMAGE))
+            self.assertTrue(saved, error)
+            gallery = self.manager.get_gallery(self.company.pk)
+        refresh_cache.assert_not_called()
+        self.assertIn('EMP002', gallery)
+        self.assertEqual(gallery.size, size + 1)
+        self.assertIsInstance(gallery.matrix, np.memmap)
+
+    def test_journal_gap_reloads(self):
+        with self.reloads() as refresh_cache:
+            # Pruned journal: only the newest entry is kept
+            with mock.patch('recognition.models.GALLERY_EVENT_RETENTION', 1):
+                GalleryVersion.record_change(self.company.pk, 'EMP001')
+                GalleryVersion.record_change(self.company.pk, 'EMP001')
+            self.assertEqual(GalleryEvent.objects.filter(company=self.company).count(), 1)
+            self.manager.get_gallery(self.company.pk)
+        refresh_cache.assert_called_once_with(company_id=self.company.pk)
+        self.assertEqual(self.manager.generations[self.company.pk], GalleryVersion.current(self.company.pk))
+
+    def test_only_gallery_fields_are_journaled(self):
+        generation = GalleryVersion.current(self.company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.phone = '555-0100'
+            self.employee.save()
+            self.employee.save(update_fields=['first_name'])
+        self.assertEqual(GalleryVersion.current(self.company.pk), generation)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.status = 'inactive'
+            self.employee.save()
+        self.assertEqual(GalleryVersion.current(self.company.pk), generation + 1)
+
+    def test_company_deletion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.delete()
+        self.assertFalse(GalleryVersion.objects.filter(company_id=self.company.pk).exists())
+        # A change journaled just before the company went away is dropped
+        self.assertIsNone(GalleryVersion.record_change(self.company.pk, 'EMP001'))
+
+
+class FrameGateTests(SimpleTestCase):
+
+    def test_static_scene_is_skipped(self):
+        rng = np.random.default_rng(0)
+        scene = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+        gate = FrameGate(pixel_threshold=20, min_changed=0.01, max_skip_seconds=10)
+        self.assertTrue(gate.changed(scene, now=0.0))
+
+        # Sensor noise alone doesn't count as change
+        noisy = np.clip(scene.astype(int) + rng.integers(-3, 4, scene.shape), 0, 255).astype(np.uint8)
+        self.assertFalse(gate.changed(noisy, now=1.0))
+
+        # Someone steps into a corner of the frame
+        visitor = scene.copy()
+        visitor[:120, :100] = 255
+        self.assertTrue(gate.changed(visitor, now=2.0))
+        self.assertFalse(gate.changed(visitor, now=3.0))
+
+        # A static scene is still re-processed now and then
+        self.assertTrue(gate.changed(visitor, now=13.0))
+        self.assertEqual(gate.skipped, 2)
+
+
+class DetectionScaleTests(SimpleTestCase):
+    """Downscaled detection must return full-resolution boxes that encode like full-res detection"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.engine = FaceEngine()
+        cls.image = cv2.cvtColor(cv2.imread(str(FACE_IMAGE)), cv2.COLOR_BGR2RGB)
+        cls.full_box, = cls.engine.detect_faces(cls.image)
+        cls.reference, = ml().face_recognition.face_encodings(cls.image, [cls.full_box])
+
+    def test_boxes_are_mapped_back(self):
+        for scale in (0.5, 0.75):
+            box, = self.engine.detect_faces(self.image, scale=scale)
+            self.assertGreater(box_iou(box, self.full_box), 0.6)
+            encoding, = ml().face_recognition.face_encodings(self.image, [box])
+            self.assertLess(np.linalg.norm(encoding - self.reference), 0.1)
+
+    def test_large_frame(self):
+        height, width = self.image.shape[:2]
+        large = cv2.resize(self.image, (width * 2, height * 2))
+        box, = self.engine.detect_faces(large, scale=0.25)
+        doubled = tuple(2 * value for value in self.full_box)
+        self.assertGreater(box_iou(box, doubled), 0.6)
+        self.assertTrue(0 <= box[0] < box[2] <= height * 2 and 0 <= box[3] < box[1] <= width * 2)
+
+    def test_upsample_finds_small_faces(self):
+        height, width = self.image.shape[:2]
+        small = cv2.resize(self.image, (width // 4, height // 4), interpolation=cv2.INTER_AREA)
+        self.assertEqual(self.engine.detect_faces(small, upsample=0), [])
+        self.assertEqual(len(self.engine.detect_faces(small, upsample=1)), 1)
+
+    @override_settings(FACE_DETECTION_SCALE=0.5, FACE_DETECTION_UPSAMPLE=2)
+    def test_camera_options_fall_back_to_settings(self):
+        self.assertEqual(pipeline.detection_options(), (0.5, 2))
+        self.assertEqual(Camera(detection_scale=0.25).get_detection_options(), (0.25, 2))
+        self.assertEqual(Camera(detection_upsample=0).get_detection_options(), (0.5, 0))
+
+
+class RecognitionExecutorTests(SimpleTestCase):
+    """Bounded process-pool executor: inline mode, load shedding, timeouts"""
+
+    def test_inline_without_workers(self):
+        executor = RecognitionExecutor(workers=0)
+        self.assertEqual(executor.call(sum, [1, 2]), 3)
+
+    def test_busy_and_timeout(self):
+        executor = RecognitionExecutor(workers=1, max_pending=1, timeout=60)
+        self.addCleanup(executor.shutdown)
+        # First job waits for the worker to warm up
+        self.assertEqual(executor.call(sum, [1, 2]), 3)
+
+        executor.timeout = 0.5
+        # The slow job times out but keeps its slot until the worker is done with it
+        with self.assertRaises(RecognitionTimeout):
+            executor.call(time.sleep, 3)
+        with self.assertRaises(RecognitionBusy):
+            executor.call(sum, [1, 2])
+
+
+class LazyImportTests(SimpleTestCase):
+    """Web processes that never recognize a face don't load dlib"""
+
+    def test_urlconf_does_not_load_ml_stack(self):
+        code = (
+            "import django; django.setup(); "
+            "from importlib import import_module; from django.conf import settings; "
+            "import_module(settings.ROOT_URLCONF); "
+            "from recognition.ml import is_loaded; import sys; "
+            "print(is_loaded(), 'face_recognition' in sys.modules, 'cv2' in sys.modules)"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        output = subprocess.run(
+            [sys.executable, '-c', code], env=env, cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(output.split(), ['False', 'False', 'False'])
+
+
+class ReadinessTests(EnrolledEmployeeMixin, TestCase):
+    """The readiness endpoint reports 503 until the worker has warmed up"""
+
+    def test_ready_after_warm_up(self):
+        url = reverse('recognition_ready')
+        with mock.patch.object(pipeline.encoding_manager, 'loaded_at', None):
+            self.assertEqual(self.client.get(url).status_code, 503)
+            pipeline.warm_up()
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ready')
+        self.assertIn(self.company.id, pipeline.encoding_manager.encodings_cache)
+
+
+class BulkEnrolmentTests(TestCase):
+    """CSV + zip import: per-row outcomes, one gallery bump per run, resumable"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        media_root = self.tmp / 'media'
+        media_override = override_settings(
+            MEDIA_ROOT=media_root, FACE_ENCODINGS_DIR=media_root / 'face_encodings', FACE_IMAGES_DIR=media_root / 'faces',
+            CACHES=LOCMEM_CACHES
+        )
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.company = Company.objects.create(name='Gatehouse', slug='gatehouse', contact_email='ops@example.com')
+        Department.objects.create(company=self.company, name='Assembly', code='ASM')
+        blank = cv2.imencode('.png', np.full((200, 200, 3), 255, dtype=np.uint8))[1].tobytes()
+        self.images = self.tmp / 'faces.zip'
+        with zipfile.ZipFile(self.images, 'w') as zf:
+            zf.write(FACE_IMAGE, 'photos/emp001.jpeg')
+            zf.writestr('EMP002.png', blank)
+        self.csv = self.tmp / 'employees.csv'
+        self.csv.write_text(
+            'employee_id,first_name,last_name,email,date_of_joining,department\n'
+            'EMP001,Dana,Ray,dana@example.com,2024-01-01,ASM\n'
+            'EMP002,Sam,Lee,sam@example.com,2024-01-01,\n'
+            'EMP003,Lou,Kim,lou@example.com,2024-01-01,\n'
+            'emp004,Al,Bo,not-an-email,2024-01-01,\n'
+            'EMP001,Dana,Ray,dana@example.com,2024-01-01,ASM\n'
+        )
+
+    def store_ids(self):
+        header, matrix, ids = EncodingStore(Path(settings.FACE_ENCODINGS_DIR) / str(self.company.pk)).snapshot()
+        return ids
+
+    def test_import_and_resume(self):
+        results = BulkEnrolment(self.company, self.images, workers=0, batch_size=2).run(read_rows(self.csv))
+        self.assertEqual([result['status'] for result in results], ['enrolled', 'failed', 'failed', 'failed', 'failed'])
+        self.assertIn('No face detected', results[1]['message'])
+        self.assertIn('not found', results[2]['message'])
+        self.assertIn('email', results[3]['message'])
+        self.assertIn('Duplicate', results[4]['message'])
+
+        # Rows without a usable face still create the employee
+        self.assertEqual(sorted(Employee.objects.values_list('employee_id', flat=True)), ['EMP001', 'EMP002', 'EMP003'])
+        dana = Employee.objects.get(employee_id='EMP001')
+        self.assertTrue(dana.is_face_registered)
+        self.assertEqual(dana.department.code, 'ASM')
+        self.assertTrue(Path(dana.face_image.path).exists())
+        # One store rewrite: a single generation bump, no per-employee journal entries
+        self.assertEqual(GalleryVersion.current(self.company.pk), 1)
+        self.assertFalse(GalleryEvent.objects.exists())
+        self.assertEqual(self.store_ids(), ['EMP001'])
+
+        # The missing photo is added and the same import re-run, through the process pool
+        with zipfile.ZipFile(self.images, 'a') as zf:
+            zf.write(FACE_IMAGE, 'EMP003.jpeg')
+        report = self.tmp / 'report.csv'
+        call_command(
+            'bulk_enrol', str(self.csv), str(self.images), company='gatehouse', workers=1, report=str(report),
+            stdout=StringIO()
+        )
+        with open(report) as f:
+            statuses = [row['status'] for row in csv.DictReader(f)]
+        self.assertEqual(statuses, ['skipped', 'failed', 'enrolled', 'failed', 'failed'])
+        self.assertEqual(GalleryVersion.current(self.company.pk), 2)
+        self.assertEqual(sorted(self.store_ids()), ['EMP001', 'EMP003'])
+
+    def test_admin_import_runs_as_a_process(self):
+        uploads = self.tmp / 'imports'
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+        with override_settings(FACE_ENROLMENT_UPLOAD_DIR=uploads), mock.patch('recognition.bulk_enrolment.subprocess.Popen') as popen:
+            with open(self.csv, 'rb') as employees_csv, open(self.images, 'rb') as images_zip:
+                response = self.client.post(reverse('admin:employees_employee_bulk_enrol'), {
+                    'company': self.company.pk, 'employees_csv': employees_csv, 'images_zip': images_zip
+                })
+        self.assertEqual(response.status_code, 302)
+        job_dir, = uploads.iterdir()
+        command = popen.call_args.args[0]
+        self.assertEqual(command[2:5], ['bulk_enrol', str(job_dir / 'employees.csv'), str(job_dir / 'faces.zip')])
+        self.assertIn('--status', command)
+
+        report_url = reverse('admin:employees_employee_bulk_enrol_report', args=[job_dir.name])
+        with override_settings(FACE_ENROLMENT_UPLOAD_DIR=uploads):
+            response = self.client.get(report_url, follow=True)
+            self.assertContains(response, 'still running (Starting)')
+
+            # The process died: no heartbeat for longer than JOB_ABANDONED_AFTER
+            with mock.patch('recognition.bulk_enrolment.time.time', return_value=time.time() + 120):
+                response = self.client.get(report_url, follow=True)
+            self.assertContains(response, 'stopped without a report')
+
+            # What the process would have run
+            call_command(
+                'bulk_enrol', *command[3:5], company=str(self.company.pk), workers=0,
+                report=str(job_dir / 'report.csv'), status=str(job_dir / 'status.json'), stdout=StringIO()
+            )
+            self.assertEqual(JobStatus.read(job_dir / 'status.json')['state'], 'done')
+            response = self.client.get(report_url)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn(b'enrolled', b''.join(response.streaming_content))
@@ -0,0 +1,148 @@
+"""
+Face Tracking
+Per-stream tracker that carries identities across consecutive frames, so a
+face that was already recognized is not re-encoded every frame.
+
+Boxes of a new frame are matched to the previous frame's tracks by IoU
+(greedy, best overlap first). A detection continuing an identified track
+reuses that identity until the track is due for re-verification
+(`reverify_seconds`); new tracks and unknown faces are always encoded.
+
+Trackers are plain picklable objects so camera workers can ship them to the
+recognition process pool with each frame.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .motion import FrameGate
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    intersection = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return intersection / float(area_a + area_b - intersection)
+
+
+class Track:
+    """One face followed across frames"""
+
+    def __init__(self, box, result, now):
+        self.box = box
+        self.result = result
+        self.verified_at = now
+        self.missed = 0
+
+    @property
+    def identified(self):
+        return self.result is not None and self.result['id'] != 'Unknown'
+
+    def result_at(self, box):
+        """Last recognition result, moved to the box of the current frame"""
+        top, right, bottom, left = box
+        result = dict(self.result)
+        result['box'] = {'top': top, 'right': right, 'bottom': bottom, 'left': left}
+        result['tracked'] = True
+        return result
+
+
+class FaceTracker:
+    """IoU tracker for one stream (websocket, camera, HTTP client)"""
+
+    def __init__(self, iou_threshold=None, reverify_seconds=None, max_missed=None):
+        self.iou_threshold = iou_threshold if iou_threshold is not None else getattr(settings, 'FACE_TRACK_IOU_THRESHOLD', 0.3)
+        self.reverify_seconds = reverify_seconds if reverify_seconds is not None else getattr(settings, 'FACE_TRACK_REVERIFY_SECONDS', 3.0)
+        self.max_missed = max_missed if max_missed is not None else getattr(settings, 'FACE_TRACK_MAX_MISSED', 2)
+        self.tracks = []
+
+    def match(self, face_locations):
+        """The track each detected box continues (or None), in detection order"""
+        pairs = []
+        for i, box in enumerate(face_locations):
+            for j, track in enumerate(self.tracks):
+                iou = box_iou(box, track.box)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, i, j))
+        pairs.sort(reverse=True)
+
+        matched = [None] * len(face_locations)
+        used_tracks = set()
+        for iou, i, j in pairs:
+            if matched[i] is None and j not in used_tracks:
+                matched[i] = self.tracks[j]
+                used_tracks.add(j)
+        return matched
+
+    def reusable(self, face_locations, now):
+        """
+        Per detected box: the identified track whose result can be reused,
+        or None when the face has to be encoded (new, unknown or due for re-verification).
+        """
+        return [
+            track if track and track.identified and now - track.verified_at < self.reverify_seconds else None
+            for track in self.match(face_locations)
+        ]
+
+    def update(self, face_locations, results, encoded, now):
+        """
+        Advance the tracks to this frame.
+        `encoded[i]` is True when results[i] came from a fresh encoding.
+        """
+        matched = self.match(face_locations)
+        tracks = []
+        for box, result, was_encoded, track in zip(face_locations, results, encoded, matched):
+            if track is None:
+                track = Track(box, result, now)
+            else:
+                track.box = box
+                track.missed = 0
+                if was_encoded:
+                    track.result = result
+                    track.verified_at = now
+            tracks.append(track)
+
+        # Faces not seen this frame survive a few frames (detector misses)
+        continuing = set(map(id, tracks))
+        for track in self.tracks:
+            if id(track) not in continuing:
+                track.missed += 1
+                if track.missed <= self.max_missed:
+                    tracks.append(track)
+        self.tracks = tracks
+
+
+class StreamStatePool:
+    """
+    Per-client stream state (FaceTracker + FrameGate) of request/response
+    clients (HTTP recognition API), keyed by camera or session. checkout()
+    removes the state, so two concurrent requests of one client never share
+    it; the second just starts fresh.
+    """
+
+    def __init__(self, max_clients=1024, idle_seconds=60.0):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def checkout(self, key):
+        """(tracker, gate) of a client"""
+        with self._lock:
+            entry = self._states.pop(key, None)
+        if entry is None or time.monotonic() - entry[2] > self.idle_seconds:
+            return FaceTracker(), FrameGate()
+        return entry[0], entry[1]
+
+    def checkin(self, key, tracker, gate):
+        with self._lock:
+            self._states[key] = (tracker, gate, time.monotonic())
+            while len(self._states) > self.max_clients:
+                self._states.popitem(last=False)
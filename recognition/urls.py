@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('live/', views.live_feed_view, name='live_feed'),
     path('api/recognize/', views.recognize_frame, name='recognize_frame_api'),
+    path('api/recognize/batch/', views.recognize_batch_frames, name='recognize_batch_api'),
+    path('ready/', views.readiness, name='recognition_ready'),
 ]
\ No newline at end of file
@@ -3,36 +3,48 @@ Face Recognition Views - Hybrid Client/Server Architecture
 """
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
 from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
 from django.views.decorators.csrf import csrf_exempt
-import cv2
-import face_recognition
-import numpy as np
-import json
-import base64
-import time
-from .face_engine import FaceEngine
-from .encoding_manager import EncodingManager
-from employees.models import Employee
-from attendance.services import AttendanceService
+from .executor import RecognitionBusy, RecognitionTimeout, recognition_executor
+from .pipeline import (
+    camera_for_key, is_warm, read_batch_request, read_frame_request,
+    recognize_batch_data, recognize_frame_data, submit_punches
+)
+from .tracking import StreamStatePool
 
-# Global instances
-face_engine = FaceEngine()
-encoding_manager = EncodingManager()
-attendance_service = AttendanceService()
+# Tracker + frame gate of each polling client (per camera key / browser session)
+http_streams = StreamStatePool()
 
-# Cache
-known_encodings = {}
-last_reload_ts = 0.0
+def resolve_caller(request):
+    """
+    Work out which tenant a recognition request belongs to.
+    Kiosks/IP cameras authenticate with the X-Camera-Key header,
+    browser sessions use the logged-in user's company.
+    
+    Returns (company, camera) - both None if the caller is unknown.
+    """
+    api_key = request.headers.get('X-Camera-Key')
+    if api_key:
+        camera = camera_for_key(api_key)
+        if camera:
+            return camera.company, camera
+        return None, None
+    
+    if request.user.is_authenticated and request.user.company_id:
+        return request.user.company, None
+    
+    return None, None
 
-def load_encodings(force=False):
-    global known_encodings, last_reload_ts
-    if force or not known_encodings:
-        print("Reloading encodings...")
-        known_encodings = encoding_manager.refresh_cache()
-        last_reload_ts = time.time()
-        print(f"Loaded encodings for {len(known_encodings)} companies.")
-    return len(known_encodings)
+def session_csrf_failure(request):
+    """
+    The recognition APIs are csrf_exempt for X-Camera-Key callers, which send
+    no cookies. Browser sessions still get the normal CSRF check: returns its
+    403 response, or None if the request passes.
+    """
+    return CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
 
 @login_required
 def live_feed_view(request):
@@ -42,99 +54,117 @@ def live_feed_view(request):
 @csrf_exempt
 def recognize_frame(request):
     """
-    API that accepts a Base64 image, detects faces, and returns JSON results.
+    API that accepts a frame, detects faces, and returns JSON results.
+    The frame can be a raw image body (Content-Type: image/jpeg), a multipart
+    upload ("image" field) or the legacy JSON {"image": <base64 data URL>}.
     """
     if request.method == 'POST':
+        # Only search the caller's own company gallery
+        company, camera = resolve_caller(request)
+        if company is None:
+            return JsonResponse({'status': 'error', 'message': 'Unauthorized'}, status=403)
+        if camera is None:
+            csrf_failure = session_csrf_failure(request)
+            if csrf_failure:
+                return csrf_failure
+        
         try:
-            # 1. Parse Data
-            data = json.loads(request.body)
-            image_data = data.get('image')
+            # 1. Read Frame (raw image body, multipart upload, or legacy base64 JSON)
+            data = read_frame_request(request)
             
-            if not image_data:
+            if not data:
                 return JsonResponse({'status': 'error', 'message': 'No image data'})
-
-            # 2. Decode Base64 to OpenCV Frame
-            # Browser sends Base64 JPEG. OpenCV reads this as BGR.
-            header, encoded = image_data.split(",", 1)
-            nparr = np.frombuffer(base64.b64decode(encoded), np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             
-            # 3. Refresh Encodings if needed
-            global last_reload_ts
-            if time.time() - last_reload_ts > 60:
-                load_encodings(force=True)
-            elif not known_encodings:
-                load_encodings()
-
-            # 4. Color Space Conversion (CRITICAL)
-            # face_recognition library EXPECTS RGB. OpenCV gives BGR.
-            # If this is wrong, a known face will look "blue" to the AI and won't match "skin" tones.
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # 2. Decode, detect, encode and match against the company gallery, in the
+            # recognition executor (static frames and faces this client's tracker
+            # already identified are skipped)
+            client_key = f'camera:{camera.pk}' if camera else f'session:{request.session.session_key}'
+            tracker, gate = http_streams.checkout(client_key)
+            results, tracker, gate, punches = recognition_executor.call(
+                recognize_frame_data, data, company, camera, tracker, gate
+            )
+            http_streams.checkin(client_key, tracker, gate)
+            # Marked here, not in the executor worker (one attendance writer per web process)
+            submit_punches(punches)
             
-            # 5. Detect Faces
-            # Using 'hog' model is faster for CPU. If accuracy is poor, remove model="hog" to use default.
-            face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-            results = []
-
-            for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                name = "Unknown"
-                confidence = 0.0
-                
-                # Match Face
-                if known_encodings:
-                    # Flatten cache for checking (In production, filter by User Company!)
-                    # For now, we search ALL loaded faces to debug why it's not matching.
-                    all_encodings = {}
-                    for company_id, emps in known_encodings.items():
-                        all_encodings.update(emps)
-                    
-                    if all_encodings:
-                        # We use a slightly looser tolerance (0.6 is default, 0.5 is strict)
-                        # We pass tolerance=0.6 explicitly to FaceEngine if possible, or rely on its internal default.
-                        employee_id, confidence, distance = face_engine.recognize_face(
-                            face_encoding,
-                            all_encodings
-                        )
-                        
-                        # DEBUG PRINT: Watch your terminal to see the distance score!
-                        # Distance < 0.6 is a match. Lower is better.
-                        print(f"Face detected. Best match: {employee_id}, Distance: {distance:.4f}")
-
-                        if employee_id:
-                            name = employee_id
-                            
-                            # Mark Attendance
-                            if confidence >= attendance_service.confidence_threshold:
-                                try:
-                                    employee = Employee.objects.filter(employee_id=employee_id).first()
-                                    if employee:
-                                        attendance_service.mark_attendance(
-                                            employee=employee,
-                                            confidence_score=confidence,
-                                            face_distance=distance
-                                        )
-                                except Exception as e:
-                                    print(f"Attendance Error: {e}")
-
-                results.append({
-                    'id': name,
-                    'name': name,
-                    'confidence': round(confidence, 1),
-                    'box': {
-                        'top': top,
-                        'right': right,
-                        'bottom': bottom,
-                        'left': left
-                    }
-                })
+            if results is None:
+                return JsonResponse({'status': 'error', 'message': 'No image data'})
 
             return JsonResponse({'status': 'success', 'faces': results})
 
+        except RequestDataTooBig:
+            return JsonResponse({'status': 'error', 'message': 'Image too large'}, status=413)
+        except RecognitionBusy:
+            return JsonResponse({'status': 'error', 'message': 'Recognition busy, retry shortly'}, status=503)
+        except RecognitionTimeout:
+            return JsonResponse({'status': 'error', 'message': 'Recognition timed out'}, status=504)
         except Exception as e:
             import traceback
             traceback.print_exc()
             return JsonResponse({'status': 'error', 'message': str(e)})
 
-    return JsonResponse({'status': 'error', 'message': 'Invalid method'})
\ No newline at end of file
+    return JsonResponse({'status': 'error', 'message': 'Invalid method'})
+
+@csrf_exempt
+def recognize_batch_frames(request):
+    """
+    Batch API for burst cameras and offline re-processing.
+    Accepts many full frames ("images") and/or pre-cropped faces ("crops"),
+    as multipart files or JSON lists of base64 data URLs. All faces are
+    matched against the gallery in one pass; results keep the input order.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid method'})
+    
+    company, camera = resolve_caller(request)
+    if company is None:
+        return JsonResponse({'status': 'error', 'message': 'Unauthorized'}, status=403)
+    if camera is None:
+        csrf_failure = session_csrf_failure(request)
+        if csrf_failure:
+            return csrf_failure
+    
+    try:
+        frames, crops = read_batch_request(request)
+        if not frames and not crops:
+            return JsonResponse({'status': 'error', 'message': 'No image data'})
+        
+        max_items = getattr(settings, 'FACE_BATCH_MAX_ITEMS', 32)
+        if len(frames) + len(crops) > max_items:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Too many images (max {max_items} per request)'
+            }, status=413)
+        
+        frame_results, crop_results, punches = recognition_executor.call(
+            recognize_batch_data, frames, crops, company, camera
+        )
+        submit_punches(punches)
+        return JsonResponse({'status': 'success', 'images': frame_results, 'crops': crop_results})
+    
+    except RequestDataTooBig:
+        return JsonResponse({'status': 'error', 'message': 'Image too large'}, status=413)
+    except RecognitionBusy:
+        return JsonResponse({'status': 'error', 'message': 'Recognition busy, retry shortly'}, status=503)
+    except RecognitionTimeout:
+        return JsonResponse({'status': 'error', 'message': 'Recognition timed out'}, status=504)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+def readiness(request):
+    """
+    Readiness probe for load balancers / orchestrators: 200 once this worker
+    can recognize without loading models or galleries first, 503 before.
+    Warm-up happens in the gunicorn hooks (gunicorn_config.py).
+    """
+    if recognition_executor.enabled:
+        # Recognition runs in the executor's workers, not in this process
+        ready = recognition_executor.ready
+    else:
+        ready = is_warm()
+    return JsonResponse({
+        'status': 'ready' if ready else 'loading',
+        'executor_workers': recognition_executor.workers,
+    }, status=200 if ready else 503)